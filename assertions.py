@@ -1,6 +1,8 @@
 import re
 from cassandra import InvalidRequest, Unavailable, ConsistencyLevel, WriteTimeout, ReadTimeout
 from cassandra.query import SimpleStatement
+from dtest import PERF_BASELINES, debug
+from perfbaseline import BaselineStore, mann_whitney_less, median
 from tools import rows_to_list
 
 
@@ -62,6 +64,54 @@ def assert_almost_equal(*args, **kwargs):
     assert vmin > vmax * (1.0 - error) or vmin == vmax, "values not within %.2f%% of the max: %s" % (error * 100, args)
 
 
+def assert_no_regression(metric, baseline_key, tolerance=0.1, trials=5, higher_is_better=True,
+                         field='value', min_baseline=5, alpha=0.05, store=None):
+    """
+    @param metric a function running one trial and returning the measured value
+    @param baseline_key the key of the baseline samples, see perfbaseline.baseline_key
+    @param tolerance the fraction by which the median may get worse before it is a regression
+    @param trials the number of times metric is run
+    @param higher_is_better whether greater values are better, as for throughputs, or worse, as for latencies
+    @param field the name of the value in the baseline samples
+    @param min_baseline the number of baseline samples below which the trials are only recorded
+    @param alpha the significance level of the Mann-Whitney test
+    @param store the BaselineStore, by default the one at PERF_BASELINES
+    @return the values of the trials
+
+    Fails only if the median of the trials is worse than the median of the
+    baseline by more than `tolerance`, and a Mann-Whitney U test finds the
+    trials significantly worse than the baseline, so that one noisy trial or
+    a noisy baseline doesn't fail the test. Only trials that pass are
+    recorded into the baseline, so a regression can't drag the baseline
+    down until it stops failing.
+    """
+    store = store or BaselineStore(PERF_BASELINES)
+    baseline = store.values(baseline_key, field)
+    values = [metric() for _ in range(trials)]
+
+    if len(baseline) < min_baseline:
+        debug("Only {} baseline samples for {}, recorded {} without comparing".format(len(baseline), baseline_key, values))
+        _record_trials(store, baseline_key, field, values)
+        return values
+
+    sign = 1 if higher_is_better else -1
+    limit = median(baseline) * (1 - sign * tolerance)
+    p_value = mann_whitney_less([sign * v for v in values], [sign * v for v in baseline])
+    debug("{}: median {} against baseline median {} (limit {}), p-value {}".format(
+        baseline_key, median(values), median(baseline), limit, p_value))
+    worse = median(values) < limit if higher_is_better else median(values) > limit
+    assert not (worse and p_value < alpha), \
+        "Regression of {}: median {} is worse than {} ({:.0f}% from the baseline median {}, p-value {:.4f}); trials {}, baseline {}".format(
+            baseline_key, median(values), limit, tolerance * 100, median(baseline), p_value, values, baseline)
+    _record_trials(store, baseline_key, field, values)
+    return values
+
+
+def _record_trials(store, baseline_key, field, values):
+    for value in values:
+        store.record(baseline_key, {field: value})
+
+
 def assert_row_count(session, table_name, expected):
     """ Function to validate the row count expected in table_name """
 
@@ -0,0 +1,72 @@
+"""
+CSV and JSON reports of benchmark results.
+
+A report is a list of rows, one per measured configuration, written to
+<BENCHMARK_DIR>/<name>.csv and <name>.json. The files are rewritten after
+every row, so the rows measured before a benchmark fails are kept.
+
+Example usage:
+
+    report = BenchmarkReport('compaction_LeveledCompactionStrategy', version=cluster.version())
+    report.add(rows=100000, pattern='append', compaction_seconds=12.5)
+"""
+import csv
+import json
+import os
+import time
+
+from dtest import BENCHMARK_DIR
+
+
+def _flatten(row, prefix=''):
+    flat = []
+    for name, value in row:
+        if isinstance(value, dict):
+            flat.extend(_flatten(sorted(value.items()), prefix + name + '.'))
+        else:
+            flat.append((prefix + name, value))
+    return flat
+
+
+class BenchmarkReport(object):
+    """
+    The rows of the benchmark `name`. `context` (the Cassandra version, the
+    cluster size...) is saved in the JSON report alongside the rows.
+    """
+
+    def __init__(self, name, directory=None, **context):
+        self.name = name
+        self.directory = directory or BENCHMARK_DIR
+        self.context = context
+        self.rows = []
+
+    def add(self, **row):
+        """
+        Adds a row of results and rewrites the report. Dict values are
+        flattened into 'name.key' columns in the CSV report.
+        """
+        self.rows.append(row)
+        self.write()
+        return row
+
+    def columns(self):
+        columns = []
+        for row in self.rows:
+            for name, _ in _flatten(sorted(row.items())):
+                if name not in columns:
+                    columns.append(name)
+        return columns
+
+    def write(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        columns = self.columns()
+        with open(os.path.join(self.directory, self.name + '.csv'), 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in self.rows:
+                values = dict(_flatten(sorted(row.items())))
+                writer.writerow([values.get(column, '') for column in columns])
+        with open(os.path.join(self.directory, self.name + '.json'), 'w') as f:
+            json.dump({'name': self.name, 'written_at': time.time(), 'context': self.context, 'rows': self.rows},
+                      f, indent=2, sort_keys=True)
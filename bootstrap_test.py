@@ -5,13 +5,25 @@ import shutil
 import subprocess
 import tempfile
 import re
+import itertools
 from dtest import Tester, debug
-from tools import new_node, query_c1c2, since, require, KillOnBootstrap, InterruptBootstrap
+from tools import new_node, query_c1c2, since, require, benchmark, KillOnBootstrap, InterruptBootstrap
 from assertions import assert_almost_equal
+from benchreport import BenchmarkReport
+from jmxnodetool import flush_nodes
+from jmxutils import remove_perf_disable_shared_mem
+from liveconfig import reconfigure
+from streammonitor import StreamMonitor
 from ccmlib.node import NodeError
 from cassandra import ConsistencyLevel
 from cassandra.concurrent import execute_concurrent_with_args
 
+# the grid of the streaming benchmark: rows written by stress before
+# bootstrapping, and stream_throughput_outbound_megabits_per_sec (0 is
+# unthrottled)
+BENCHMARK_ROWS = [1000000, 4000000]
+BENCHMARK_STREAM_THROUGHPUTS = [0, 400, 200]
+
 
 class TestBootstrap(Tester):
 
@@ -426,3 +438,60 @@ class TestBootstrap(Tester):
         mark = node2.mark_log()
         node2.start(wait_other_notice=True)
         node2.watch_log_for("JOINING:", from_mark=mark, timeout=60)
+
+    @benchmark
+    @since('2.1')
+    def streaming_benchmark_test(self):
+        """
+        Measures streaming when a node bootstraps into a 2 node cluster
+        loaded with each of BENCHMARK_ROWS, and when it is decommissioned
+        again, at each of BENCHMARK_STREAM_THROUGHPUTS. The duration, bytes
+        and MB/s of each operation, and the breakdowns per session and per
+        table, are reported to streaming.csv and .json in BENCHMARK_DIR.
+        """
+        cluster = self.cluster
+        cluster.populate(2)
+        for node in cluster.nodelist():
+            remove_perf_disable_shared_mem(node)
+        cluster.start(wait_for_binary_proto=True)
+        node1 = cluster.nodelist()[0]
+
+        report = BenchmarkReport('streaming', version=cluster.version())
+        for rows, throughput in itertools.product(BENCHMARK_ROWS, BENCHMARK_STREAM_THROUGHPUTS):
+            running = [node for node in cluster.nodelist() if node.is_running()]
+            if not report.rows or report.rows[-1]['rows'] != rows:
+                self.stress(node1, ['write', 'n={}'.format(rows), '-schema', 'replication(factor=2)'])
+                flush_nodes(running)
+            reconfigure(running, stream_throughput_outbound_megabits_per_sec=throughput)
+
+            node = new_node(cluster)
+            remove_perf_disable_shared_mem(node)
+            node.set_configuration_options(values={'stream_throughput_outbound_megabits_per_sec': throughput})
+            monitor = StreamMonitor(running + [node]).start()
+            start = time.time()
+            node.start(wait_for_binary_proto=True, wait_other_notice=True)
+            self._report_streaming(report, 'bootstrap', rows, throughput, time.time() - start, monitor)
+
+            monitor = StreamMonitor(running + [node]).start()
+            start = time.time()
+            node.decommission()
+            self._report_streaming(report, 'decommission', rows, throughput, time.time() - start, monitor)
+            node.stop()
+
+    def _report_streaming(self, report, operation, rows, throughput, seconds, monitor):
+        plans = monitor.stop()
+        streamed = sum(plan.bytes for plan in plans)
+        streaming_seconds = sum(plan.seconds for plan in plans)
+        by_session, by_table = {}, {}
+        for plan in plans:
+            for (sender, receiver), session in plan.by_session.items():
+                by_session['{} -> {}'.format(sender, receiver)] = session.mb_per_sec
+            for table, table_bytes in plan.by_table.items():
+                by_table[table] = by_table.get(table, 0) + table_bytes
+        result = report.add(operation=operation, rows=rows, stream_throughput_megabits_per_sec=throughput,
+                            operation_seconds=seconds, plans=[plan.description for plan in plans],
+                            bytes=streamed, streaming_seconds=streaming_seconds,
+                            mb_per_sec=streamed / (1024.0 * 1024) / streaming_seconds if streaming_seconds else None,
+                            by_session=by_session, by_table=by_table,
+                            sampling_failures=dict((name, str(error)) for name, error in monitor.failures.items()))
+        debug(result)
@@ -1,4 +1,5 @@
 import glob
+import itertools
 import os
 import stat
 import subprocess
@@ -9,8 +10,26 @@ from cassandra.cluster import NoHostAvailable, OperationTimedOut
 
 import ccmlib
 from assertions import assert_almost_equal, assert_none, assert_one
+from benchreport import BenchmarkReport
 from dtest import Tester, debug
-from tools import require, since
+from jmxutils import JolokiaAgent, make_mbean, remove_perf_disable_shared_mem
+from loadgen import LoadGenerator
+from tools import benchmark, log_time, require, since
+
+# the grid of the commitlog benchmark: commitlog_segment_size_in_mb,
+# commitlog_compression and (commitlog_sync, period or batch window in ms)
+BENCHMARK_SEGMENT_SIZES = [8, 32, 128]
+BENCHMARK_COMPRESSION = [None, 'LZ4Compressor']
+BENCHMARK_SYNC = [('periodic', 10000), ('periodic', 1000), ('batch', 2)]
+BENCHMARK_WRITES = 200000
+BENCHMARK_VALUE_SIZE = 256
+
+# the space allocated to the segments, which is the number of segments times
+# their size for uncompressed ones
+TOTAL_COMMITLOG_SIZE = make_mbean('metrics', type='CommitLog', name='TotalCommitLogSize')
+# from 2.2, the bytes of mutations written to the active segments, and
+# their size on disk once compressed
+COMMITLOG = make_mbean('db', 'Commitlog')
 
 
 class TestCommitLog(Tester):
@@ -90,7 +109,7 @@ class TestCommitLog(Tester):
         if compressed:
             segment_size_in_mb *= 0.7
         segment_size = segment_size_in_mb * 1024 * 1024
-        self.node1.stress(['write', 'n=150000', '-rate', 'threads=25'])
+        self.stress(self.node1, ['write', 'n=150000', '-rate', 'threads=25'])
         time.sleep(1)
 
         if not ccmlib.common.is_win():
@@ -170,6 +189,79 @@ class TestCommitLog(Tester):
         }, create_test_keyspace=False)
         self._commitlog_test(segment_size_in_mb, 42, 14, compressed=True, files_error=0.12)
 
+    @benchmark
+    @since('2.1')
+    def commitlog_benchmark_test(self):
+        """
+        Measures the commitlog on every combination of
+        BENCHMARK_SEGMENT_SIZES, BENCHMARK_COMPRESSION and BENCHMARK_SYNC:
+        the throughput and latencies of BENCHMARK_WRITES writes, the space
+        allocated to the segments, the bytes written per mutation (from 2.2,
+        as the mutations and their compressed size on disk are only tracked
+        from then), and the time to replay the commitlog
+        when the node is killed and restarted, from the replay messages of
+        the node log. Memtables are made large enough that nothing is
+        flushed meanwhile, so that every mutation is still in the
+        commitlog. The comparison table is written to commitlog.csv and
+        .json in BENCHMARK_DIR.
+        """
+        remove_perf_disable_shared_mem(self.node1)
+        report = BenchmarkReport('commitlog', version=self.cluster.version())
+        for segment_size, compression, (sync, sync_ms) in itertools.product(BENCHMARK_SEGMENT_SIZES, BENCHMARK_COMPRESSION, BENCHMARK_SYNC):
+            if compression and self.cluster.version() < '2.2':
+                continue
+            conf = {'commitlog_segment_size_in_mb': segment_size,
+                    'commitlog_compression': [{'class_name': compression}] if compression else None,
+                    'commitlog_sync': sync,
+                    'commitlog_sync_period_in_ms': sync_ms if sync == 'periodic' else None,
+                    'commitlog_sync_batch_window_in_ms': sync_ms if sync == 'batch' else None,
+                    'commitlog_total_space_in_mb': 8192,
+                    'memtable_heap_space_in_mb': 512,
+                    'memtable_cleanup_threshold': 0.99}
+            result = self._commitlog_benchmark(conf)
+            result.update(segment_size_in_mb=segment_size, compression=compression, sync=sync, sync_ms=sync_ms)
+            debug(result)
+            report.add(**result)
+
+    def _commitlog_benchmark(self, conf):
+        self.cluster.stop()
+        self.node1.clear()
+        self.cluster.set_configuration_options(values=conf)
+        self.cluster.start(wait_for_binary_proto=True)
+        session = self.patient_cql_connection(self.node1)
+        self.create_ks(session, 'ks', 1)
+        session.execute("CREATE TABLE bench (k int PRIMARY KEY, v blob)")
+
+        value = os.urandom(BENCHMARK_VALUE_SIZE)
+        writes = LoadGenerator(session, concurrency=100)
+        writes.add('write', session.prepare("INSERT INTO bench (k, v) VALUES (?, ?)"), lambda i: (i, value))
+        result = writes.run(count=BENCHMARK_WRITES)
+
+        content_bytes = on_disk_bytes = None
+        with JolokiaAgent(self.node1) as jmx:
+            allocated_bytes = jmx.read_attribute(TOTAL_COMMITLOG_SIZE, 'Value')
+            if self.cluster.version() >= '2.2':
+                content_bytes, on_disk_bytes = jmx.read_attributes([(COMMITLOG, 'ActiveContentSize'), (COMMITLOG, 'ActiveOnDiskSize')])
+        file_bytes = sum(os.path.getsize(f) for f in self._get_commitlog_files())
+
+        self.node1.stop(gently=False)
+        mark = self.node1.mark_log()
+        self.node1.start(wait_for_binary_proto=True)
+        (replaying, _), (complete, match) = self.node1.watch_log_for(['Replaying .*CommitLog', r'Log replay complete, (\d+) replayed mutations'], from_mark=mark)
+        replay = log_time(complete) - log_time(replaying)
+
+        return {'write_ops_per_sec': result.throughput(),
+                'write_errors': result.errors,
+                'write_latency': result.latencies().summary(),
+                'allocated_segment_bytes': allocated_bytes,
+                'segment_file_bytes': file_bytes,
+                'written_bytes': content_bytes,
+                'written_on_disk_bytes': on_disk_bytes,
+                'bytes_per_mutation': float(content_bytes) / result.operations if content_bytes is not None and result.operations else None,
+                'on_disk_bytes_per_mutation': float(on_disk_bytes) / result.operations if on_disk_bytes is not None and result.operations else None,
+                'replayed_mutations': int(match.group(1)),
+                'replay_seconds': replay.total_seconds()}
+
     def stop_failure_policy_test(self):
         """ Test the stop commitlog failure policy (default one) """
         self.prepare()
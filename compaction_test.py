@@ -1,11 +1,29 @@
+import itertools
 import os
-import re
+import random
 import tempfile
+import threading
 import time
+from array import array
 
 from assertions import assert_almost_equal, assert_none, assert_one
+from benchreport import BenchmarkReport
+from compactiontracker import CompactionTracker
 from dtest import Tester, debug
-from tools import require, since
+from jmxnodetool import JmxNodetool
+from jmxutils import JolokiaAgent, make_mbean, remove_perf_disable_shared_mem
+from loadgen import LoadGenerator
+from tools import InBackground, benchmark, require, since
+from tooloutput import parse_tablestats
+
+# the grid of the compaction benchmark: rows written, write pattern and
+# compaction_throughput_mb_per_sec (0 is unthrottled)
+BENCHMARK_ROWS = [100000, 500000]
+BENCHMARK_PATTERNS = ['append', 'overwrite', 'time_series']
+BENCHMARK_THROUGHPUTS = [16, 0]
+BENCHMARK_VALUE_SIZE = 1024
+BENCHMARK_TTL = 120
+BENCHMARK_READ_RATE = 100
 
 
 class TestCompaction(Tester):
@@ -60,32 +78,25 @@ class TestCompaction(Tester):
         Insert data and check data size before and after a compaction.
         """
         cluster = self.cluster
-        cluster.populate(1).start(wait_for_binary_proto=True)
+        cluster.populate(1)
         [node1] = cluster.nodelist()
+        remove_perf_disable_shared_mem(node1)
+        cluster.start(wait_for_binary_proto=True)
 
-        stress_write(node1)
+        stress_write(self, node1)
 
         node1.flush()
 
         table_name = 'Standard1' if node1.get_cassandra_version() < '2.1' else 'standard1'
-        output = node1.nodetool('cfstats', True)[0]
-        if output.find(table_name) != -1:
-            output = output[output.find(table_name):]
-            output = output[output.find("Space used (live)"):]
-            initialValue = int(output[output.find(":")+1:output.find("\n")].strip())
-        else:
-            debug("datasize not found")
-            debug(output)
 
-        block_on_compaction_log(node1)
+        def live_size():
+            output = node1.nodetool('cfstats', True)[0]
+            [stats] = [t.stats for t in parse_tablestats(output).values() if t.table == table_name]
+            return stats['space_used_live']
 
-        output = node1.nodetool('cfstats', True)[0]
-        if output.find(table_name) != -1:
-            output = output[output.find(table_name):]
-            output = output[output.find("Space used (live)"):]
-            finalValue = int(output[output.find(":")+1:output.find("\n")].strip())
-        else:
-            debug("datasize not found")
+        initialValue = live_size()
+        block_on_compaction(node1)
+        finalValue = live_size()
 
         self.assertLess(finalValue, initialValue)
 
@@ -97,8 +108,10 @@ class TestCompaction(Tester):
         """
         self.skip_if_no_major_compaction()
         cluster = self.cluster
-        cluster.populate(1).start(wait_for_binary_proto=True)
+        cluster.populate(1)
         [node1] = cluster.nodelist()
+        remove_perf_disable_shared_mem(node1)
+        cluster.start(wait_for_binary_proto=True)
         session = self.patient_cql_connection(node1)
         self.create_ks(session, 'ks', 1)
         session.execute("create table cf (key int PRIMARY KEY, val int) with gc_grace_seconds = 0 and compaction= {'class':'" + self.strategy + "'}")
@@ -109,7 +122,7 @@ class TestCompaction(Tester):
         for x in range(0, 100):
             session.execute('delete from cf where key = ' + str(x))
 
-        block_on_compaction_log(node1, ks='ks', table='cf')
+        block_on_compaction(node1, ks='ks', table='cf')
 
         try:
             cfs = os.listdir(node1.get_path() + "/data/ks")
@@ -163,28 +176,23 @@ class TestCompaction(Tester):
         Set throughput, insert data and ensure compaction performance corresponds.
         """
         cluster = self.cluster
-        cluster.populate(1).start(wait_for_binary_proto=True)
+        cluster.populate(1)
         [node1] = cluster.nodelist()
+        remove_perf_disable_shared_mem(node1)
+        cluster.start(wait_for_binary_proto=True)
 
         # disableautocompaction only disables compaction for existing tables,
         # so initialize stress tables with stress first
-        stress_write(node1, keycount=1)
+        stress_write(self, node1, keycount=1)
         node1.nodetool('disableautocompaction')
 
-        stress_write(node1, keycount=200000)
+        stress_write(self, node1, keycount=200000)
 
         threshold = "5"
         node1.nodetool('setcompactionthroughput -- ' + threshold)
 
-        matches = block_on_compaction_log(node1)
-        stringline = matches[0]
-        throughput_pattern = re.compile('''.*          # it doesn't matter what the line starts with
-                                           =           # wait for an equals sign
-                                           ([\s\d\.]*) # capture a decimal number, possibly surrounded by whitespace
-                                           MB/s.*      # followed by 'MB/s'
-                                        ''', re.X)
-
-        avgthroughput = re.match(throughput_pattern, stringline).group(1).strip()
+        result = block_on_compaction(node1)
+        avgthroughput = result.throughput_mb_per_sec
         debug(avgthroughput)
 
         assert_almost_equal(float(threshold), float(avgthroughput), error=0.1)
@@ -252,34 +260,145 @@ class TestCompaction(Tester):
         node.nodetool('compact ks large')
         node.watch_log_for('Compacting large partition ks/large:user \(\d+ bytes\)', from_mark=mark, timeout=180)
 
+    @benchmark
+    @since('2.1')
+    def compaction_benchmark_test(self):
+        """
+        Measures the compaction strategy on every combination of
+        BENCHMARK_ROWS, BENCHMARK_PATTERNS and BENCHMARK_THROUGHPUTS, and
+        reports to compaction_<strategy>.csv and .json in BENCHMARK_DIR:
+        - the seconds compactions were running, from the first write until
+          compactions settle, and the MB compacted per second of those
+        - the write amplification: bytes flushed and written by compactions
+          over the bytes written by clients
+        - the latencies of reads issued at a fixed rate meanwhile
+        - the space amplification: live disk space over the size of the
+          rows that are still live
+        - the peak pending compactions and heap used, sampled every second
+        The patterns are 'append', writing new rows only, 'overwrite',
+        writing each row 10 times, and 'time_series', appending rows that
+        expire after BENCHMARK_TTL seconds to 10 partitions.
+        """
+        cluster = self.cluster
+        cluster.populate(1)
+        [node1] = cluster.nodelist()
+        remove_perf_disable_shared_mem(node1)
+        cluster.start(wait_for_binary_proto=True)
+        session = self.patient_cql_connection(node1)
+        self.create_ks(session, 'ks', 1)
+        sampler = self.sample_metrics([node1], name='compaction_metrics')
+
+        report = BenchmarkReport('compaction_' + self.strategy, version=cluster.version(), strategy=self.strategy)
+        for rows, pattern, throughput in itertools.product(BENCHMARK_ROWS, BENCHMARK_PATTERNS, BENCHMARK_THROUGHPUTS):
+            result = self._compaction_benchmark(session, node1, sampler, rows, pattern, throughput)
+            debug(result)
+            report.add(**result)
+
+    def _compaction_benchmark(self, session, node, sampler, rows, pattern, throughput):
+        table = 'bench_{}_{}_{}'.format(pattern, rows, throughput)
+        session.execute("CREATE TABLE {} (k int, c int, v blob, PRIMARY KEY (k, c)) "
+                        "WITH gc_grace_seconds = 0 AND compaction = {{'class': '{}'}}".format(table, self.strategy))
+        nodetool = JmxNodetool(node)
+        nodetool.setcompactionthroughput(throughput)
+
+        distinct = rows // 10 if pattern == 'overwrite' else rows
+        ttl = BENCHMARK_TTL if pattern == 'time_series' else 0
+
+        def key(i):
+            if pattern == 'time_series':
+                return (i % 10, i // 10)
+            return ((i % distinct) // 100, i % 100)
+
+        # random values, so that compression doesn't hide the data size
+        value = os.urandom(BENCHMARK_VALUE_SIZE)
+        written_at = array('d')
+        writes = LoadGenerator(session, concurrency=100)
+        writes.add('write', session.prepare("INSERT INTO {} (k, c, v) VALUES (?, ?, ?) USING TTL ?".format(table)),
+                   lambda i: key(i) + (value, ttl), callback=lambda params, result: written_at.append(time.time()))
+        reads = LoadGenerator(session, rate=BENCHMARK_READ_RATE, concurrency=10)
+        reads.add('read', session.prepare("SELECT v FROM {} WHERE k = ? AND c = ?".format(table)),
+                  lambda i: key(random.randrange(rows)))
+
+        tracker = CompactionTracker(node).mark()
+        started = time.time()
+        ingested = threading.Event()
+
+        def ingest():
+            try:
+                return writes.run(count=rows)
+            finally:
+                nodetool.flush()
+                ingested.set()
+        writer = InBackground(ingest)
+        reads.start()
+        compactions = tracker.wait_until_quiescent(timeout=3600, stable_for=5, after=ingested)
+        reads.stop()
+        write_result = writer.result()
+        read_result = reads.join()
+        nodetool.close()
+
+        with JolokiaAgent(node) as jmx:
+            flushed, disk_space = [jmx.read_attribute(make_mbean('metrics', type='ColumnFamily', keyspace='ks', scope=table, name=name), 'Count')
+                                   for name in ('BytesFlushed', 'LiveDiskSpaceUsed')]
+        ingested_bytes = write_result.operations * BENCHMARK_VALUE_SIZE
+        if pattern == 'time_series':
+            live_bytes = sum(1 for t in written_at if t > time.time() - ttl) * BENCHMARK_VALUE_SIZE
+        else:
+            live_bytes = min(distinct, write_result.operations) * BENCHMARK_VALUE_SIZE
+        bytes_compacted = sum(c.bytes_in for c in compactions.compactions)
+        written = flushed + sum(c.bytes_out for c in compactions.compactions)
+        session.execute("DROP TABLE {}".format(table))
+
+        def peak(metric):
+            values = [v for t, v in sampler.series(node, metric).samples() if t >= started]
+            return max(values) if values else None
+
+        return {'rows': rows, 'pattern': pattern, 'throughput_mb_per_sec': throughput,
+                'write_ops_per_sec': write_result.throughput(),
+                'write_errors': write_result.errors,
+                'compactions': len(compactions.compactions),
+                'compaction_seconds': compactions.active_seconds,
+                'compacted_mb_per_sec': bytes_compacted / (1024.0 * 1024) / compactions.active_seconds if compactions.active_seconds else None,
+                'write_amplification': float(written) / ingested_bytes if ingested_bytes else None,
+                'space_amplification': float(disk_space) / live_bytes if live_bytes else None,
+                'disk_bytes': disk_space,
+                'peak_pending_compactions': peak('PendingCompactions'),
+                'peak_heap_used': peak('HeapUsed'),
+                'read_latency': read_result.latencies().summary()}
+
     def skip_if_no_major_compaction(self):
         if self.cluster.version() < '2.2' and self.strategy == 'LeveledCompactionStrategy':
             self.skipTest('major compaction not implemented for LCS in this version of Cassandra')
 
 
-def block_on_compaction_log(node, ks=None, table=None):
+def block_on_compaction(node, ks=None, table=None):
     """
     @param node the node on which to trigger and block on compaction
     @param ks the keyspace to compact
     @param table the table to compact
+    @return the CompactionWait of the major compaction
 
     Helper method for testing compaction. This triggers compactions by
-    calling flush and compact on node. In situations where major
+    calling flush and compact on node. The flush goes over JMX; the major
+    compaction is left to the nodetool binary, as it can outlast the
+    timeout of a Jolokia request. In situations where major
     compaction won't apply to a table, such as in pre-2.2 LCS tables, the
     flush will trigger minor compactions.
 
-    This method uses log-watching to block until compaction is completed.
+    Compactions are tracked over JMX from before the flush, so a compaction
+    finishing before the wait starts is still seen. The major compaction
+    runs in the background while the tracker measures its throughput, and
+    the wait lasts until it returned and no compaction is left running, so
+    that the minor compactions triggered by the flush are told apart from
+    it: the major compaction is the largest of the table.
 
     By default, this method uses the keyspace and table names generated by
     cassandra-stress. These will not be used if ks and table names parameters
     are passed in.
-
-    Calling flush before calling this method may cause it to hang; if
-    compaction completes before the method starts, it may not occur again
-    during this method.
     """
-    mark = node.mark_log()
-    node.flush()
+    tracker = CompactionTracker(node).mark()
+    with JmxNodetool(node) as nodetool:
+        nodetool.flush()
 
     # on newer C* versions, default stress names are titlecased
     stress_name_upper = node.get_cassandra_version() < '2.1'
@@ -289,16 +408,24 @@ def block_on_compaction_log(node, ks=None, table=None):
     ks = ks or stress_keyspace
     table = table or stress_table
 
-    node.nodetool('compact {ks} {table}'.format(ks=ks, table=table))
+    compacted = threading.Event()
 
-    return node.watch_log_for('Compacted', from_mark=mark)
+    def compact():
+        try:
+            node.nodetool('compact {ks} {table}'.format(ks=ks, table=table))
+        finally:
+            compacted.set()
+    compaction = InBackground(compact)
+    result = tracker.wait_until_quiescent(after=compacted)
+    compaction.result()
+    return tracker.largest(result, ks, table)
 
 
-def stress_write(node, keycount=100000):
+def stress_write(tester, node, keycount=100000):
     if node.get_cassandra_version() < '2.1':
-        node.stress(['--num-keys={keycount}'.format(keycount=keycount)])
+        tester.stress(node, ['--num-keys={keycount}'.format(keycount=keycount)])
     else:
-        node.stress(['write', 'n={keycount}'.format(keycount=keycount)])
+        tester.stress(node, ['write', 'n={keycount}'.format(keycount=keycount)])
 
 
 strategies = ['LeveledCompactionStrategy', 'SizeTieredCompactionStrategy', 'DateTieredCompactionStrategy']
@@ -0,0 +1,191 @@
+"""
+Tracks compactions through the CompactionManager over JMX, instead of
+watching the log for 'Compacted' lines.
+
+A tracker is marked before compactions are triggered: the compaction history
+at that point is remembered, so compactions that finish before the wait
+starts are still counted and the wait can't miss them.
+
+Example usage:
+
+    tracker = CompactionTracker(node).mark()
+    node.flush()
+    node.nodetool('compact ks cf')
+    result = tracker.wait_for_compactions('ks', 'cf')
+    debug(result.throughput_mb_per_sec)
+
+    wait_for_quiescence(cluster.nodelist())
+
+As with any use of jmxutils, remove_perf_disable_shared_mem must be called
+on the nodes before they are started.
+"""
+import time
+from collections import namedtuple
+
+from jmxutils import JolokiaAgent, make_mbean
+
+COMPACTION_MANAGER = make_mbean('db', 'CompactionManager')
+PENDING_TASKS = make_mbean('metrics', type='Compaction', name='PendingTasks')
+
+# A finished compaction, from the compaction history. `compacted_at` is in
+# milliseconds since the epoch.
+CompactionRecord = namedtuple('CompactionRecord', ['id', 'keyspace', 'table', 'compacted_at', 'bytes_in', 'bytes_out'])
+
+# The result of a wait: the compactions that finished since the tracker was
+# marked, the seconds waited, and the seconds during which a compaction was
+# seen running. Like Cassandra's 'Compacted' log line, the throughput is
+# computed from the bytes written.
+CompactionWait = namedtuple('CompactionWait', ['node', 'compactions', 'elapsed', 'active_seconds', 'throughput_mb_per_sec'])
+
+
+def _history_rows(value):
+    # Jolokia serializes the CompactionHistory TabularData either as a list
+    # of rows or as maps nested by index column, depending on its version
+    if isinstance(value, dict):
+        if 'keyspace_name' in value:
+            return [value]
+        return [row for v in value.values() for row in _history_rows(v)]
+    if isinstance(value, list):
+        return [row for v in value for row in _history_rows(v)]
+    return []
+
+
+class CompactionTracker(object):
+    """
+    Waits for compactions on `node`, polling the CompactionManager every
+    `poll_interval` seconds.
+    """
+
+    def __init__(self, node, poll_interval=0.1):
+        self.node = node
+        self.poll_interval = poll_interval
+        self.agent = JolokiaAgent(node)
+        self._seen = None
+        self._marked_at = None
+        # compaction id -> the keyspace, table, total and first and last
+        # times it was seen running by the waits
+        self.running = {}
+
+    def history(self):
+        """ Returns the CompactionRecords of the node's compaction history. """
+        self.agent.attach()
+        rows = _history_rows(self.agent.read_attribute(COMPACTION_MANAGER, 'CompactionHistory'))
+        return [CompactionRecord(row['id'], row['keyspace_name'], row['columnfamily_name'],
+                                 int(row['compacted_at']), int(row['bytes_in']), int(row['bytes_out']))
+                for row in rows]
+
+    def mark(self):
+        """ Starts tracking: compactions finished from now on are counted by the waits. """
+        self._seen = set(record.id for record in self.history())
+        self._marked_at = time.time()
+        return self
+
+    def active(self):
+        """
+        Returns the running compactions, as dicts with at least keyspace,
+        columnfamily, completed, total and unit, and the number of pending
+        compaction tasks.
+        """
+        self.agent.attach()
+        compactions, pending = self.agent.read_attributes([(COMPACTION_MANAGER, 'Compactions'), (PENDING_TASKS, 'Value')])
+        return compactions, pending
+
+    def finished(self, keyspace=None, table=None):
+        """ Returns the compactions of `keyspace` and `table`, or of any table, finished since mark(). """
+        if self._seen is None:
+            raise RuntimeError("CompactionTracker.mark() must be called before waiting")
+        return [record for record in self.history()
+                if record.id not in self._seen and
+                (keyspace is None or record.keyspace == keyspace) and
+                (table is None or record.table == table)]
+
+    def _wait(self, done, timeout, description):
+        deadline = time.time() + timeout
+        active_seconds = 0
+        last_poll = None
+        while True:
+            compactions, pending = self.active()
+            now = time.time()
+            for compaction in compactions:
+                running = self.running.setdefault(compaction.get('compactionId', compaction.get('id')),
+                                                  {'keyspace': compaction['keyspace'], 'table': compaction['columnfamily'],
+                                                   'total': int(compaction['total']), 'first': now})
+                running['last'] = now
+            if compactions and last_poll is not None:
+                active_seconds += now - last_poll
+            last_poll = now
+            finished = done(compactions, pending)
+            if finished is not None:
+                elapsed = now - self._marked_at
+                bytes_out = sum(record.bytes_out for record in finished)
+                seconds = active_seconds or elapsed
+                throughput = bytes_out / (1024.0 * 1024) / seconds if seconds else 0
+                self.agent.close()
+                return CompactionWait(self.node, finished, elapsed, active_seconds, throughput)
+            if now > deadline:
+                self.agent.close()
+                raise RuntimeError("{} not reached on {} after {}s; running compactions: {}, pending tasks: {}".format(
+                    description, self.node.name, timeout, compactions, pending))
+            time.sleep(self.poll_interval)
+
+    def wait_for_compactions(self, keyspace=None, table=None, count=1, timeout=600):
+        """
+        Waits until at least `count` compactions of `keyspace` and `table`
+        (or of any table, if not given) finished since mark().
+
+        @return a CompactionWait
+        """
+        def done(compactions, pending):
+            finished = self.finished(keyspace, table)
+            return finished if len(finished) >= count else None
+        return self._wait(done, timeout, "{} finished compaction(s) of {}.{}".format(count, keyspace, table))
+
+    def wait_until_quiescent(self, timeout=600, stable_for=1.0, after=None):
+        """
+        Waits until no compaction is running or pending, and none has been
+        for `stable_for` seconds, so that compactions submitted right after
+        a flush are not missed. If `after`, a threading.Event, is given,
+        quiescence only counts once it is set, e.g. by the thread writing
+        the data being compacted.
+
+        @return a CompactionWait of the compactions finished since mark()
+        """
+        if self._seen is None:
+            self.mark()
+        quiet_since = [None]
+
+        def done(compactions, pending):
+            if compactions or pending or (after is not None and not after.is_set()):
+                quiet_since[0] = None
+                return None
+            if quiet_since[0] is None:
+                quiet_since[0] = time.time()
+            if time.time() - quiet_since[0] < stable_for:
+                return None
+            return self.finished()
+        return self._wait(done, timeout, "Compaction quiescence")
+
+    def largest(self, wait, keyspace, table):
+        """
+        Returns a CompactionWait of only the largest compaction of `keyspace`
+        and `table` in `wait`, such as a major compaction among the minor
+        ones. Its throughput is measured over the time the largest running
+        compaction of the table was seen by the waits.
+        """
+        records = [record for record in wait.compactions if record.keyspace == keyspace and record.table == table]
+        assert records, "No compaction of {}.{} finished on {}: {}".format(keyspace, table, self.node.name, wait.compactions)
+        largest = max(records, key=lambda record: record.bytes_in)
+        runs = [run for run in self.running.values() if run['keyspace'] == keyspace and run['table'] == table]
+        run = max(runs, key=lambda run: run['total']) if runs else None
+        seconds = run['last'] - run['first'] if run else 0
+        throughput = largest.bytes_out / (1024.0 * 1024) / seconds if seconds else 0
+        return CompactionWait(self.node, [largest], wait.elapsed, seconds, throughput)
+
+
+def wait_for_quiescence(nodes, timeout=600, stable_for=1.0):
+    """
+    Waits until no compaction is running or pending on any of `nodes`.
+
+    @return the list of CompactionWait, one per node
+    """
+    return [CompactionTracker(node).wait_until_quiescent(timeout, stable_for) for node in nodes]
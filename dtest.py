@@ -10,6 +10,11 @@ from cassandra.cluster import NoHostAvailable
 from cassandra.cluster import Cluster as PyCluster
 from cassandra.auth import PlainTextAuthProvider
 from cassandra.policies import WhiteListRoundRobinPolicy
+from jmxutils import forget_jolokia_agents
+from jmxsampler import MetricSampler
+from perfbaseline import BaselineStore, baseline_key
+from tooloutput import parse_stress
+import gclog
 
 LOG_SAVED_DIR="logs"
 try:
@@ -41,6 +46,9 @@ RECORD_COVERAGE = os.environ.get('RECORD_COVERAGE', '').lower() in ('yes', 'true
 REUSE_CLUSTER = os.environ.get('REUSE_CLUSTER', '').lower() in ('yes', 'true')
 SILENCE_DRIVER_ON_SHUTDOWN = os.environ.get('SILENCE_DRIVER_ON_SHUTDOWN', 'true').lower() in ('yes', 'true')
 IGNORE_REQUIRE = os.environ.get('IGNORE_REQUIRE', '').lower() in ('yes', 'true')
+PERF_BASELINES = os.environ.get('PERF_BASELINES', os.path.join(LOG_SAVED_DIR, 'perf_baselines.json'))
+RUN_BENCHMARKS = os.environ.get('RUN_BENCHMARKS', '').lower() in ('yes', 'true')
+BENCHMARK_DIR = os.environ.get('BENCHMARK_DIR', os.path.join(LOG_SAVED_DIR, 'benchmarks'))
 
 CURRENT_TEST = ""
 
@@ -183,6 +191,7 @@ class Tester(TestCase):
 
             # Cleanup everything:
             debug("removing ccm cluster " + self.cluster.name + " at: " + self.test_path)
+            forget_jolokia_agents(self.cluster)
             self.cluster.remove()
             os.rmdir(self.test_path)
         if os.path.exists(LAST_TEST_DIR):
@@ -259,9 +268,14 @@ class Tester(TestCase):
         self.modify_log(self.cluster)
         self.connections = []
         self.runners = []
+        self.metric_samplers = []
+        self.gc_logged_nodes = []
 
     def copy_logs(self, directory=None, name=None):
-        """Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'"""
+        """
+        Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'.
+        Returns the directory the logs were copied to, or None if the cluster has no nodes.
+        """
         if directory is None:
             directory = LOG_SAVED_DIR
         if name is None:
@@ -281,6 +295,7 @@ class Tester(TestCase):
                 os.unlink(name)
             if not is_win():
                 os.symlink(basedir, name)
+            return logdir
 
     def cql_connection(self, node, keyspace=None, user=None,
                        password=None, compression=True, protocol_version=None):
@@ -445,6 +460,8 @@ class Tester(TestCase):
                 pass
 
     def tearDown(self):
+        # before any exception handled below replaces the one of the test
+        failed = sys.exc_info() != (None, None, None)
         reset_environment_vars()
 
         for con in self.connections:
@@ -456,7 +473,15 @@ class Tester(TestCase):
             except:
                 pass
 
-        failed = sys.exc_info() != (None, None, None)
+        for sampler in self.metric_samplers:
+            try:
+                sampler.stop()
+            except Exception as e:
+                debug("Metric sampler {} failed: {}".format(sampler.name, e))
+            if sampler.failures:
+                debug("Metric sampler {} could not sample {} times, last: {}".format(
+                    sampler.name, len(sampler.failures), sampler.failures[-1]))
+
         try:
             for node in self.cluster.nodelist():
                 if self.allow_log_errors == False:
@@ -469,7 +494,12 @@ class Tester(TestCase):
             try:
                 if failed or KEEP_LOGS:
                     # means the test failed. Save the logs for inspection.
-                    self.copy_logs()
+                    logdir = self.copy_logs()
+                    if logdir is not None:
+                        for sampler in self.metric_samplers:
+                            sampler.export(logdir)
+                        if self.gc_logged_nodes:
+                            gclog.export_gc_logs(self.gc_logged_nodes, logdir)
             except Exception as e:
                     print "Error saving log:", str(e)
             finally:
@@ -484,6 +514,53 @@ class Tester(TestCase):
         runner.start()
         return runner
 
+    def sample_metrics(self, nodes=None, metrics=None, interval=1.0, name='metrics'):
+        """
+        Starts sampling JMX metrics on `nodes` (by default, every node of the
+        cluster) in the background. The sampler is stopped at the end of the
+        test, and its samples are saved as <name>.csv and <name>.json with the
+        logs when those are kept. See jmxsampler.MetricSampler.
+        """
+        if nodes is None:
+            nodes = self.cluster.nodelist()
+        sampler = MetricSampler(nodes, metrics, interval=interval, name=name)
+        self.metric_samplers.append(sampler)
+        return sampler.start()
+
+    def stress(self, node, stress_options, config=None):
+        """
+        Runs cassandra-stress on `node` and records the summary of the run in
+        the performance baseline store (PERF_BASELINES), under this test, the
+        Cassandra version and `config`, which defaults to the stress options.
+
+        @return the StressSummary of the run, or None if stress printed no summary
+        """
+        with tempfile.TemporaryFile(mode='w+') as output:
+            node.stress(stress_options, stdout=output, stderr=subprocess.STDOUT)
+            output.seek(0)
+            text = output.read()
+        summary = parse_stress(text)
+        if summary is None:
+            debug("No summary in the output of stress {}:\n{}".format(stress_options, text))
+            return None
+        debug("stress {}: {}".format(stress_options, summary))
+        key = baseline_key(self.id(), node.get_cassandra_version(), config or ' '.join(stress_options))
+        BaselineStore(PERF_BASELINES).record(key, summary)
+        return summary
+
+    def enable_gc_logging(self, nodes=None):
+        """
+        Makes `nodes` (by default, every node of the cluster) log their
+        garbage collections from their next start. The GC logs and a
+        per-node summary of them, gc_summary.json, are saved with the logs
+        when those are kept. See gclog.
+        """
+        if nodes is None:
+            nodes = self.cluster.nodelist()
+        for node in nodes:
+            gclog.enable_gc_logging(node)
+            self.gc_logged_nodes.append(node)
+
     def skip(self, msg):
         if not NO_SKIP:
             raise SkipTest(msg)
@@ -0,0 +1,194 @@
+"""
+Compact model of the expected contents of a table, for write/verify
+workloads.
+
+Cells are addressed by a partition index and a clustering index, and stored
+in flat typed arrays (values, write timestamps and a state byte per cell)
+rather than Python containers, so that a model of millions of cells costs a
+few bytes per cell. Writes, deletes and reads are applied and verified in
+batches.
+
+Example usage:
+
+    model = TableModel(clusterings=10)
+    model.write(partitions=[0, 0, 1], clusterings=[0, 1, 0], values=[5, 6, 7])
+    model.delete(partitions=[0], clusterings=[1])
+    rows = session.execute('SELECT p, c, v FROM t')
+    assert not model.verify(rows, complete=True)
+"""
+from array import array
+from collections import namedtuple
+
+# cell states
+UNWRITTEN = 0
+LIVE = 1
+DELETED = 2
+
+Mismatch = namedtuple('Mismatch', ['partition', 'clustering', 'expected', 'actual'])
+
+
+class TableModel(object):
+    """
+    Expected state of a table of `partitions` x `clusterings` cells. The
+    number of partitions grows on demand as higher partition indexes are
+    written; the number of clusterings per partition is fixed.
+
+    Conflicting writes are resolved the way Cassandra does: the highest
+    timestamp wins, a tombstone wins a timestamp tie, and the greater value
+    wins a tie between two writes. When no timestamps are given, every
+    batch is considered newer than the previous ones.
+
+    `value_typecode` is the array typecode used for values: the default 'l'
+    holds 64-bit integers on 64-bit Linux and OS X, 'd' holds floats.
+    """
+
+    def __init__(self, partitions=0, clusterings=1, value_typecode='l'):
+        self.clusterings = clusterings
+        self.values = array(value_typecode)
+        # microsecond timestamps are exact in a double up to year 2255
+        self.timestamps = array('d')
+        self.states = bytearray()
+        self._clock = 0
+        self._grow(partitions)
+
+    @property
+    def partitions(self):
+        return len(self.states) // self.clusterings
+
+    def _grow(self, partitions):
+        missing = (partitions - self.partitions) * self.clusterings
+        if missing > 0:
+            self.values.extend(array(self.values.typecode, [0]) * missing)
+            self.timestamps.extend(array('d', [0]) * missing)
+            self.states.extend(bytearray(missing))
+
+    def _index(self, partition, clustering):
+        if not 0 <= clustering < self.clusterings:
+            raise IndexError('clustering index {} out of range [0, {})'.format(clustering, self.clusterings))
+        return partition * self.clusterings + clustering
+
+    def _timestamps(self, timestamps, count):
+        if timestamps is None:
+            self._clock += 1
+            return [self._clock] * count
+        if isinstance(timestamps, (int, long, float)):
+            return [timestamps] * count
+        return timestamps
+
+    def _apply(self, partitions, clusterings, values, timestamps, state):
+        partitions = list(partitions)
+        if clusterings is None:
+            clusterings = [0] * len(partitions)
+        timestamps = self._timestamps(timestamps, len(partitions))
+        if partitions:
+            self._grow(max(partitions) + 1)
+        for partition, clustering, value, timestamp in zip(partitions, clusterings, values, timestamps):
+            i = self._index(partition, clustering)
+            current_state = self.states[i]
+            current_timestamp = self.timestamps[i]
+            if current_state != UNWRITTEN:
+                if timestamp < current_timestamp:
+                    continue
+                if timestamp == current_timestamp:
+                    if current_state == DELETED:
+                        continue
+                    if state == LIVE and value <= self.values[i]:
+                        continue
+            self.states[i] = state
+            self.timestamps[i] = timestamp
+            self.values[i] = value
+
+    def write(self, partitions, clusterings=None, values=None, timestamps=None):
+        """
+        Records a batch of writes. `partitions`, `clusterings` and `values`
+        are parallel sequences; `clusterings` defaults to 0 for every cell.
+        `timestamps` is a sequence, a single timestamp for the whole batch,
+        or None.
+        """
+        self._apply(partitions, clusterings, values, timestamps, LIVE)
+
+    def delete(self, partitions, clusterings=None, timestamps=None):
+        """ Records a batch of cell deletions. """
+        partitions = list(partitions)
+        self._apply(partitions, clusterings, [0] * len(partitions), timestamps, DELETED)
+
+    def delete_partitions(self, partitions, timestamp=None):
+        """ Records partition deletions, shadowing every cell of each partition. """
+        partitions = list(partitions)
+        cells = [(p, c) for p in partitions for c in xrange(self.clusterings)]
+        if timestamp is None:
+            self._clock += 1
+            timestamp = self._clock
+        self._apply([p for p, _ in cells], [c for _, c in cells], [0] * len(cells), timestamp, DELETED)
+
+    def increment(self, partitions, clusterings=None, deltas=None):
+        """
+        Records a batch of counter increments. Counters are not subject to
+        timestamp resolution; `deltas` defaults to 1 for every cell.
+        """
+        partitions = list(partitions)
+        if clusterings is None:
+            clusterings = [0] * len(partitions)
+        if deltas is None:
+            deltas = [1] * len(partitions)
+        if partitions:
+            self._grow(max(partitions) + 1)
+        for partition, clustering, delta in zip(partitions, clusterings, deltas):
+            i = self._index(partition, clustering)
+            self.states[i] = LIVE
+            self.values[i] += delta
+
+    def expected(self, partition, clustering=0):
+        """ Returns the expected value of a cell, or None if it should not exist. """
+        if partition >= self.partitions:
+            return None
+        i = self._index(partition, clustering)
+        return self.values[i] if self.states[i] == LIVE else None
+
+    def live_count(self):
+        """ Returns the number of cells expected to exist. """
+        return self.states.count(chr(LIVE))
+
+    def live_partition_count(self):
+        """ Returns the number of partitions expected to hold at least one cell. """
+        return len(set(i // self.clusterings for i in self._live_indexes()))
+
+    def _live_indexes(self):
+        i = self.states.find(chr(LIVE))
+        while i != -1:
+            yield i
+            i = self.states.find(chr(LIVE), i + 1)
+
+    def live_cells(self):
+        """ Yields (partition, clustering, value) for every cell expected to exist. """
+        for i in self._live_indexes():
+            yield i // self.clusterings, i % self.clusterings, self.values[i]
+
+    def verify(self, rows, complete=False):
+        """
+        Checks a batch of read results against the model. `rows` is an
+        iterable of (partition, clustering, value) triples, or of
+        (partition, value) pairs for a model with a single clustering.
+
+        If `complete` is set, `rows` is taken to be the whole table, and
+        cells expected to exist but absent from `rows` are reported too.
+
+        @return a list of Mismatch; an empty list means the rows match.
+        """
+        mismatches = []
+        seen = bytearray(len(self.states)) if complete else None
+        for row in rows:
+            if self.clusterings == 1 and len(row) == 2:
+                (partition, value), clustering = row, 0
+            else:
+                partition, clustering, value = row
+            expected = self.expected(partition, clustering)
+            if expected != value:
+                mismatches.append(Mismatch(partition, clustering, expected, value))
+            if complete and expected is not None:
+                seen[self._index(partition, clustering)] = 1
+        if complete:
+            for i in self._live_indexes():
+                if not seen[i]:
+                    mismatches.append(Mismatch(i // self.clusterings, i % self.clusterings, self.values[i], None))
+        return mismatches
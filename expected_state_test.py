@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from expected_state import Mismatch, TableModel
+
+
+class TestTableModel(TestCase):
+
+    def write_test(self):
+        model = TableModel(clusterings=3)
+        model.write([0, 0, 2], [0, 1, 2], values=[5, 6, 7])
+        self.assertEqual(3, model.partitions)
+        self.assertEqual((5, 6, None, 7), (model.expected(0, 0), model.expected(0, 1), model.expected(1, 0), model.expected(2, 2)))
+        self.assertEqual(None, model.expected(10))
+        # later batches win, and a timestamp tie is won by the greater value
+        model.write([0], [0], values=[1])
+        model.write([0, 0], [1, 1], values=[9, 8], timestamps=100)
+        model.write([0], [1], values=[2], timestamps=99)
+        self.assertEqual((1, 9), (model.expected(0, 0), model.expected(0, 1)))
+        with self.assertRaises(IndexError):
+            model.write([0], [3], values=[1])
+
+    def delete_test(self):
+        model = TableModel(clusterings=2)
+        model.write([0, 0, 1, 1], [0, 1, 0, 1], values=[1, 2, 3, 4], timestamps=10)
+        model.delete([0], [1], timestamps=10)
+        model.delete([1], [0], timestamps=9)
+        self.assertEqual((1, None, 3), (model.expected(0, 0), model.expected(0, 1), model.expected(1, 0)))
+        model.delete_partitions([1], timestamp=20)
+        self.assertEqual([(0, 0, 1)], list(model.live_cells()))
+        self.assertEqual((1, 1), (model.live_count(), model.live_partition_count()))
+
+    def increment_test(self):
+        model = TableModel(partitions=2, clusterings=2)
+        model.increment([0, 0, 3], [1, 1, 0])
+        model.increment([3], [0], deltas=[5])
+        self.assertEqual(4, model.partitions)
+        self.assertEqual([(0, 1, 2), (3, 0, 6)], list(model.live_cells()))
+        self.assertEqual(2, model.live_partition_count())
+
+    def verify_test(self):
+        model = TableModel(clusterings=2)
+        model.write([0, 0, 1], [0, 1, 0], values=[1, 2, 3])
+        self.assertEqual([], model.verify([(0, 0, 1), (1, 0, 3)]))
+        self.assertEqual([Mismatch(0, 1, 2, None)], model.verify([(0, 0, 1), (1, 0, 3)], complete=True))
+        self.assertEqual([Mismatch(1, 0, 3, 4), Mismatch(1, 1, None, 5)], model.verify([(1, 0, 4), (1, 1, 5)]))
+
+        single = TableModel()
+        single.write([1, 2], values=[10, 20])
+        self.assertEqual([Mismatch(2, 0, 20, None)], single.verify([(1, 10)], complete=True))
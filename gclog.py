@@ -0,0 +1,224 @@
+"""
+JVM garbage collection logging for nodes, and analysis of the logs.
+
+enable_gc_logging() makes a node's JVM write a GC log, and summarize_gc_log()
+reduces that log to a GcSummary: the stop-the-world pauses, the allocation
+rate and the bytes promoted to the old generation. The log formats of the
+ParNew/CMS, parallel, serial and G1 collectors of Java 7 and 8 are
+understood, including the multi-line records written with the
+-XX:+PrintTenuringDistribution and -XX:+PrintHeapAtGC flags that
+cassandra-env.sh turns on by default.
+
+Example usage:
+
+    cluster.populate(3)
+    for node in cluster.nodelist():
+        enable_gc_logging(node)
+    cluster.start()
+    ...
+    assert_max_gc_pause(node1, 500)
+
+Tests usually call Tester.enable_gc_logging(), which also saves every node's
+GC log and summary with the logs of the test when those are kept.
+"""
+import glob
+import json
+import math
+import os
+import re
+import shutil
+from collections import namedtuple
+
+import ccmlib.common as common
+
+GC_LOG_NAME = 'gc.log'
+
+# cassandra-env.sh turns on GC log rotation from 2.2.2, which would write
+# gc.log.0.current and so on instead of gc.log
+GC_LOG_OPTIONS = ['-XX:+PrintGCDetails', '-XX:+PrintGCDateStamps', '-XX:+PrintGCTimeStamps', '-XX:-UseGCLogFileRotation']
+
+# `pauses` is the number of stop-the-world pauses, `full_gcs` the number of
+# those that collected the whole heap, and `promoted_bytes` the bytes moved
+# from the young to the old generation by young collections.
+GcSummary = namedtuple('GcSummary', ['pauses', 'full_gcs', 'total_pause_ms', 'p99_pause_ms', 'max_pause_ms',
+                                     'allocation_rate_mb_per_sec', 'promoted_bytes', 'elapsed_sec'])
+
+# a line starting with a time stamp: optional date stamp, then the uptime in seconds
+_STAMPED = re.compile(r'^(?:\S+: )?(\d+\.\d+): ')
+# a line starting a GC event
+_EVENT = re.compile(r'^(?:\S+: )?(\d+\.\d+): \[(Full GC|GC)')
+_PAUSE = re.compile(r', (\d+\.\d+) secs\]')
+_TIMES = re.compile(r'\s*\[Times:[^\]]*\]')
+# lines of -XX:+PrintTenuringDistribution within a young collection
+_TENURING = re.compile(r'^(?:Desired survivor size|- age )')
+# young generation and heap occupancy of ParNew, DefNew and PSYoungGen collections
+_YOUNG = re.compile(r'\[(?:ParNew|DefNew|PSYoungGen): (\d+)K->(\d+)K\(\d+K\)[^\]]*\] (\d+)K->(\d+)K\(\d+K\)')
+# eden, survivors and heap occupancy of G1 collections
+_G1_SIZES = re.compile(r'\[Eden: ([\d.]+)([BKMG])\([^)]*\)->([\d.]+)([BKMG])\([^)]*\) '
+                       r'Survivors: ([\d.]+)([BKMG])->([\d.]+)([BKMG]) '
+                       r'Heap: ([\d.]+)([BKMG])\([^)]*\)->([\d.]+)([BKMG])')
+
+_UNITS = {'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def gc_log_path(node):
+    return os.path.join(node.get_path(), 'logs', GC_LOG_NAME)
+
+
+def gc_log_files(node):
+    """
+    Returns the GC log files of the node, oldest first: gc.log, or the
+    gc.log.<n> files of a rotated log.
+    """
+    return sorted(glob.glob(gc_log_path(node) + '*'), key=os.path.getmtime)
+
+
+def enable_gc_logging(node):
+    """
+    Edits the node's cassandra-env.sh to log garbage collections to
+    logs/gc.log in the node's directory, from its next start. This is a
+    no-op on Windows.
+    """
+    if common.is_win():
+        return
+    conf_file = os.path.join(node.get_conf_dir(), common.CASSANDRA_ENV)
+    with open(conf_file, 'a') as f:
+        f.write('\n# GC logging enabled by dtest\n')
+        for option in GC_LOG_OPTIONS + ['-Xloggc:' + gc_log_path(node)]:
+            f.write('JVM_OPTS="$JVM_OPTS {}"\n'.format(option))
+
+
+def _bytes(value, unit):
+    return float(value) * _UNITS[unit]
+
+
+def _gc_records(lines):
+    """
+    Yields the uptime, whether it is a full GC, and the text of each
+    stop-the-world GC event of a log, with the lines of the event joined.
+    The heap dumps of -XX:+PrintHeapAtGC and the tenuring distribution are
+    left out, so that the sizes they interrupt are joined back together.
+    """
+    record = None
+    in_heap_dump = False
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if in_heap_dump:
+            # the dump after a collection ends with '}', and the record may
+            # go on after it; the dump before one ends where it starts
+            if line.startswith('}'):
+                in_heap_dump = False
+                continue
+            if not _STAMPED.match(line):
+                continue
+            in_heap_dump = False
+        if line.startswith('{Heap before GC'):
+            in_heap_dump = True
+            continue
+        if 'Heap after GC' in line:
+            line = line[:line.index('Heap after GC')]
+            in_heap_dump = True
+        if _STAMPED.match(line):
+            if record is not None:
+                yield record
+                record = None
+            match = _EVENT.match(line)
+            if match and 'concurrent' not in line:
+                record = (float(match.group(1)), match.group(2) == 'Full GC', [line])
+        elif record is not None and not _TENURING.match(line):
+            record[2].append(line)
+    if record is not None:
+        yield record
+
+
+def parse_gc_log(lines):
+    """
+    Yields (uptime in seconds, full GC, pause in ms, young bytes before,
+    young bytes after, heap bytes before, heap bytes after) for each
+    stop-the-world GC event of a log. Occupancies are None when the event
+    doesn't report them.
+    """
+    for uptime, full, record_lines in _gc_records(lines):
+        text = _TIMES.sub('', ''.join(record_lines))
+        # the pause of the whole event is the last one, after those of its phases
+        pauses = _PAUSE.findall(text)
+        event = [uptime, full, float(pauses[-1]) * 1000 if pauses else None, None, None, None, None]
+        young = _YOUNG.search(text)
+        sizes = _G1_SIZES.search(text)
+        if young:
+            event[3:] = [int(size) * 1024 for size in young.groups()]
+        elif sizes:
+            eden_before, eden_after, survivors_before, survivors_after, heap_before, heap_after = [
+                _bytes(sizes.group(i), sizes.group(i + 1)) for i in range(1, 13, 2)]
+            event[3:] = [eden_before + survivors_before, eden_after + survivors_after, heap_before, heap_after]
+        yield event
+
+
+def summarize_gc_log(lines):
+    """ Returns the GcSummary of a GC log, given as an iterable of lines. """
+    pauses = []
+    full_gcs = 0
+    allocated = 0
+    promoted = 0
+    previous_young_after = 0
+    first = last = None
+    for uptime, full, pause, young_before, young_after, heap_before, heap_after in parse_gc_log(lines):
+        if pause is None:
+            continue
+        first = uptime if first is None else first
+        last = uptime
+        pauses.append(pause)
+        full_gcs += full
+        if young_before is not None and not full:
+            allocated += max(0, young_before - previous_young_after)
+            promoted += max(0, (young_before - young_after) - (heap_before - heap_after))
+            previous_young_after = young_after
+
+    pauses.sort()
+    elapsed = (last - first) if pauses else 0
+    return GcSummary(pauses=len(pauses),
+                     full_gcs=full_gcs,
+                     total_pause_ms=sum(pauses),
+                     p99_pause_ms=pauses[int(math.ceil(0.99 * len(pauses))) - 1] if pauses else 0,
+                     max_pause_ms=pauses[-1] if pauses else 0,
+                     allocation_rate_mb_per_sec=allocated / (1024.0 * 1024) / elapsed if elapsed else 0,
+                     promoted_bytes=int(promoted),
+                     elapsed_sec=elapsed)
+
+
+def node_gc_summary(node):
+    """ Returns the GcSummary of the node's GC log, or None if it has none. """
+    lines = []
+    for path in gc_log_files(node):
+        with open(path) as f:
+            lines.extend(f)
+    return summarize_gc_log(lines) if lines else None
+
+
+def assert_max_gc_pause(node, ms):
+    """
+    Asserts that no GC pause of `node` lasted more than `ms` milliseconds.
+    GC logging must have been enabled on the node with enable_gc_logging().
+    """
+    summary = node_gc_summary(node)
+    assert summary is not None, "No GC log for {}; GC logging must be enabled before it starts".format(node.name)
+    assert summary.max_pause_ms <= ms, "{} paused for {}ms in GC, more than {}ms: {}".format(
+        node.name, summary.max_pause_ms, ms, summary)
+
+
+def export_gc_logs(nodes, directory):
+    """
+    Copies the GC logs of `nodes` to `directory` as <node>_gc.log, and writes
+    their summaries to gc_summary.json.
+    """
+    summaries = {}
+    for node in nodes:
+        summary = node_gc_summary(node)
+        if summary is None:
+            continue
+        for path in gc_log_files(node):
+            shutil.copyfile(path, os.path.join(directory, node.name + '_' + os.path.basename(path)))
+        summaries[node.name] = summary._asdict()
+    with open(os.path.join(directory, 'gc_summary.json'), 'w') as f:
+        json.dump(summaries, f, indent=2, sort_keys=True)
+    return summaries
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from gclog import assert_max_gc_pause, summarize_gc_log
+
+CMS_LOG = [
+    '2015-09-01T10:00:01.000+0000: 1.000: [GC (Allocation Failure) 1.000: [ParNew: 81920K->10240K(92160K), 0.0100000 secs] '
+    '81920K->10240K(1034240K), 0.0101000 secs] [Times: user=0.03 sys=0.00, real=0.01 secs]',
+    '2015-09-01T10:00:02.000+0000: 2.000: Total time for which application threads were stopped: 0.0102000 seconds',
+    '2015-09-01T10:00:03.000+0000: 3.000: [GC (Allocation Failure) 3.000: [ParNew: 92160K->10240K(92160K), 0.0300000 secs] '
+    '92160K->20480K(1034240K), 0.0302000 secs] [Times: user=0.09 sys=0.00, real=0.03 secs]',
+    '2015-09-01T10:00:04.000+0000: 4.000: [GC (CMS Initial Mark) [1 CMS-initial-mark: 10240K(942080K)] 30720K(1034240K), 0.0050000 secs] '
+    '[Times: user=0.01 sys=0.00, real=0.01 secs]',
+    '2015-09-01T10:00:04.010+0000: 4.010: [CMS-concurrent-mark-start]',
+    '2015-09-01T10:00:04.100+0000: 4.100: [CMS-concurrent-mark: 0.090/0.090 secs] [Times: user=0.18 sys=0.00, real=0.09 secs]',
+    '2015-09-01T10:00:05.000+0000: 5.000: [Full GC (System.gc()) 5.000: [CMS: 10240K->8192K(942080K), 0.2000000 secs] '
+    '30720K->8192K(1034240K), [Metaspace: 20000K->20000K(1067008K)], 0.2001000 secs] [Times: user=0.20 sys=0.00, real=0.20 secs]',
+]
+
+# the format of a gc.log of Cassandra 2.2 on Java 8, with the default flags of
+# cassandra-env.sh: -XX:+PrintHeapAtGC interrupts the heap sizes of each
+# collection, and -XX:+PrintTenuringDistribution the young generation sizes
+CMS_DEFAULT_FLAGS_LOG = """\
+{Heap before GC invocations=0 (full 0):
+ par new generation   total 92160K, used 81920K [0x00000000c0000000, 0x00000000c6400000, 0x00000000c6400000)
+  eden space 81920K, 100% used [0x00000000c0000000, 0x00000000c5000000, 0x00000000c5000000)
+  from space 10240K,   0% used [0x00000000c5000000, 0x00000000c5000000, 0x00000000c5a00000)
+  to   space 10240K,   0% used [0x00000000c5a00000, 0x00000000c5a00000, 0x00000000c6400000)
+ concurrent mark-sweep generation total 942080K, used 0K [0x00000000c6400000, 0x0000000100000000, 0x0000000100000000)
+ Metaspace       used 20000K, capacity 20480K, committed 20736K, reserved 1067008K
+  class space    used 2304K, capacity 2496K, committed 2560K, reserved 1048576K
+2015-09-01T10:00:01.000+0000: 1.000: [GC (Allocation Failure) 2015-09-01T10:00:01.000+0000: 1.000: [ParNew
+Desired survivor size 5242880 bytes, new threshold 1 (max 1)
+- age   1:   10485760 bytes,   10485760 total
+: 81920K->10240K(92160K), 0.0100000 secs] 81920K->10240K(1034240K)Heap after GC invocations=1 (full 0):
+ par new generation   total 92160K, used 10240K [0x00000000c0000000, 0x00000000c6400000, 0x00000000c6400000)
+  eden space 81920K,   0% used [0x00000000c0000000, 0x00000000c0000000, 0x00000000c5000000)
+  from space 10240K, 100% used [0x00000000c5a00000, 0x00000000c6400000, 0x00000000c6400000)
+  to   space 10240K,   0% used [0x00000000c5000000, 0x00000000c5000000, 0x00000000c5a00000)
+ concurrent mark-sweep generation total 942080K, used 0K [0x00000000c6400000, 0x0000000100000000, 0x0000000100000000)
+ Metaspace       used 20000K, capacity 20480K, committed 20736K, reserved 1067008K
+  class space    used 2304K, capacity 2496K, committed 2560K, reserved 1048576K
+}
+, 0.0101000 secs] [Times: user=0.03 sys=0.00, real=0.01 secs]
+2015-09-01T10:00:01.010+0000: 1.010: Total time for which application threads were stopped: 0.0102000 seconds, Stopping threads took: 0.0000100 seconds
+{Heap before GC invocations=1 (full 0):
+ par new generation   total 92160K, used 92160K [0x00000000c0000000, 0x00000000c6400000, 0x00000000c6400000)
+ concurrent mark-sweep generation total 942080K, used 0K [0x00000000c6400000, 0x0000000100000000, 0x0000000100000000)
+2015-09-01T10:00:03.000+0000: 3.000: [GC (Allocation Failure) 2015-09-01T10:00:03.000+0000: 3.000: [ParNew
+Desired survivor size 5242880 bytes, new threshold 1 (max 1)
+- age   1:   10485760 bytes,   10485760 total
+: 92160K->10240K(92160K), 0.0300000 secs] 92160K->20480K(1034240K)Heap after GC invocations=2 (full 0):
+ par new generation   total 92160K, used 10240K [0x00000000c0000000, 0x00000000c6400000, 0x00000000c6400000)
+ concurrent mark-sweep generation total 942080K, used 10240K [0x00000000c6400000, 0x0000000100000000, 0x0000000100000000)
+}
+, 0.0302000 secs] [Times: user=0.09 sys=0.00, real=0.03 secs]
+2015-09-01T10:00:03.030+0000: 3.030: Total time for which application threads were stopped: 0.0303000 seconds, Stopping threads took: 0.0000100 seconds
+"""
+
+G1_LOG = """\
+2015-09-01T10:00:01.000+0000: 1.000: [GC pause (G1 Evacuation Pause) (young), 0.0200000 secs]
+   [Parallel Time: 19.0 ms, GC Workers: 4]
+   [Eden: 24.0M(24.0M)->0.0B(20.0M) Survivors: 0.0B->4096.0K Heap: 24.0M(256.0M)->5120.0K(256.0M)]
+ [Times: user=0.05 sys=0.01, real=0.02 secs]
+2015-09-01T10:00:02.000+0000: 2.000: [GC concurrent-root-region-scan-start]
+2015-09-01T10:00:02.010+0000: 2.010: [GC concurrent-root-region-scan-end, 0.0100000 secs]
+2015-09-01T10:00:03.000+0000: 3.000: [GC pause (G1 Evacuation Pause) (young), 0.0400000 secs]
+   [Eden: 20.0M(20.0M)->0.0B(20.0M) Survivors: 4096.0K->4096.0K Heap: 25.0M(256.0M)->9216.0K(256.0M)]
+ [Times: user=0.10 sys=0.00, real=0.04 secs]
+"""
+
+
+class TestGcLogSummary(TestCase):
+
+    def cms_test(self):
+        summary = summarize_gc_log(CMS_LOG)
+        self.assertEqual(summary.pauses, 4)
+        self.assertEqual(summary.full_gcs, 1)
+        self.assertAlmostEqual(summary.max_pause_ms, 200.1)
+        self.assertAlmostEqual(summary.p99_pause_ms, 200.1)
+        self.assertAlmostEqual(summary.total_pause_ms, 10.1 + 30.2 + 5 + 200.1)
+        self.assertEqual(summary.elapsed_sec, 4.0)
+        # 80MB allocated before the first collection, 80MB before the second
+        self.assertAlmostEqual(summary.allocation_rate_mb_per_sec, 160 / 4.0)
+        # the second collection freed 80MB of young generation but only 70MB of heap
+        self.assertEqual(summary.promoted_bytes, 10 * 1024 * 1024)
+
+    def default_flags_test(self):
+        summary = summarize_gc_log(CMS_DEFAULT_FLAGS_LOG.splitlines(True))
+        self.assertEqual(summary.pauses, 2)
+        self.assertAlmostEqual(summary.total_pause_ms, 10.1 + 30.2)
+        self.assertAlmostEqual(summary.allocation_rate_mb_per_sec, 160 / 2.0)
+        self.assertEqual(summary.promoted_bytes, 10 * 1024 * 1024)
+
+    def g1_test(self):
+        summary = summarize_gc_log(G1_LOG.splitlines())
+        self.assertEqual(summary.pauses, 2)
+        self.assertEqual(summary.full_gcs, 0)
+        self.assertAlmostEqual(summary.max_pause_ms, 40)
+        self.assertAlmostEqual(summary.total_pause_ms, 60)
+        self.assertAlmostEqual(summary.allocation_rate_mb_per_sec, (24 + 20) / 2.0)
+        # 1MB promoted by the first collection, then 20MB of young generation
+        # but only 16MB of heap freed by the second
+        self.assertEqual(summary.promoted_bytes, 5 * 1024 * 1024)
+
+    def empty_test(self):
+        summary = summarize_gc_log([])
+        self.assertEqual(summary.pauses, 0)
+        self.assertEqual(summary.max_pause_ms, 0)
+        self.assertEqual(summary.allocation_rate_mb_per_sec, 0)
+
+
+class FakeNode(object):
+
+    def __init__(self, path):
+        self.name = 'node1'
+        self.path = path
+
+    def get_path(self):
+        return self.path
+
+
+class TestAssertMaxGcPause(TestCase):
+
+    def setUp(self):
+        self.node = FakeNode(tempfile.mkdtemp())
+        os.mkdir(os.path.join(self.node.get_path(), 'logs'))
+
+    def tearDown(self):
+        shutil.rmtree(self.node.get_path())
+
+    def _write_log(self, name, lines):
+        with open(os.path.join(self.node.get_path(), 'logs', name), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def max_pause_test(self):
+        self._write_log('gc.log', CMS_LOG)
+        assert_max_gc_pause(self.node, 250)
+        with self.assertRaisesRegexp(AssertionError, 'paused for 200.1ms'):
+            assert_max_gc_pause(self.node, 100)
+
+    def rotated_log_test(self):
+        # the older part of a rotated log only has the full GC
+        self._write_log('gc.log.0', CMS_LOG[-1:])
+        os.utime(os.path.join(self.node.get_path(), 'logs', 'gc.log.0'), (time.time() - 60,) * 2)
+        self._write_log('gc.log.1.current', CMS_LOG[:2])
+        with self.assertRaisesRegexp(AssertionError, 'paused for 200.1ms'):
+            assert_max_gc_pause(self.node, 100)
+
+    def no_log_test(self):
+        with self.assertRaisesRegexp(AssertionError, 'No GC log'):
+            assert_max_gc_pause(self.node, 100)
@@ -1,9 +1,30 @@
+import itertools
+import os
 import time
 
+from benchreport import BenchmarkReport
 from dtest import Tester, debug
+from jmxutils import JolokiaAgent, make_mbean, remove_perf_disable_shared_mem
+from liveconfig import CACHES, reconfigure
+from loadgen import LoadGenerator, Zipfian
+from tools import benchmark, grep_log_since, since
 
+from cassandra import ConsistencyLevel
 from cassandra.concurrent import execute_concurrent_with_args
 
+# the grid of the cache benchmark: (key cache MB, row cache MB) and the
+# exponents of the Zipfian distribution of the keys read
+BENCHMARK_CACHES = [(0, 0), (10, 0), (100, 0), (10, 10), (10, 100)]
+BENCHMARK_ZIPF_EXPONENTS = [0.8, 1.0, 1.2]
+BENCHMARK_KEYS = 500000
+BENCHMARK_VALUE_SIZE = 256
+BENCHMARK_READS = 200000
+# the reads of each point of the warm-up curve after a restart
+BENCHMARK_WARMUP_READS = 10000
+BENCHMARK_WARMUP_POINTS = 20
+
+CACHE_TYPES = ('KeyCache', 'RowCache')
+
 
 class TestGlobalRowKeyCache(Tester):
 
@@ -11,6 +32,8 @@ class TestGlobalRowKeyCache(Tester):
         cluster = self.cluster
         cluster.populate(3)
         node1 = cluster.nodelist()[0]
+        for node in cluster.nodelist():
+            remove_perf_disable_shared_mem(node)
 
         for keycache_size in (0, 10):
             for rowcache_size in (0, 10):
@@ -18,13 +41,13 @@ class TestGlobalRowKeyCache(Tester):
                       (keycache_size, rowcache_size))
                 keyspace_name = 'ks_%d_%d' % (keycache_size, rowcache_size)
 
-                # make the caches save every five seconds
-                cluster.set_configuration_options(values={
-                    'key_cache_size_in_mb': keycache_size,
-                    'row_cache_size_in_mb': rowcache_size,
-                    'row_cache_save_period': 5,
-                    'key_cache_save_period': 5,
-                })
+                # make the caches save every five seconds; after the first
+                # round the cluster is running and the sizes are changed live
+                reconfigure(cluster.nodelist(),
+                            key_cache_size_in_mb=keycache_size,
+                            row_cache_size_in_mb=rowcache_size,
+                            row_cache_save_period=5,
+                            key_cache_save_period=5)
 
                 cluster.start()
                 session = self.patient_cql_connection(node1)
@@ -142,3 +165,110 @@ class TestGlobalRowKeyCache(Tester):
                 expected_value += validation_round + 1
 
             self.assertEquals(expected_value, row.v2)
+
+    @benchmark
+    @since('2.1')
+    def cache_benchmark_test(self):
+        """
+        Measures the key and row caches of a single node, for every
+        combination of BENCHMARK_CACHES and BENCHMARK_ZIPF_EXPONENTS.
+        BENCHMARK_READS reads of keys drawn from the Zipfian distribution
+        warm the caches up, then as many are measured: the hit ratio of each
+        cache, the read latencies, and the size and entries of the caches
+        are reported to cache.csv and .json in BENCHMARK_DIR.
+
+        The caches are then saved and the node restarted. The time taken to
+        load the saved caches is taken from the log, and the hit ratio of the
+        largest cache is sampled every BENCHMARK_WARMUP_READS reads, as a
+        warm-up curve.
+        """
+        cluster = self.cluster
+        cluster.populate(1)
+        [node] = cluster.nodelist()
+        remove_perf_disable_shared_mem(node)
+        cluster.start(wait_for_binary_proto=True)
+        session = self.patient_cql_connection(node)
+        self.create_ks(session, 'ks', 1)
+        session.execute("CREATE TABLE bench (k int PRIMARY KEY, v blob) WITH caching = {'keys': 'ALL', 'rows_per_partition': 'ALL'}")
+
+        insert = session.prepare("INSERT INTO bench (k, v) VALUES (?, ?)")
+        value = os.urandom(BENCHMARK_VALUE_SIZE)
+        result = LoadGenerator(session).add('write', insert, lambda i: (i, value)).run(count=BENCHMARK_KEYS)
+        self.assertEqual(0, result.errors, result.error_samples)
+        node.flush()
+        node.compact()
+
+        report = BenchmarkReport('cache', version=cluster.version(), keys=BENCHMARK_KEYS)
+        for (key_cache_mb, row_cache_mb), exponent in itertools.product(BENCHMARK_CACHES, BENCHMARK_ZIPF_EXPONENTS):
+            reconfigure([node], key_cache_size_in_mb=key_cache_mb, row_cache_size_in_mb=row_cache_mb)
+            node.nodetool('invalidatekeycache')
+            node.nodetool('invalidaterowcache')
+            keys = Zipfian(BENCHMARK_KEYS, exponent)
+
+            self._read_zipfian(session, keys, BENCHMARK_READS)
+            before = self._cache_stats(node)
+            reads = self._read_zipfian(session, keys, BENCHMARK_READS)
+            after = self._cache_stats(node)
+            result = {'key_cache_mb': key_cache_mb, 'row_cache_mb': row_cache_mb, 'zipf_exponent': exponent,
+                      'reads': reads.report()}
+            for cache in CACHE_TYPES:
+                result[cache] = {'hit_ratio': self._hit_ratio(before, after, cache),
+                                 'size_bytes': after[cache]['size'],
+                                 'entries': after[cache]['entries']}
+
+            if key_cache_mb or row_cache_mb:
+                session = self._restart_with_saved_caches(session, node, result)
+                cache = 'RowCache' if row_cache_mb else 'KeyCache'
+                result['warmup_curve'] = self._warmup_curve(session, node, keys, cache)
+            debug(result)
+            report.add(**result)
+
+    def _read_zipfian(self, session, keys, count):
+        select = session.prepare("SELECT v FROM ks.bench WHERE k = ?")
+        select.consistency_level = ConsistencyLevel.ONE
+        result = LoadGenerator(session, concurrency=50).add('read', select, lambda i: (keys.next(),)).run(count=count)
+        self.assertEqual(0, result.errors, result.error_samples)
+        return result
+
+    def _cache_stats(self, node):
+        """ Returns the hits, requests, size in bytes and entries of each cache in CACHE_TYPES. """
+        names = ('hits', 'requests', 'size', 'entries')
+        requests = [(make_mbean('metrics', type='Cache', scope=cache, name=name), 'Count' if name in ('Hits', 'Requests') else 'Value')
+                    for cache in CACHE_TYPES for name in ('Hits', 'Requests', 'Size', 'Entries')]
+        with JolokiaAgent(node) as jmx:
+            values = jmx.read_attributes(requests)
+        return dict((cache, dict(zip(names, values[i * len(names):(i + 1) * len(names)])))
+                    for i, cache in enumerate(CACHE_TYPES))
+
+    def _hit_ratio(self, before, after, cache):
+        requests = after[cache]['requests'] - before[cache]['requests']
+        return (after[cache]['hits'] - before[cache]['hits']) / float(requests) if requests else None
+
+    def _restart_with_saved_caches(self, session, node, result):
+        """
+        Saves the caches and restarts `node`, adding the startup time and the
+        time taken to load each saved cache to `result`.
+
+        @return a new session on the restarted node
+        """
+        with JolokiaAgent(node) as jmx:
+            jmx.execute_method(CACHES, 'saveCaches')
+        session.cluster.shutdown()
+        node.stop()
+        mark = node.mark_log()
+        start = time.time()
+        node.start(wait_for_binary_proto=True)
+        result['restart_seconds'] = time.time() - start
+        for line, match in grep_log_since(node, r'Completed loading \((\d+) ms; (\d+) keys\) (\w+) cache', mark):
+            result.setdefault(match.group(3), {}).update(saved_load_ms=int(match.group(1)), saved_keys=int(match.group(2)))
+        return self.patient_cql_connection(node)
+
+    def _warmup_curve(self, session, node, keys, cache):
+        """ Returns the hit ratio of `cache` over each BENCHMARK_WARMUP_READS reads, with the seconds elapsed. """
+        curve = []
+        start = time.time()
+        for _ in range(BENCHMARK_WARMUP_POINTS):
+            before = self._cache_stats(node)
+            self._read_zipfian(session, keys, BENCHMARK_WARMUP_READS)
+            curve.append({'seconds': time.time() - start, 'hit_ratio': self._hit_ratio(before, self._cache_stats(node), cache)})
+        return curve
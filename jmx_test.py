@@ -1,7 +1,9 @@
 from flaky import flaky
 
 from dtest import Tester, debug
-from jmxutils import JolokiaAgent, make_mbean, remove_perf_disable_shared_mem
+from jmxutils import (JolokiaAgent, get_logging_levels, logging_levels,
+                      make_mbean, remove_perf_disable_shared_mem,
+                      set_logging_levels)
 from tools import since
 
 
@@ -119,3 +121,31 @@ class TestJMX(Tester):
 
             sstables = jmx.read_attribute(sstable_count, "Value")
             self.assertGreaterEqual(int(sstables), 1)
+
+    @since('2.1')
+    def logging_levels_test(self):
+        """
+        Logger levels changed over JMX take effect on a running node, and
+        the logging_levels context manager restores the previous levels.
+        """
+        cluster = self.cluster
+        cluster.populate(2)
+        for node in cluster.nodelist():
+            remove_perf_disable_shared_mem(node)
+        cluster.start(wait_for_binary_proto=True)
+        node1, node2 = cluster.nodelist()
+
+        logger = 'org.apache.cassandra.db.compaction'
+        set_logging_levels([node1], {'org.apache.cassandra.gms': 'DEBUG'})
+        before = get_logging_levels(node1)
+        self.assertEqual('DEBUG', before['org.apache.cassandra.gms'])
+        self.assertNotIn(logger, before)
+
+        with logging_levels(cluster.nodelist(), {logger: 'TRACE', 'org.apache.cassandra.gms': 'TRACE'}):
+            for node in cluster.nodelist():
+                levels = get_logging_levels(node)
+                self.assertEqual('TRACE', levels[logger])
+                self.assertEqual('TRACE', levels['org.apache.cassandra.gms'])
+
+        self.assertEqual(before, get_logging_levels(node1))
+        self.assertNotIn('org.apache.cassandra.gms', get_logging_levels(node2))
@@ -0,0 +1,215 @@
+"""
+Declarative assertions on how JMX metrics change across a section of a test.
+
+Expectations pair an mbean name or pattern with an attribute and a rule.
+Patterns are expanded with a Jolokia search on every node, and all matching
+attributes are read in one bulk request per node, so a rule can cover every
+table of a large schema at little cost. Every violation on every node is
+reported, not just the first one.
+
+Example usage:
+
+    expectations = MetricExpectations(cluster.nodelist())
+    expectations.expect(make_mbean('metrics', type='ColumnFamily', keyspace='ks', scope='cf', name='LiveSSTableCount'),
+                        'Value', Increases())
+    expectations.expect(make_mbean('metrics', type='ColumnFamily', keyspace='ks', name='PendingCompactions') + ',*',
+                        'Value', Delta(max=10))
+    before = expectations.snapshot()
+    node.stress(['write', 'n=100K'])
+    after = expectations.snapshot()
+    assert_metrics(expectations, before, after)
+
+As with any use of jmxutils, remove_perf_disable_shared_mem must be called
+on the nodes before they are started.
+"""
+from collections import namedtuple
+
+from jmxutils import JolokiaAgent, JolokiaError
+
+# The state of the metrics of one node: `matches` maps each pattern to the
+# mbean names it matched, and `values` maps (mbean, attribute) to the value
+# read, or to the JolokiaError of a failed read.
+MetricSnapshot = namedtuple('MetricSnapshot', ['matches', 'values'])
+
+
+def with_property(mbean, key, value):
+    """
+    Returns `mbean` with the value of its `key` property replaced, e.g. the
+    name of a sibling metric of the same table.
+    """
+    domain, properties = mbean.split(':', 1)
+    replaced = []
+    for prop in properties.split(','):
+        name = prop.split('=', 1)[0]
+        replaced.append('{}={}'.format(key, value) if name == key else prop)
+    return '{}:{}'.format(domain, ','.join(replaced))
+
+
+class MetricRule(object):
+    """
+    Base class of the rules. check() returns a description of the violation,
+    or None if the rule holds.
+    """
+
+    # whether the rule compares the value with the one before
+    needs_before = True
+
+    def related(self, mbean, attribute):
+        """ Returns other (mbean, attribute) pairs the rule needs to read. """
+        return []
+
+    def check(self, mbean, attribute, before, after, values):
+        raise NotImplementedError()
+
+
+class Increases(MetricRule):
+    """ The value is strictly greater afterwards. """
+
+    def check(self, mbean, attribute, before, after, values):
+        if not after > before:
+            return 'did not increase'
+
+
+class Decreases(MetricRule):
+    """ The value is strictly lower afterwards. """
+
+    def check(self, mbean, attribute, before, after, values):
+        if not after < before:
+            return 'did not decrease'
+
+
+class Monotonic(MetricRule):
+    """ The value never went backwards, e.g. for a counter. """
+
+    def __init__(self, decreasing=False):
+        self.decreasing = decreasing
+
+    def check(self, mbean, attribute, before, after, values):
+        if (after > before) if self.decreasing else (after < before):
+            return 'went {}'.format('up' if self.decreasing else 'down')
+
+
+class Unchanged(MetricRule):
+    """ The value is the same afterwards. """
+
+    def check(self, mbean, attribute, before, after, values):
+        if after != before:
+            return 'changed'
+
+
+class Equals(MetricRule):
+    """ The value afterwards is `expected`, whatever it was before. """
+
+    needs_before = False
+
+    def __init__(self, expected):
+        self.expected = expected
+
+    def check(self, mbean, attribute, before, after, values):
+        if after != self.expected:
+            return 'is not {}'.format(self.expected)
+
+
+class Delta(MetricRule):
+    """ The change of the value is within [min, max]; either bound may be omitted. """
+
+    def __init__(self, min=None, max=None):
+        self.min = min
+        self.max = max
+
+    def check(self, mbean, attribute, before, after, values):
+        delta = after - before
+        if (self.min is not None and delta < self.min) or (self.max is not None and delta > self.max):
+            return 'changed by {}, outside [{}, {}]'.format(delta, self.min, self.max)
+
+
+class Ratio(MetricRule):
+    """
+    The value afterwards divided by the value of the sibling metric `other`,
+    the same mbean with `other` as its name property, is within [min, max].
+    """
+
+    needs_before = False
+
+    def __init__(self, other, min=None, max=None, attribute=None):
+        self.other = other
+        self.min = min
+        self.max = max
+        self.attribute = attribute
+
+    def related(self, mbean, attribute):
+        return [(with_property(mbean, 'name', self.other), self.attribute or attribute)]
+
+    def check(self, mbean, attribute, before, after, values):
+        other = values.get(self.related(mbean, attribute)[0])
+        if other is None or isinstance(other, JolokiaError):
+            return 'has no readable {} to compare with'.format(self.other)
+        if not other:
+            return 'has a zero {}'.format(self.other)
+        ratio = float(after) / other
+        if (self.min is not None and ratio < self.min) or (self.max is not None and ratio > self.max):
+            return 'is {} times {}, outside [{}, {}]'.format(ratio, self.other, self.min, self.max)
+
+
+class MetricExpectations(object):
+    """
+    A set of (pattern, attribute, rule) expectations on the metrics of
+    `nodes`, checked against two snapshots.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self.expectations = []
+
+    def expect(self, pattern, attribute, rule):
+        self.expectations.append((pattern, attribute, rule))
+        return self
+
+    def snapshot(self):
+        """ Returns a dict of node name -> MetricSnapshot. """
+        patterns = sorted(set(pattern for pattern, _, _ in self.expectations))
+        snapshots = {}
+        for node in self.nodes:
+            with JolokiaAgent(node) as jmx:
+                matches = dict(zip(patterns, jmx.search_mbeans(patterns)))
+                requests = []
+                for pattern, attribute, rule in self.expectations:
+                    for mbean in matches[pattern]:
+                        requests.append((mbean, attribute))
+                        requests.extend(rule.related(mbean, attribute))
+                requests = sorted(set(requests))
+                values = dict(zip(requests, jmx.read_attributes(requests, raise_errors=False)))
+            snapshots[node.name] = MetricSnapshot(matches, values)
+        return snapshots
+
+    def violations(self, before, after):
+        """ Returns a description of every expectation that doesn't hold, on every node. """
+        violations = []
+        for node in self.nodes:
+            node_before, node_after = before[node.name], after[node.name]
+            for pattern in sorted(node_after.matches):
+                mbeans = node_after.matches[pattern]
+                if not mbeans:
+                    violations.append('{}: no mbean matches {}'.format(node.name, pattern))
+                for mbean in sorted(set(node_before.matches[pattern]) - set(mbeans)):
+                    violations.append('{}: {} disappeared'.format(node.name, mbean))
+            for pattern, attribute, rule in self.expectations:
+                for mbean in node_after.matches[pattern]:
+                    value = node_after.values[(mbean, attribute)]
+                    previous = node_before.values.get((mbean, attribute))
+                    described = '{}: {} {} (before: {}, after: {})'.format(node.name, mbean, attribute, previous, value)
+                    if isinstance(value, JolokiaError) or isinstance(previous, JolokiaError):
+                        violations.append('{} could not be read'.format(described))
+                    elif rule.needs_before and previous is None:
+                        violations.append('{} did not exist before'.format(described))
+                    else:
+                        message = rule.check(mbean, attribute, previous, value, node_after.values)
+                        if message is not None:
+                            violations.append('{} {}'.format(described, message))
+        return violations
+
+
+def assert_metrics(expectations, before, after):
+    """ Asserts that every expectation holds between the `before` and `after` snapshots. """
+    violations = expectations.violations(before, after)
+    assert not violations, "{} metric expectation(s) failed:\n{}".format(len(violations), '\n'.join(violations))
@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from jmxassertions import (Decreases, Delta, Equals, Increases, MetricExpectations, MetricSnapshot, Monotonic, Ratio,
+                           Unchanged, assert_metrics, with_property)
+from jmxutils import JolokiaError
+
+TABLE = 'org.apache.cassandra.metrics:type=ColumnFamily,keyspace=ks,scope={},name={}'
+HITS = 'org.apache.cassandra.metrics:type=Cache,scope=KeyCache,name=Hits'
+REQUESTS = 'org.apache.cassandra.metrics:type=Cache,scope=KeyCache,name=Requests'
+
+
+class FakeNode(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+def snapshot(matches, values):
+    return {'node1': MetricSnapshot(matches, values)}
+
+
+class TestMetricExpectations(TestCase):
+
+    def _violations(self, rule, before, after, mbean=HITS, attribute='Count', after_values=None):
+        expectations = MetricExpectations([FakeNode('node1')]).expect(mbean, attribute, rule)
+        values = dict(after_values or {})
+        values[(mbean, attribute)] = after
+        before_values = {} if before is None else {(mbean, attribute): before}
+        return expectations.violations(snapshot({mbean: [mbean]}, before_values), snapshot({mbean: [mbean]}, values))
+
+    def with_property_test(self):
+        self.assertEqual(REQUESTS, with_property(HITS, 'name', 'Requests'))
+        self.assertEqual(TABLE.format('t2', 'Hits'), with_property(TABLE.format('t1', 'Hits'), 'scope', 't2'))
+
+    def rules_test(self):
+        for rule, passing, failing in [(Increases(), (1, 2), (2, 2)),
+                                       (Decreases(), (2, 1), (1, 1)),
+                                       (Monotonic(), (1, 1), (2, 1)),
+                                       (Monotonic(decreasing=True), (2, 1), (1, 2)),
+                                       (Unchanged(), (3, 3), (3, 4)),
+                                       (Equals(5), (1, 5), (5, 6)),
+                                       (Delta(min=2, max=4), (10, 13), (10, 11)),
+                                       (Delta(max=4), (10, 5), (10, 15))]:
+            self.assertEqual([], self._violations(rule, *passing), rule)
+            self.assertEqual(1, len(self._violations(rule, *failing)), rule)
+
+        [violation] = self._violations(Delta(min=2, max=4), 10, 15)
+        self.assertEqual('node1: {} Count (before: 10, after: 15) changed by 5, outside [2, 4]'.format(HITS), violation)
+        # a rule comparing with the value before needs it
+        self.assertEqual(['node1: {} Count (before: None, after: 1) did not exist before'.format(HITS)],
+                         self._violations(Increases(), None, 1))
+        self.assertEqual([], self._violations(Equals(1), None, 1))
+        [violation] = self._violations(Unchanged(), 1, JolokiaError({'status': 404}))
+        self.assertTrue(violation.endswith('could not be read'), violation)
+
+    def ratio_test(self):
+        rule = Ratio('Requests', min=0.5, max=1)
+        self.assertEqual([(REQUESTS, 'Count')], rule.related(HITS, 'Count'))
+        self.assertEqual([], self._violations(rule, None, 60, after_values={(REQUESTS, 'Count'): 100}))
+        for requests, message in [(200, 'is 0.3 times Requests, outside [0.5, 1]'),
+                                  (0, 'has a zero Requests'),
+                                  (None, 'has no readable Requests to compare with'),
+                                  (JolokiaError({'status': 404}), 'has no readable Requests to compare with')]:
+            after_values = {} if requests is None else {(REQUESTS, 'Count'): requests}
+            [violation] = self._violations(rule, None, 60, after_values=after_values)
+            self.assertTrue(violation.endswith(message), violation)
+
+    def wildcard_test(self):
+        pattern = TABLE.format('*', 'LiveSSTableCount')
+        empty = TABLE.format('*', 'NoSuchMetric')
+        expectations = (MetricExpectations([FakeNode('node1')])
+                        .expect(pattern, 'Value', Increases())
+                        .expect(empty, 'Value', Unchanged()))
+        a, b, c = [TABLE.format(t, 'LiveSSTableCount') for t in ('a', 'b', 'c')]
+        before = snapshot({pattern: [a, b, c], empty: []}, {(a, 'Value'): 1, (b, 'Value'): 4, (c, 'Value'): 1})
+        after = snapshot({pattern: [a, b], empty: []}, {(a, 'Value'): 2, (b, 'Value'): 4})
+
+        self.assertEqual(['node1: {} disappeared'.format(c),
+                          'node1: no mbean matches {}'.format(empty),
+                          'node1: {} Value (before: 4, after: 4) did not increase'.format(b)],
+                         expectations.violations(before, after))
+        with self.assertRaises(AssertionError):
+            assert_metrics(expectations, before, after)
+
+        after = snapshot({pattern: [a, b, c], empty: [TABLE.format('a', 'NoSuchMetric')]},
+                         {(a, 'Value'): 2, (b, 'Value'): 5, (c, 'Value'): 3, (TABLE.format('a', 'NoSuchMetric'), 'Value'): 0})
+        before['node1'].matches[empty].append(TABLE.format('a', 'NoSuchMetric'))
+        before['node1'].values[(TABLE.format('a', 'NoSuchMetric'), 'Value')] = 0
+        assert_metrics(expectations, before, after)
@@ -1,34 +1,38 @@
 from dtest import Tester
-from jmxutils import JolokiaAgent, make_mbean, remove_perf_disable_shared_mem
+from jmxassertions import (Decreases, Equals, Increases, MetricExpectations,
+                           Unchanged, assert_metrics)
+from jmxutils import make_mbean, remove_perf_disable_shared_mem
 
-# Currently only have attributes that are incrementing. 
-# MBEAN_VALUES are expressed in tuple with the first value being the class, 
-# the package (may be tuple), the attribute, and then the value. 
-MBEAN_VALUES_PRE = [('metrics', ('ColumnFamily', 'AllMemtablesLiveDataSize'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'AllMemtablesHeapSize'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'AllMemtablesOffHeapSize'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'BloomFilterDiskSpaceUsed'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'BloomFilterFalsePositives'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'IndexSummaryOffHeapMemoryUsed'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'LiveDiskSpaceUsed'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'LiveSSTableCount'), 'Value', 'MBeanIncrement'), 
-                        ('metrics', ('ColumnFamily', 'MemtableColumnsCount'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'MemtableLiveDataSize'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'MemtableOnHeapSize'), 'Value', 'MBeanIncrement'),
-                        ('metrics', ('ColumnFamily', 'MemtableSwitchCount'), 'Value', 'MBeanIncrement'),
-                        ('db', 'IndexSummaries', 'MemoryPoolSizeInMB', 'MBeanIncrement'),
-                        ('db', 'IndexSummaries', 'IndexIntervals', 'MBeanIncrement'),
-                        ('db', 'Caches', 'CounterCacheKeysToSave', 2147483647),
-                        ('db', 'Caches', 'CounterCacheSavePeriodInSeconds', 7200),
-                        ('metrics', ('ColumnFamily', 'MaxRowSize'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'MemtableOffHeapSize'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'MinRowSize'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'PendingCompactions'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'RowCacheHit'), 'Value', 'MBeanEqual'),
-                        ('metrics', ('ColumnFamily', 'CompressionRatio'), 'Value', 'MBeanDecrement'),
-                        ('metrics', ('ColumnFamily', 'MeanRowSize'), 'Value', 'MBeanDecrement'),
-                        ('db', 'BatchlogManager', 'TotalBatchesReplayed', 0),
-                        ('db', 'Caches', 'RowCacheSavePeriodInSeconds', 0)]
+
+def table_metric(name):
+    return make_mbean('metrics', type='ColumnFamily', name=name)
+
+# The (mbean, attribute, rule) expectations on metrics across a write load.
+MBEAN_VALUES_PRE = [(table_metric('AllMemtablesLiveDataSize'), 'Value', Increases()),
+                    (table_metric('AllMemtablesHeapSize'), 'Value', Increases()),
+                    (table_metric('AllMemtablesOffHeapSize'), 'Value', Unchanged()),
+                    (table_metric('BloomFilterDiskSpaceUsed'), 'Value', Increases()),
+                    (table_metric('BloomFilterFalsePositives'), 'Value', Unchanged()),
+                    (table_metric('IndexSummaryOffHeapMemoryUsed'), 'Value', Increases()),
+                    (table_metric('LiveDiskSpaceUsed'), 'Value', Increases()),
+                    (table_metric('LiveSSTableCount'), 'Value', Increases()),
+                    (table_metric('MemtableColumnsCount'), 'Value', Increases()),
+                    (table_metric('MemtableLiveDataSize'), 'Value', Increases()),
+                    (table_metric('MemtableOnHeapSize'), 'Value', Increases()),
+                    (table_metric('MemtableSwitchCount'), 'Value', Increases()),
+                    (make_mbean('db', 'IndexSummaries'), 'MemoryPoolSizeInMB', Increases()),
+                    (make_mbean('db', 'IndexSummaries'), 'IndexIntervals', Increases()),
+                    (make_mbean('db', 'Caches'), 'CounterCacheKeysToSave', Equals(2147483647)),
+                    (make_mbean('db', 'Caches'), 'CounterCacheSavePeriodInSeconds', Equals(7200)),
+                    (table_metric('MaxRowSize'), 'Value', Unchanged()),
+                    (table_metric('MemtableOffHeapSize'), 'Value', Unchanged()),
+                    (table_metric('MinRowSize'), 'Value', Unchanged()),
+                    (table_metric('PendingCompactions'), 'Value', Unchanged()),
+                    (table_metric('RowCacheHit'), 'Value', Unchanged()),
+                    (table_metric('CompressionRatio'), 'Value', Decreases()),
+                    (table_metric('MeanRowSize'), 'Value', Decreases()),
+                    (make_mbean('db', 'BatchlogManager'), 'TotalBatchesReplayed', Equals(0)),
+                    (make_mbean('db', 'Caches'), 'RowCacheSavePeriodInSeconds', Equals(0))]
 
 # MBEAN_VALUES_POST_3.0 = 
 
@@ -41,9 +45,8 @@ class TestJMXMetrics(Tester):
         """
         @jira_ticket CASSANDRA-7436
         This test measures the values of MBeans before and after running a load. We expect 
-        the values to change a certain way, and thus deem them as 'MBeanEqual','MBeanDecrement', 
-        'MBeanIncrement', or a constant to experss this expected change. If the value does not reflect
-        this expected change, then it raises an AssertionError. 
+        the values to change a certain way, expressed as the jmxassertions rules in MBEAN_VALUES_PRE.
+        Every MBean whose value does not reflect the expected change is reported in the AssertionError.
         """
         cluster = self.cluster
         cluster.populate(1)
@@ -74,47 +77,15 @@ class TestJMXMetrics(Tester):
                             AND speculative_retry = 'NONE';
                         """)
 
-        with JolokiaAgent(node) as jmx:
-            before = []
-            mbeans = []
-            errors = []
-            for package, bean, attribute, expected in MBEAN_VALUES_PRE:
-                # In the case that the file name is longer, then we put it in the form of tuple in bean.
-                if type(bean) == tuple:
-                    mbean = make_mbean(package, type = bean[0], name = bean[1])
-                else:
-                    mbean = make_mbean(package, bean)
-                mbeans.append(mbean)
-                before.append(jmx.read_attribute(mbean, attribute))
-
-            if cluster.version() < "2.1":
-                node.stress(['-o', 'insert', '-n', '100000', '-p', '7100'])
-            else: 
-                node.stress(['write', 'n=100K', '-port jmx=7100'])
-
-            attr_counter = 0
-            for package, bean, attribute, expected in MBEAN_VALUES_PRE:
-                a_value = jmx.read_attribute(mbeans[attr_counter], attribute)
-                b_value = before[attr_counter]
-                if expected == 'MBeanIncrement':
-                    if b_value >= a_value:
-                        errors.append(mbeans[attr_counter] + " has a before value of " + str(b_value) + " and after value of " + str(a_value) + " and did not increment" + "\n")
-                elif expected == 'MBeanDecrement':
-                    if b_value <= a_value:
-                        errors.append(mbeans[attr_counter] + " has a before value of " + str(b_value) + " and after value of " + str(a_value) + " and did not decrement" + "\n")
-                elif expected == 'MBeanEqual':
-                    if b_value != a_value:
-                        errors.append(mbeans[attr_counter] + " has a before value of " + str(b_value) + " and after value of " + str(a_value) + ", which are not equal" + "\n")
-                elif expected == 'MBeanZero':
-                    if not (b_value == 0 and a_value == 0):
-                        errors.append(mbeans[attr_counter] + " has a before value of " + str(b_value) + " and after value of " + str(a_value) + " and they do not equal zero" + "\n")
-                # If expected is none of the above, then expected should be a number.
-                else:
-                    if a_value != expected:
-                        errors.append(mbeans[attr_counter] + " has an after value of " + str(a_value) + " which does not equal " + str(expected) + "\n")
-                attr_counter += 1
-
-            self.assertEqual(len(errors), 0, "\n" + "\n".join(errors))
-
+        expectations = MetricExpectations([node])
+        for mbean, attribute, rule in MBEAN_VALUES_PRE:
+            expectations.expect(mbean, attribute, rule)
+        before = expectations.snapshot()
 
+        if cluster.version() < "2.1":
+            node.stress(['-o', 'insert', '-n', '100000', '-p', '7100'])
+        else:
+            node.stress(['write', 'n=100K', '-port jmx=7100'])
 
+        after = expectations.snapshot()
+        assert_metrics(expectations, before, after)
@@ -0,0 +1,242 @@
+"""
+A nodetool that talks to the node over JMX through a Jolokia agent, instead
+of launching a nodetool JVM for every command.
+
+Common subcommands are mapped to the StorageService, StorageProxy and
+GCInspector MBeans and return structured results rather than text. Anything
+else, including supported subcommands with options that aren't mapped, is
+passed to the real nodetool binary.
+
+Operations that block until they are done, such as compact, cleanup, scrub
+and drain, are left to the binary: they can outlast the timeout of a
+Jolokia request, and the agent answers one request at a time, so they
+would hold up every other JMX reader of the node meanwhile.
+
+Example usage:
+
+    with JmxNodetool(node) as nodetool:
+        nodetool.flush('ks', 'cf')
+        for endpoint in nodetool.status():
+            assert endpoint.status == 'U'
+        out, err = nodetool('compact ks cf')   # runs the binary
+
+Used as a context manager, the HTTP connection to the agent is closed on
+exit, so that a later context on a restarted node starts afresh.
+
+As with any use of jmxutils, remove_perf_disable_shared_mem must be called
+on the node before it is started. If the agent can't be attached, every
+command falls back to the binary, and returns its (stdout, stderr) rather
+than a structured result.
+"""
+import functools
+import math
+import subprocess
+
+from jmxutils import JolokiaAgent, make_mbean
+from tooloutput import EndpointStatus, GcStats, parse_size
+
+STORAGE_SERVICE = make_mbean('db', 'StorageService')
+STORAGE_PROXY = make_mbean('db', 'StorageProxy')
+ENDPOINT_SNITCH_INFO = make_mbean('db', 'EndpointSnitchInfo')
+GC_INSPECTOR = make_mbean('service', 'GCInspector')
+
+
+def _address(endpoint):
+    # InetAddress keys are serialized as 'hostname/address'
+    return endpoint.split('/')[-1]
+
+
+def _token_key(token):
+    try:
+        return (0, int(token))
+    except ValueError:
+        return (1, token)
+
+
+def _or_binary(command):
+    """
+    Decorates the method running nodetool `command` over JMX so that it
+    runs the binary with the same arguments when the agent can't be
+    attached.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def run(self, *args):
+            if self._attach():
+                return method(self, *args)
+            return self.node.nodetool(' '.join([command] + [str(arg) for arg in args]), capture_output=True)
+        return run
+    return decorate
+
+
+class JmxNodetool(object):
+    """
+    Runs nodetool subcommands on `node` over JMX. Each supported subcommand
+    is a method taking the same arguments as the command line; calling the
+    object with a command line string runs the matching method, or the real
+    nodetool binary.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.agent = JolokiaAgent(node)
+        self.available = True
+
+    def __call__(self, cmd):
+        """
+        Runs the command line `cmd`. Returns the structured result of the
+        mapped method, or the (stdout, stderr) of the nodetool binary for
+        commands that aren't mapped.
+        """
+        args = cmd.split()
+        command = self._commands().get(args[0].lower()) if args else None
+        if command is not None and self._attach():
+            parsed = command(args[1:])
+            if parsed is not None:
+                method, method_args, kwargs = parsed
+                return method(*method_args, **kwargs)
+        return self.node.nodetool(cmd, capture_output=True)
+
+    def _commands(self):
+        def positional(method):
+            # commands taking only positional arguments, like `flush ks cf`
+            return lambda args: None if any(a.startswith('-') for a in args) else (method, args, {})
+
+        def setcompactionthroughput(args):
+            return (self.setcompactionthroughput, [int(args[0])], {}) if len(args) == 1 else None
+
+        return {
+            'flush': positional(self.flush),
+            'enablehandoff': positional(self.enablehandoff),
+            'disablehandoff': positional(self.disablehandoff),
+            'statushandoff': positional(self.statushandoff),
+            'setcompactionthroughput': setcompactionthroughput,
+            'getcompactionthroughput': positional(self.getcompactionthroughput),
+            'gcstats': positional(self.gcstats),
+            'status': positional(self.status),
+            'ring': positional(self.ring),
+        }
+
+    def _attach(self):
+        if self.available:
+            try:
+                self.agent.attach()
+            except subprocess.CalledProcessError:
+                self.available = False
+        return self.available
+
+    # the methods using these are decorated with _or_binary, which attaches
+    # the agent first
+
+    def _execute(self, mbean, operation, arguments=None):
+        return self.agent.execute_method(mbean, operation, arguments)
+
+    def _read(self, mbean, attribute):
+        return self.agent.read_attribute(mbean, attribute)
+
+    def _write(self, mbean, attribute, value):
+        self.agent.write_attribute(mbean, attribute, value)
+
+    def _keyspaces(self, keyspace, attribute='Keyspaces'):
+        return [keyspace] if keyspace is not None else self._read(STORAGE_SERVICE, attribute)
+
+    def close(self):
+        self.agent.close()
+
+    def __enter__(self):
+        """ For contextmanager-style usage. """
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        """ For contextmanager-style usage. """
+        self.close()
+        return exc_type is None
+
+    @_or_binary('flush')
+    def flush(self, keyspace=None, *tables):
+        for ks in self._keyspaces(keyspace):
+            self._execute(STORAGE_SERVICE, 'forceKeyspaceFlush', [ks, list(tables)])
+
+    @_or_binary('enablehandoff')
+    def enablehandoff(self):
+        self._write(STORAGE_PROXY, 'HintedHandoffEnabled', True)
+
+    @_or_binary('disablehandoff')
+    def disablehandoff(self):
+        self._write(STORAGE_PROXY, 'HintedHandoffEnabled', False)
+
+    @_or_binary('statushandoff')
+    def statushandoff(self):
+        return self._read(STORAGE_PROXY, 'HintedHandoffEnabled')
+
+    @_or_binary('setcompactionthroughput')
+    def setcompactionthroughput(self, mb_per_sec):
+        self._write(STORAGE_SERVICE, 'CompactionThroughputMbPerSec', mb_per_sec)
+
+    @_or_binary('getcompactionthroughput')
+    def getcompactionthroughput(self):
+        return self._read(STORAGE_SERVICE, 'CompactionThroughputMbPerSec')
+
+    @_or_binary('gcstats')
+    def gcstats(self):
+        """ Returns the GcStats since the previous call, and resets them. """
+        # getAndResetStats() is exposed as the AndResetStats attribute
+        stats = self._read(GC_INSPECTOR, 'AndResetStats')
+        interval, max_elapsed, total, sum_of_squares, reclaimed, collections = stats[:6]
+        # the direct memory in use was added as a seventh statistic in 3.0
+        direct_memory = stats[6] if len(stats) > 6 else None
+        if collections:
+            mean = total / collections
+            stdev = math.sqrt(max(0, sum_of_squares / collections - mean * mean))
+        else:
+            stdev = float('nan')
+        return GcStats(interval, max_elapsed, total, stdev, reclaimed, collections, direct_memory)
+
+    @_or_binary('status')
+    def status(self):
+        """ Returns an EndpointStatus for every endpoint of the ring, sorted by address. """
+        attributes = ['LiveNodes', 'UnreachableNodes', 'JoiningNodes', 'LeavingNodes', 'MovingNodes',
+                      'LoadMap', 'TokenToEndpointMap', 'Ownership', 'HostIdMap']
+        values = dict(zip(attributes, self.agent.read_attributes([(STORAGE_SERVICE, a) for a in attributes])))
+
+        tokens = {}
+        for endpoint in values['TokenToEndpointMap'].values():
+            tokens[endpoint] = tokens.get(endpoint, 0) + 1
+        ownership = dict((_address(endpoint), owns) for endpoint, owns in values['Ownership'].items())
+        states = [('J', values['JoiningNodes']), ('L', values['LeavingNodes']), ('M', values['MovingNodes'])]
+        live = set(values['LiveNodes'])
+
+        addresses = sorted(set(tokens) | live | set(values['UnreachableNodes']) | set(values['JoiningNodes']))
+        locations = self.agent.execute_methods([(ENDPOINT_SNITCH_INFO, operation, [address])
+                                                for address in addresses
+                                                for operation in ('getDatacenter', 'getRack')])
+        result = []
+        for i, address in enumerate(addresses):
+            state = ([code for code, endpoints in states if address in endpoints] or ['N'])[0]
+            result.append(EndpointStatus(address=address,
+                                         datacenter=locations[2 * i],
+                                         rack=locations[2 * i + 1],
+                                         status='U' if address in live else 'D',
+                                         state=state,
+                                         load=parse_size(values['LoadMap'].get(address, '?')),
+                                         tokens=tokens.get(address, 0),
+                                         owns=ownership.get(address, 0.0),
+                                         host_id=values['HostIdMap'].get(address)))
+        return result
+
+    @_or_binary('ring')
+    def ring(self):
+        """ Returns the (token, address) pairs of the ring, in token order. """
+        token_map = self._read(STORAGE_SERVICE, 'TokenToEndpointMap')
+        return sorted(token_map.items(), key=lambda item: _token_key(item[0]))
+
+
+def flush_nodes(nodes):
+    """
+    Flushes every table on each of the running `nodes`, like
+    cluster.flush(), without launching a nodetool JVM per node.
+    """
+    for node in nodes:
+        if node.is_running():
+            with JmxNodetool(node) as nodetool:
+                nodetool.flush()
@@ -0,0 +1,85 @@
+from dtest import Tester
+from jmxnodetool import JmxNodetool
+from jmxutils import remove_perf_disable_shared_mem
+from tools import since
+
+
+class TestJmxNodetool(Tester):
+    """
+    Checks that JmxNodetool agrees with the nodetool binary.
+    """
+
+    def _prepare(self, nodes=1):
+        cluster = self.cluster
+        cluster.populate(nodes)
+        for node in cluster.nodelist():
+            remove_perf_disable_shared_mem(node)
+        cluster.start(wait_for_binary_proto=True)
+        return cluster.nodelist()[0]
+
+    def status_and_ring_test(self):
+        """
+        The endpoints, states and tokens reported by status() and ring()
+        match the output of `nodetool status` and `nodetool ring`.
+        """
+        node1 = self._prepare(3)
+        nodetool = JmxNodetool(node1)
+
+        statuses = nodetool.status()
+        out, err = node1.nodetool('status', capture_output=True)
+        lines = [line.split() for line in out.splitlines() if line[:2] in ('UN', 'DN', 'UL', 'UJ', 'UM')]
+        self.assertEqual(sorted((line[1], line[0]) for line in lines),
+                         [(s.address, s.status + s.state) for s in statuses])
+        self.assertEqual(set(['datacenter1']), set(s.datacenter for s in statuses))
+
+        ring = nodetool.ring()
+        out, err = node1.nodetool('ring', capture_output=True)
+        binary_tokens = [line.split()[-1] for line in out.splitlines() if line[:1].isdigit()]
+        self.assertEqual(sorted(binary_tokens), sorted(token for token, _ in ring))
+        self.assertEqual(sum(s.tokens for s in statuses), len(ring))
+
+        node1.stop(wait_other_notice=True)
+        node2 = self.cluster.nodelist()[1]
+        statuses = dict((s.address, s.status) for s in JmxNodetool(node2).status())
+        self.assertEqual('D', statuses[node1.address()])
+
+    def operations_test(self):
+        """
+        Flushes and settings applied through JmxNodetool take effect, and
+        compactions and unmapped commands fall back to the binary.
+        """
+        node1 = self._prepare()
+        session = self.patient_cql_connection(node1)
+        self.create_ks(session, 'ks', 1)
+        session.execute("CREATE TABLE t (k int PRIMARY KEY, v int)")
+        nodetool = JmxNodetool(node1)
+
+        for flush in range(2):
+            for k in range(10):
+                session.execute("INSERT INTO t (k, v) VALUES ({}, {})".format(k, flush))
+            nodetool('flush ks t')
+        self.assertEqual(2, len(node1.get_sstables('ks', 't')))
+        out, err = nodetool('compact ks t')
+        self.assertEqual('', err)
+        self.assertEqual(1, len(node1.get_sstables('ks', 't')))
+
+        nodetool('setcompactionthroughput 42')
+        self.assertEqual(42, nodetool('getcompactionthroughput'))
+        out, err = node1.nodetool('getcompactionthroughput', capture_output=True)
+        self.assertIn('42', out)
+
+        nodetool('disablehandoff')
+        self.assertFalse(nodetool('statushandoff'))
+        nodetool('enablehandoff')
+        self.assertTrue(nodetool('statushandoff'))
+
+        out, err = nodetool('tpstats')
+        self.assertIn('MutationStage', out)
+
+    @since('2.1')
+    def gcstats_test(self):
+        """ gcstats() returns the GCInspector statistics as numbers. """
+        node1 = self._prepare()
+        stats = JmxNodetool(node1).gcstats()
+        self.assertGreater(stats.interval_ms, 0)
+        self.assertGreaterEqual(stats.collections, 0)
@@ -0,0 +1,204 @@
+"""
+Background sampling of JMX metrics into fixed-size time series.
+
+A MetricSampler polls a set of MBean attributes on every node at a fixed
+interval, from a background thread, with one bulk Jolokia request per node
+per sample. Each (node, metric) series is kept in a RingBuffer holding the
+most recent samples, so memory use doesn't grow with the length of a test.
+
+Example usage:
+
+    sampler = MetricSampler(cluster.nodelist(), DEFAULT_METRICS, interval=0.5)
+    sampler.start()
+    node.stress(['write', 'n=100K'])
+    sampler.stop()
+    peak = sampler.series(node, 'PendingCompactions').max()
+
+Tests normally get a sampler from Tester.sample_metrics(), which stops it
+at the end of the test and saves its samples with the logs of failed runs.
+As with any use of jmxutils, remove_perf_disable_shared_mem must be called
+on the nodes before they are started.
+"""
+import csv
+import json
+import os
+import threading
+import time
+from array import array
+from collections import deque
+
+from jmxutils import JolokiaAgent, make_mbean
+
+# (series name, mbean, attribute, path) of metrics worth watching during a load
+DEFAULT_METRICS = [
+    ('PendingCompactions', make_mbean('metrics', type='Compaction', name='PendingTasks'), 'Value', None),
+    ('CompletedCompactions', make_mbean('metrics', type='Compaction', name='CompletedTasks'), 'Value', None),
+    ('HeapUsed', 'java.lang:type=Memory', 'HeapMemoryUsage', 'used'),
+    ('MutationStagePending', make_mbean('metrics', type='ThreadPools', path='request', scope='MutationStage', name='PendingTasks'), 'Value', None),
+    ('ReadStagePending', make_mbean('metrics', type='ThreadPools', path='request', scope='ReadStage', name='PendingTasks'), 'Value', None),
+    ('FlushWriterPending', make_mbean('metrics', type='ThreadPools', path='internal', scope='MemtableFlushWriter', name='PendingTasks'), 'Value', None),
+]
+
+
+def table_metrics(keyspace, table, names=('MemtableLiveDataSize', 'LiveSSTableCount', 'PendingCompactions')):
+    """
+    Returns sampler metric definitions for per-table gauges, named
+    '<keyspace>.<table>.<name>'.
+    """
+    return [('{}.{}.{}'.format(keyspace, table, name),
+             make_mbean('metrics', type='ColumnFamily', keyspace=keyspace, scope=table, name=name),
+             'Value', None)
+            for name in names]
+
+
+class RingBuffer(object):
+    """
+    A fixed-size numeric time series: once `capacity` samples are held, each
+    new sample overwrites the oldest one.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', [0]) * capacity
+        self.values = array('d', [0]) * capacity
+        self.count = 0
+
+    def append(self, timestamp, value):
+        i = self.count % self.capacity
+        self.times[i] = timestamp
+        self.values[i] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def samples(self):
+        """ Returns the held samples as a list of (time, value), oldest first. """
+        if self.count <= self.capacity:
+            indexes = range(self.count)
+        else:
+            start = self.count % self.capacity
+            indexes = range(start, self.capacity) + range(start)
+        return [(self.times[i], self.values[i]) for i in indexes]
+
+    def max(self):
+        return max(v for _, v in self.samples()) if len(self) else None
+
+    def min(self):
+        return min(v for _, v in self.samples()) if len(self) else None
+
+    def last(self):
+        return self.samples()[-1][1] if len(self) else None
+
+    def rate(self):
+        """
+        Returns the average change per second between the oldest and the
+        newest held samples, e.g. completed tasks per second for a counter.
+        """
+        samples = self.samples()
+        if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+            return None
+        return (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0])
+
+
+class MetricSampler(object):
+    """
+    Samples `metrics`, a list of (name, mbean, attribute, path) tuples, on
+    each of `nodes` every `interval` seconds until stopped, keeping the last
+    `capacity` samples of each series. Reads that fail, e.g. for an MBean
+    that doesn't exist yet, and non-numeric values are skipped. A node that
+    can't be sampled at all, e.g. while it restarts, is retried with a new
+    agent at the next sample, and the last
+    `capacity` such failures are kept in `failures` as (time, node name,
+    error).
+    """
+
+    def __init__(self, nodes, metrics=None, interval=1.0, capacity=3600, name='metrics'):
+        self.nodes = list(nodes)
+        self.metrics = list(DEFAULT_METRICS if metrics is None else metrics)
+        self.interval = interval
+        self.name = name
+        self._series = dict(((node.name, metric[0]), RingBuffer(capacity))
+                            for node in self.nodes for metric in self.metrics)
+        self.failures = deque(maxlen=capacity)
+        # node name -> the JolokiaAgent attached to it
+        self.agents = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self.error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='MetricSampler-' + self.name)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                started = time.time()
+                self.sample_once()
+                self._stopped.wait(max(0, self.interval - (time.time() - started)))
+        except Exception as e:
+            self.error = e
+        finally:
+            for agent in self.agents.values():
+                agent.close()
+
+    def _agent(self, node):
+        if node.name not in self.agents:
+            agent = JolokiaAgent(node)
+            agent.attach()
+            self.agents[node.name] = agent
+        return self.agents[node.name]
+
+    def sample_once(self):
+        requests = [(mbean, attribute, path) for _, mbean, attribute, path in self.metrics]
+        for node in self.nodes:
+            if not node.is_running():
+                continue
+            try:
+                values = self._agent(node).read_attributes(requests, raise_errors=False)
+            except Exception as e:
+                # e.g. a node restarting between is_running() and the read:
+                # its agent is gone with the old process
+                self.failures.append((time.time(), node.name, e))
+                agent = self.agents.pop(node.name, None)
+                if agent is not None:
+                    agent.close()
+                continue
+            now = time.time()
+            for (name, _, _, _), value in zip(self.metrics, values):
+                if isinstance(value, (int, long, float)) and not isinstance(value, bool):
+                    self._series[(node.name, name)].append(now, value)
+
+    def stop(self):
+        """ Stops sampling, raising any error that stopped it early. """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def series(self, node, name):
+        """ Returns the RingBuffer of metric `name` on `node`. """
+        return self._series[(node.name, name)]
+
+    def export(self, directory):
+        """
+        Writes every series to <name>.csv (one row per sample) and
+        <name>.json (one list of [time, value] per series) in `directory`.
+        """
+        rows = sorted((node_name, name, t, v)
+                      for (node_name, name), series in self._series.items()
+                      for t, v in series.samples())
+        with open(os.path.join(directory, self.name + '.csv'), 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(['node', 'metric', 'time', 'value'])
+            writer.writerows(rows)
+
+        by_node = {}
+        for (node_name, name), series in self._series.items():
+            by_node.setdefault(node_name, {})[name] = series.samples()
+        with open(os.path.join(directory, self.name + '.json'), 'w') as f:
+            json.dump(by_node, f)
@@ -0,0 +1,125 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import jmxsampler
+from jmxsampler import MetricSampler, RingBuffer
+
+METRICS = [('Pending', 'org.apache.cassandra.metrics:type=Compaction,name=PendingTasks', 'Value', None),
+           ('HeapUsed', 'java.lang:type=Memory', 'HeapMemoryUsage', 'used')]
+
+
+class FakeNode(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.running = True
+
+    def is_running(self):
+        return self.running
+
+
+class FakeAgent(object):
+    """ Returns the next of `samples` as the values read, or raises it. """
+
+    def __init__(self, samples):
+        self.samples = list(samples)
+        self.attached = self.closed = False
+
+    def attach(self):
+        self.attached = True
+
+    def read_attributes(self, requests, raise_errors=True):
+        assert requests == [(mbean, attribute, path) for _, mbean, attribute, path in METRICS], requests
+        assert not raise_errors
+        sample = self.samples.pop(0)
+        if isinstance(sample, Exception):
+            raise sample
+        return sample
+
+    def close(self):
+        self.closed = True
+
+
+class TestRingBuffer(TestCase):
+
+    def wraparound_test(self):
+        series = RingBuffer(3)
+        self.assertEqual((0, None, None, None, None), (len(series), series.max(), series.min(), series.last(), series.rate()))
+        for t in range(5):
+            series.append(t, t * 10)
+        self.assertEqual(3, len(series))
+        self.assertEqual([(2, 20), (3, 30), (4, 40)], series.samples())
+        self.assertEqual((40, 20, 40), (series.max(), series.min(), series.last()))
+
+    def rate_test(self):
+        series = RingBuffer(10)
+        series.append(1.0, 100)
+        self.assertEqual(None, series.rate())
+        series.append(3.0, 150)
+        series.append(5.0, 300)
+        self.assertEqual(50.0, series.rate())
+
+
+class TestMetricSampler(TestCase):
+
+    def setUp(self):
+        self.agents = {}
+        self.created = []
+        self.real_agent = jmxsampler.JolokiaAgent
+
+        def agent(node):
+            created = self.agents[node.name].pop(0)
+            self.created.append((node.name, created))
+            return created
+        jmxsampler.JolokiaAgent = agent
+
+    def tearDown(self):
+        jmxsampler.JolokiaAgent = self.real_agent
+
+    def sample_test(self):
+        node1, node2 = FakeNode('node1'), FakeNode('node2')
+        first_agent = FakeAgent([[1, 1000], IOError('connection refused')])
+        self.agents = {
+            'node1': [FakeAgent([[2, 2000], [3, 'n/a'], [4, 4000], [7, 7000]])],
+            # node2 restarts after its first sample, and gets a new agent
+            'node2': [first_agent, FakeAgent([[5, True], [6, 6000]])],
+        }
+        sampler = MetricSampler([node1, node2], METRICS, capacity=2, name='test')
+
+        sampler.sample_once()
+        sampler.sample_once()
+        self.assertTrue(first_agent.attached and first_agent.closed)
+        self.assertEqual([('node2', IOError)], [(name, type(error)) for _, name, error in sampler.failures])
+        self.assertNotIn('node2', sampler.agents)
+
+        sampler.sample_once()
+        node2.running = False
+        sampler.sample_once()
+        self.assertEqual(['node1', 'node2', 'node2'], [name for name, _ in self.created])
+        self.assertEqual(1, len(sampler.failures))
+
+        # non-numeric values, like the boolean, are skipped
+        self.assertEqual([4, 7], [v for _, v in sampler.series(node1, 'Pending').samples()])
+        self.assertEqual([4000, 7000], [v for _, v in sampler.series(node1, 'HeapUsed').samples()])
+        self.assertEqual([1, 5], [v for _, v in sampler.series(node2, 'Pending').samples()])
+        self.assertEqual([1000], [v for _, v in sampler.series(node2, 'HeapUsed').samples()])
+
+        directory = tempfile.mkdtemp()
+        try:
+            sampler.export(directory)
+            with open(os.path.join(directory, 'test.csv')) as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(['node', 'metric', 'time', 'value'], rows[0])
+            self.assertEqual([('node1', 'HeapUsed', 4000.0), ('node1', 'HeapUsed', 7000.0), ('node1', 'Pending', 4.0),
+                              ('node1', 'Pending', 7.0), ('node2', 'HeapUsed', 1000.0), ('node2', 'Pending', 1.0), ('node2', 'Pending', 5.0)],
+                             [(node, metric, float(value)) for node, metric, _, value in rows[1:]])
+            with open(os.path.join(directory, 'test.json')) as f:
+                by_node = json.load(f)
+            self.assertEqual([1000], [v for _, v in by_node['node2']['HeapUsed']])
+            self.assertEqual([4, 7], [v for _, v in by_node['node1']['Pending']])
+        finally:
+            shutil.rmtree(directory)
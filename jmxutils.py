@@ -1,10 +1,24 @@
 import ccmlib.common as common
-from urllib2 import urlopen
+import httplib
 import json
 import os
+import socket
 import subprocess
+import threading
+from contextlib import contextmanager
 
 JOLOKIA_JAR = os.path.join('lib', 'jolokia-jvm-1.2.3-agent.jar')
+JOLOKIA_PORT = 8778
+
+# node directory -> pid of the Cassandra process a Jolokia agent is attached
+# to. An agent lives as long as its JVM, so it is attached once per pid and
+# reused by every JolokiaAgent context on that node until the node restarts.
+_attached_agents = {}
+# reentrant, since attach() holds it while calling start()
+_attached_agents_lock = threading.RLock()
+
+# Jolokia request types that only read, and can safely be sent twice
+_READ_REQUESTS = ('read', 'search', 'list', 'version')
 
 
 def make_mbean(package, type, **kwargs):
@@ -47,6 +61,38 @@ def remove_perf_disable_shared_mem(node):
     common.replace_in_file(conf_file, pattern, replacement)
 
 
+class JolokiaError(Exception):
+    """
+    Raised when the Jolokia agent answers a request with a non-200 status.
+
+    `response` is the agent's response, or a list of responses for a bulk
+    request with several failures.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        Exception.__init__(self, "Jolokia agent returned non-200 status: %s" % (response,))
+
+    def print_stacktraces(self):
+        responses = self.response if isinstance(self.response, list) else [self.response]
+        for response in responses:
+            stacktrace = response.get('stacktrace')
+            if stacktrace:
+                print "Stacktrace from Jolokia error follows:"
+                for line in stacktrace.splitlines():
+                    print line
+
+
+def forget_jolokia_agents(cluster):
+    """
+    Forgets the agents attached to the nodes of `cluster`. Called when the
+    cluster is removed, since its JVMs, and the agents in them, are gone.
+    """
+    with _attached_agents_lock:
+        for node in cluster.nodelist():
+            _attached_agents.pop(node.get_path(), None)
+
+
 class JolokiaAgent(object):
     """
     This class provides a simple way to read, write, and execute
@@ -60,12 +106,23 @@ class JolokiaAgent(object):
             avg_interval = jmx.read_attribute(mbean, 'AverageIndexInterval')
             jmx.write_attribute(mbean, 'MemoryPoolCapacityInMB', 0)
             jmx.execute_method(mbean, 'redistributeSummaries')
+
+    Many attributes can be read, or methods executed, in one round trip:
+
+            sizes = jmx.read_attributes([(mbean, 'MemoryPoolSizeInMB'),
+                                         (mbean, 'AverageIndexInterval')])
+
+    Used as a context manager, the agent is attached to the node's JVM the
+    first time and left attached afterwards, so later contexts on the same
+    node don't pay for launching the attach JVM again. Requests are sent
+    over a single keep-alive HTTP connection per context.
     """
 
     node = None
 
     def __init__(self, node):
         self.node = node
+        self._connection = None
 
     def start(self):
         """
@@ -83,6 +140,8 @@ class JolokiaAgent(object):
             print "Exit status was: %d" % (exc.returncode,)
             print "Output was: %s" % (exc.output,)
             raise
+        with _attached_agents_lock:
+            _attached_agents[self.node.get_path()] = self.node.pid
 
     def stop(self):
         """
@@ -91,6 +150,7 @@ class JolokiaAgent(object):
         args = ('java',
                 '-jar', JOLOKIA_JAR,
                 'stop', str(self.node.pid))
+        self.close()
         try:
             subprocess.check_output(args, stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError, exc:
@@ -98,25 +158,86 @@ class JolokiaAgent(object):
             print "Exit status was: %d" % (exc.returncode,)
             print "Output was: %s" % (exc.output,)
             raise
+        finally:
+            with _attached_agents_lock:
+                _attached_agents.pop(self.node.get_path(), None)
 
-    def _query(self, body):
+    def attach(self):
+        """
+        Starts the Jolokia agent unless one is already attached to the
+        node's current process.
+        """
+        with _attached_agents_lock:
+            if _attached_agents.get(self.node.get_path()) != self.node.pid:
+                self.start()
+
+    def close(self):
+        """
+        Closes the HTTP connection to the agent, leaving the agent attached.
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _post(self, body):
         request_data = json.dumps(body)
-        url = 'http://%s:8778/jolokia/' % (self.node.network_interfaces['binary'][0],)
-        response = urlopen(url, data=request_data, timeout=10.0)
-        if response.code != 200:
-            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.code, response.readlines()))
+        headers = {'Content-Type': 'application/json'}
+        read_only = all(request['type'] in _READ_REQUESTS for request in (body if isinstance(body, list) else [body]))
+        # the agent may close an idle keep-alive connection, in which case
+        # the request is sent again once over a new connection, unless it
+        # was sent and may have been executed: only reads are sent twice,
+        # and nothing is after a timeout
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = httplib.HTTPConnection(self.node.network_interfaces['binary'][0], JOLOKIA_PORT, timeout=10.0)
+            sent = False
+            try:
+                self._connection.request('POST', '/jolokia/', request_data, headers)
+                sent = True
+                response = self._connection.getresponse()
+                raw_response = response.read()
+                break
+            except socket.timeout:
+                self.close()
+                raise
+            except (httplib.HTTPException, socket.error):
+                self.close()
+                if attempt == 1 or (sent and not read_only):
+                    raise
+
+        if response.status != 200:
+            raise Exception("Failed to query Jolokia agent; HTTP response code: %d; response: %s" % (response.status, raw_response))
+        return json.loads(raw_response)
 
-        raw_response = response.readline()
-        response = json.loads(raw_response)
+    def _query(self, body):
+        response = self._post(body)
         if response['status'] != 200:
-            stacktrace = response.get('stacktrace')
-            if stacktrace:
-                print "Stacktrace from Jolokia error follows:"
-                for line in stacktrace.splitlines():
-                    print line
-            raise Exception("Jolokia agent returned non-200 status: %s" % (response,))
+            error = JolokiaError(response)
+            error.print_stacktraces()
+            raise error
         return response
 
+    def _bulk_query(self, bodies, raise_errors):
+        """
+        Sends all of `bodies` in a single HTTP request. Jolokia answers bulk
+        requests with one response per request, in request order.
+
+        Returns the value of each request, or a JolokiaError in place of the
+        value of each failed request if `raise_errors` is false. If it is
+        true, a single JolokiaError describing every failure is raised.
+        """
+        if not bodies:
+            return []
+        responses = self._post(list(bodies))
+        results = [response['value'] if response['status'] == 200 else JolokiaError(response)
+                   for response in responses]
+        errors = [r for r in results if isinstance(r, JolokiaError)]
+        if errors and raise_errors:
+            error = JolokiaError([e.response for e in errors])
+            error.print_stacktraces()
+            raise error
+        return results
+
     def read_attribute(self, mbean, attribute, path=None):
         """
         Reads a single JMX attribute.
@@ -183,12 +304,123 @@ class JolokiaAgent(object):
         response = self._query(body)
         return response['value']
 
+    def search(self, pattern):
+        """
+        Returns the names of the registered mbeans matching `pattern`, an
+        mbean name that may contain wildcards, such as
+        'org.apache.cassandra.metrics:type=ColumnFamily,keyspace=ks,*'.
+        """
+        response = self._query({'type': 'search', 'mbean': pattern})
+        return response['value']
+
+    def search_mbeans(self, patterns, raise_errors=True):
+        """
+        Runs search() for each of `patterns` in a single round trip, and
+        returns the lists of matching names in pattern order.
+        """
+        return self._bulk_query([{'type': 'search', 'mbean': pattern} for pattern in patterns], raise_errors)
+
+    def read_attributes(self, requests, raise_errors=True):
+        """
+        Reads many JMX attributes in a single round trip.
+
+        `requests` is a list of (mbean, attribute) or (mbean, attribute, path)
+        tuples, with the same meaning as the arguments of read_attribute().
+
+        Returns the values in request order. If `raise_errors` is false, a
+        failed read returns a JolokiaError in place of its value instead of
+        failing the whole batch.
+        """
+        bodies = []
+        for request in requests:
+            mbean, attribute = request[:2]
+            body = {'type': 'read',
+                    'mbean': mbean,
+                    'attribute': attribute}
+            if len(request) > 2 and request[2]:
+                body['path'] = request[2]
+            bodies.append(body)
+        return self._bulk_query(bodies, raise_errors)
+
+    def execute_methods(self, requests, raise_errors=True):
+        """
+        Executes many JMX methods in a single round trip.
+
+        `requests` is a list of (mbean, operation) or (mbean, operation,
+        arguments) tuples, with the same meaning as the arguments of
+        execute_method().
+
+        Returns the return values in request order. If `raise_errors` is
+        false, a failed call returns a JolokiaError in place of its value
+        instead of failing the whole batch.
+        """
+        bodies = []
+        for request in requests:
+            mbean, operation = request[:2]
+            arguments = request[2] if len(request) > 2 and request[2] is not None else []
+            bodies.append({'type': 'exec',
+                           'mbean': mbean,
+                           'operation': operation,
+                           'arguments': arguments})
+        return self._bulk_query(bodies, raise_errors)
+
     def __enter__(self):
         """ For contextmanager-style usage. """
-        self.start()
+        self.attach()
         return self
 
     def __exit__(self, exc_type, value, traceback):
         """ For contextmanager-style usage. """
-        self.stop()
+        self.close()
         return exc_type is None
+
+
+def get_logging_levels(node):
+    """
+    Returns the loggers of `node` that have an explicit level, as a dict of
+    logger name -> level. The root logger is named 'ROOT'.
+    """
+    with JolokiaAgent(node) as jmx:
+        return jmx.read_attribute(make_mbean('db', 'StorageService'), 'LoggingLevels')
+
+
+def set_logging_levels(nodes, levels):
+    """
+    Changes logger levels on the running `nodes` through the StorageService
+    setLoggingLevel operation, without rewriting the logging configuration
+    or restarting. `levels` maps logger names, such as
+    'org.apache.cassandra.db.compaction' or 'ROOT', to levels; an empty
+    level removes the logger's own level so that it inherits its parent's.
+
+    Requires Cassandra 2.1 or later, and remove_perf_disable_shared_mem()
+    on the nodes before they are started.
+    """
+    mbean = make_mbean('db', 'StorageService')
+    for node in nodes:
+        with JolokiaAgent(node) as jmx:
+            jmx.execute_methods([(mbean, 'setLoggingLevel', [logger, level]) for logger, level in levels.items()])
+
+
+@contextmanager
+def logging_levels(nodes, levels):
+    """
+    Sets logger levels on the running `nodes` for the duration of a with
+    block, then restores the levels each node had before, e.g. to only
+    trace the section of a test under investigation:
+
+        with logging_levels(cluster.nodelist(), {'org.apache.cassandra.repair': 'TRACE'}):
+            node1.repair()
+
+    Nodes that are not running when the block exits are skipped. See
+    set_logging_levels().
+    """
+    nodes = list(nodes)
+    previous = dict((node.name, get_logging_levels(node)) for node in nodes)
+    set_logging_levels(nodes, levels)
+    try:
+        yield
+    finally:
+        for node in nodes:
+            if node.is_running():
+                set_logging_levels([node], dict((logger, previous[node.name].get(logger, ''))
+                                                for logger in levels))
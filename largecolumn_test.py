@@ -1,4 +1,7 @@
 from dtest import Tester, debug
+from gclog import node_gc_summary
+from jmxnodetool import JmxNodetool
+from jmxutils import remove_perf_disable_shared_mem
 from tools import since
 
 """
@@ -10,18 +13,14 @@ class TestLargeColumn(Tester):
 
     def stress_with_col_size(self, cluster, node, size):
         size = str(size);
-        node.stress(['write', 'n=5', "no-warmup", "cl=ALL", "-pop", "seq=1...5", "-schema", "replication(factor=2)", "-col", "n=fixed(1)", "size=fixed(" + size + ")", "-rate", "threads=1"])
-        node.stress(['read', 'n=5', "no-warmup", "cl=ALL", "-pop", "seq=1...5", "-schema", "replication(factor=2)", "-col", "n=fixed(1)", "size=fixed(" + size + ")", "-rate", "threads=1"])
+        self.stress(node, ['write', 'n=5', "no-warmup", "cl=ALL", "-pop", "seq=1...5", "-schema", "replication(factor=2)", "-col", "n=fixed(1)", "size=fixed(" + size + ")", "-rate", "threads=1"])
+        self.stress(node, ['read', 'n=5', "no-warmup", "cl=ALL", "-pop", "seq=1...5", "-schema", "replication(factor=2)", "-col", "n=fixed(1)", "size=fixed(" + size + ")", "-rate", "threads=1"])
 
     def directbytes(self, node):
-        output = node.nodetool( "gcstats", capture_output=True);
-        output = output[0].split("\n");
-        assert output[0].strip().startswith("Interval"), "Expected output from nodetool gcstats starts with a header line with first column Interval"
-        fields = output[1].split();
-        assert len(fields) >= 6, "Expected output from nodetool gcstats has at least six fields"
-        for field in fields:
-            assert field.strip().isdigit() or field == 'NaN', "Expected numeric from fields from nodetool gcstats"
-        return fields[6]
+        with JmxNodetool(node) as nodetool:
+            direct_bytes = nodetool.gcstats().direct_memory_bytes
+        assert direct_bytes is not None, "Expected gcstats to include direct memory bytes"
+        return direct_bytes
 
     def cleanup_test(self):
         """
@@ -32,7 +31,11 @@ class TestLargeColumn(Tester):
         #internode compression is disabled because the regression being tested occurs in NIO buffer pooling without compression
         cluster.set_configuration_options( { 'commitlog_segment_size_in_mb' : 128, 'internode_compression' : 'none' })
         #Have Netty allocate memory on heap so it is clear if memory used for large columns is related to intracluster messaging
-        cluster.populate(2).start(jvm_args=[" -Dcassandra.netty_use_heap_allocator=true "])
+        cluster.populate(2)
+        for node in cluster.nodelist():
+            remove_perf_disable_shared_mem(node)
+        self.enable_gc_logging()
+        cluster.start(jvm_args=[" -Dcassandra.netty_use_heap_allocator=true "])
         node1, node2 = cluster.nodelist()
 
         session = self.patient_cql_connection(node1)
@@ -48,6 +51,7 @@ class TestLargeColumn(Tester):
         output = node1.nodetool( "gcstats", capture_output=True);
         afterStress = self.directbytes(node1)
         debug("After stress {0}".format(afterStress))
+        debug("GC on {0}: {1}".format(node1.name, node_gc_summary(node1)))
 
         #Any growth in memory usage should not be proportional column size. Really almost no memory should be used
         #since Netty was instructed to use a heap allocator
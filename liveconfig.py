@@ -0,0 +1,102 @@
+"""
+Changes configuration options of running nodes, over JMX where Cassandra
+supports it, and with a rolling restart only where it doesn't.
+
+Example usage:
+
+    reconfigure(cluster.nodelist(), compaction_throughput_mb_per_sec=0,
+                key_cache_size_in_mb=10, hinted_handoff_enabled=False)
+
+Every cassandra.yaml option is also written to the nodes' configuration, so
+it survives later restarts. Nodes must have had
+remove_perf_disable_shared_mem called on them before they were started.
+"""
+from collections import namedtuple
+
+from dtest import debug
+from jmxutils import JolokiaAgent, make_mbean
+
+STORAGE_SERVICE = make_mbean('db', 'StorageService')
+STORAGE_PROXY = make_mbean('db', 'StorageProxy')
+CACHES = make_mbean('db', 'Caches')
+
+# How an option is applied to a running node: the mbean attribute written
+# with its value, and whether it is a cassandra.yaml option or only exists
+# at runtime.
+LiveOption = namedtuple('LiveOption', ['mbean', 'attribute', 'in_yaml'])
+
+LIVE_OPTIONS = {
+    'compaction_throughput_mb_per_sec': LiveOption(STORAGE_SERVICE, 'CompactionThroughputMbPerSec', True),
+    'stream_throughput_outbound_megabits_per_sec': LiveOption(STORAGE_SERVICE, 'StreamThroughputMbPerSec', True),
+    'inter_dc_stream_throughput_outbound_megabits_per_sec': LiveOption(STORAGE_SERVICE, 'InterDCStreamThroughputMbPerSec', True),
+    'incremental_backups': LiveOption(STORAGE_SERVICE, 'IncrementalBackupsEnabled', True),
+    'tombstone_warn_threshold': LiveOption(STORAGE_SERVICE, 'TombstoneWarnThreshold', True),
+    'tombstone_failure_threshold': LiveOption(STORAGE_SERVICE, 'TombstoneFailureThreshold', True),
+    'hinted_handoff_throttle_in_kb': LiveOption(STORAGE_SERVICE, 'HintedHandoffThrottleInKB', True),
+    'request_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'RpcTimeout', True),
+    'read_request_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'ReadRpcTimeout', True),
+    'range_request_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'RangeRpcTimeout', True),
+    'write_request_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'WriteRpcTimeout', True),
+    'counter_write_request_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'CounterWriteRpcTimeout', True),
+    'cas_contention_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'CasContentionTimeout', True),
+    'truncate_request_timeout_in_ms': LiveOption(STORAGE_SERVICE, 'TruncateRpcTimeout', True),
+    'trace_probability': LiveOption(STORAGE_SERVICE, 'TraceProbability', False),
+    'hinted_handoff_enabled': LiveOption(STORAGE_PROXY, 'HintedHandoffEnabled', True),
+    'max_hint_window_in_ms': LiveOption(STORAGE_PROXY, 'MaxHintWindow', True),
+    'key_cache_size_in_mb': LiveOption(CACHES, 'KeyCacheCapacityInMB', True),
+    'row_cache_size_in_mb': LiveOption(CACHES, 'RowCacheCapacityInMB', True),
+    'counter_cache_size_in_mb': LiveOption(CACHES, 'CounterCacheCapacityInMB', True),
+    'key_cache_save_period': LiveOption(CACHES, 'KeyCacheSavePeriodInSeconds', True),
+    'row_cache_save_period': LiveOption(CACHES, 'RowCacheSavePeriodInSeconds', True),
+    'counter_cache_save_period': LiveOption(CACHES, 'CounterCacheSavePeriodInSeconds', True),
+    'key_cache_keys_to_save': LiveOption(CACHES, 'KeyCacheKeysToSave', True),
+    'row_cache_keys_to_save': LiveOption(CACHES, 'RowCacheKeysToSave', True),
+    'counter_cache_keys_to_save': LiveOption(CACHES, 'CounterCacheKeysToSave', True),
+}
+
+
+def _apply_live(node, options):
+    with JolokiaAgent(node) as jmx:
+        for name, value in sorted(options.items()):
+            option = LIVE_OPTIONS[name]
+            if name == 'hinted_handoff_enabled' and not isinstance(value, bool):
+                # a list of datacenters rather than a boolean
+                datacenters = value if isinstance(value, basestring) else ','.join(value)
+                jmx.execute_method(STORAGE_PROXY, 'setHintedHandoffEnabledByDCList', [datacenters])
+            else:
+                jmx.write_attribute(option.mbean, option.attribute, value)
+
+
+def reconfigure(nodes, **options):
+    """
+    Sets configuration `options` on `nodes`. Options in LIVE_OPTIONS are
+    applied to running nodes over JMX; if any other option is given, each
+    running node is restarted in turn to pick it up. Stopped nodes only have
+    their configuration updated.
+
+    @return the list of nodes that were restarted
+    """
+    live = dict((name, value) for name, value in options.items() if name in LIVE_OPTIONS)
+    restart = sorted(name for name in options if name not in LIVE_OPTIONS)
+    in_yaml = dict((name, value) for name, value in options.items()
+                   if name not in LIVE_OPTIONS or LIVE_OPTIONS[name].in_yaml)
+
+    restarted = []
+    for node in nodes:
+        if in_yaml:
+            node.set_configuration_options(values=in_yaml)
+        if not node.is_running():
+            debug("{} is not running, only updated its configuration with {}".format(node.name, sorted(in_yaml)))
+            continue
+        to_apply = live
+        if restart:
+            debug("Restarting {} to apply {}".format(node.name, restart))
+            node.stop(wait_other_notice=True)
+            node.start(wait_for_binary_proto=True, wait_other_notice=True)
+            restarted.append(node)
+            # the restart picked up every option of cassandra.yaml
+            to_apply = dict((name, value) for name, value in live.items() if name not in in_yaml)
+        if to_apply:
+            debug("Applying {} to {} over JMX".format(sorted(to_apply), node.name))
+            _apply_live(node, to_apply)
+    return restarted
@@ -0,0 +1,313 @@
+"""
+An open-loop load generator built on the driver's execute_async, with
+latencies recorded in HDR-style histograms.
+
+Statements are issued on a schedule set by the target rate, whether earlier
+ones have completed or not, with at most `concurrency` of them in flight.
+Latencies are measured from the time a statement was scheduled to be sent
+rather than from when it actually was: when the cluster stalls and the
+generator falls behind, the wait of the statements that couldn't be sent is
+counted, which avoids the coordinated omission of measuring a closed loop.
+Without a target rate, statements are sent as fast as the concurrency
+allows and latencies are measured from the actual send.
+
+Example usage:
+
+    insert = session.prepare("INSERT INTO ks.cf (k, v) VALUES (?, ?)")
+    select = session.prepare("SELECT v FROM ks.cf WHERE k = ?")
+    load = LoadGenerator(session, rate=2000, concurrency=100)
+    load.add('insert', insert, lambda i: (i % 1000, i), weight=9)
+    load.add('select', select, lambda i: (i % 1000,), weight=1)
+    result = load.run(duration=30)
+    debug(result.report())
+
+    reads = LoadGenerator(session, rate=100).add('select', select, lambda i: (i % 1000,)).start()
+    node.nodetool('compact')
+    reads.stop()
+    debug(reads.join().report())
+
+    keys = Zipfian(1000, exponent=1.2)
+    hot_reads = LoadGenerator(session).add('select', select, lambda i: (keys.next(),))
+"""
+import bisect
+import random
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+# One kind of statement of the load. `parameters` returns the bound values of
+# the i-th statement issued, and `callback` is called with those values and
+# the rows once it succeeds; a statement whose callback raises counts as an
+# error.
+Operation = namedtuple('Operation', ['name', 'statement', 'parameters', 'weight', 'callback'])
+
+
+class LatencyHistogram(object):
+    """
+    Counts of values, in microseconds, from 1us to `highest` with
+    `significant_digits` of precision, in log-linear buckets as in
+    HdrHistogram: values are grouped by power of two, and each power of two
+    is split into linear sub-buckets. Larger values are counted as
+    `highest`.
+    """
+
+    def __init__(self, highest=3600 * 1000 * 1000, significant_digits=2):
+        self.highest = highest
+        self.sub_buckets = 1
+        while self.sub_buckets < 2 * 10 ** significant_digits:
+            self.sub_buckets *= 2
+        self.magnitude = self.sub_buckets.bit_length() - 1
+        self.counts = array('l', [0] * (self._index(highest) + 1))
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.magnitude
+        half = self.sub_buckets // 2
+        return self.sub_buckets + (shift - 1) * half + (value >> shift) - half
+
+    def _highest_equivalent(self, index):
+        if index < self.sub_buckets:
+            return index
+        half = self.sub_buckets // 2
+        shift = (index - self.sub_buckets) // half + 1
+        sub_bucket = (index - self.sub_buckets) % half + half
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """ Adds the counts of `other`, a histogram of the same precision, to this one. """
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.sum / float(self.total) if self.total else 0
+
+    def percentile(self, percentile):
+        """ Returns the value below which `percentile` percent of the values are, within the precision. """
+        if not self.total:
+            return 0
+        rank = max(1, int(round(percentile / 100.0 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def summary(self):
+        """ Returns the count, and the mean, p50, p99, p999 and max latencies in milliseconds. """
+        return {'count': self.total,
+                'mean_ms': self.mean() / 1000.0,
+                'p50_ms': self.percentile(50) / 1000.0,
+                'p99_ms': self.percentile(99) / 1000.0,
+                'p999_ms': self.percentile(99.9) / 1000.0,
+                'max_ms': self.max / 1000.0}
+
+
+class Zipfian(object):
+    """
+    Draws keys from 0 to n - 1, key k with a probability proportional to
+    1 / (k + 1) ** exponent: the greater the exponent, the hotter the first
+    keys, and an exponent of 0 draws keys uniformly.
+    """
+
+    def __init__(self, n, exponent=1.0, seed=0):
+        self.random = random.Random(seed)
+        self.cumulative = array('d')
+        total = 0.0
+        for k in xrange(n):
+            total += 1.0 / (k + 1) ** exponent
+            self.cumulative.append(total)
+
+    def probability(self, k):
+        """ Returns the probability of drawing key k. """
+        previous = self.cumulative[k - 1] if k else 0
+        return (self.cumulative[k] - previous) / self.cumulative[-1]
+
+    def next(self):
+        return bisect.bisect_left(self.cumulative, self.random.random() * self.cumulative[-1])
+
+
+class LoadResult(object):
+    """
+    The outcome of a LoadGenerator run: the number of statements that
+    succeeded and failed, the seconds it took, a latency histogram per
+    operation name, and the first errors of each exception type.
+    """
+
+    def __init__(self, operations, errors, elapsed, histograms, error_samples):
+        self.operations = operations
+        self.errors = errors
+        self.elapsed = elapsed
+        self.histograms = histograms
+        self.error_samples = error_samples
+
+    def latencies(self):
+        """ Returns the histogram of every operation together. """
+        merged = LatencyHistogram()
+        for histogram in self.histograms.values():
+            merged.merge(histogram)
+        return merged
+
+    def throughput(self):
+        return self.operations / self.elapsed if self.elapsed else 0
+
+    def report(self):
+        report = self.latencies().summary()
+        report.update(operations=self.operations, errors=self.errors, elapsed_sec=self.elapsed,
+                      ops_per_sec=self.throughput(),
+                      by_operation=dict((name, h.summary()) for name, h in self.histograms.items()))
+        return report
+
+
+class LoadGenerator(object):
+    """
+    Runs the operations added with add() on `session`, chosen at random in
+    proportion to their weights, at `rate` statements per second (or as
+    fast as possible if None), with at most `concurrency` in flight. The run
+    stops early once `max_errors` statements have failed.
+    """
+
+    def __init__(self, session, rate=None, concurrency=100, max_errors=None, seed=0):
+        self.session = session
+        self.rate = rate
+        self.concurrency = concurrency
+        self.max_errors = max_errors
+        self.random = random.Random(seed)
+        self.operations = []
+        self._stopped = threading.Event()
+        self._thread = None
+        self._outcome = None
+
+    def add(self, name, statement, parameters=None, weight=1, callback=None):
+        """
+        Adds an operation executing `statement`, a query string or a
+        prepared or simple statement, bound with `parameters(i)` for the
+        i-th statement issued.
+        """
+        self.operations.append(Operation(name, statement, parameters, weight, callback))
+        return self
+
+    def start(self, duration=None, count=None):
+        """ Runs in a background thread; join() returns its LoadResult. """
+        def run():
+            try:
+                self._outcome = (self.run(duration, count), None)
+            except Exception as e:
+                self._outcome = (None, e)
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def join(self):
+        """ Waits for the run started by start() and returns its LoadResult, or raises its error. """
+        self._thread.join()
+        result, error = self._outcome
+        if error is not None:
+            raise error
+        return result
+
+    def stop(self):
+        """ Makes a run in another thread stop issuing statements, as do any later runs. """
+        self._stopped.set()
+
+    def _choose(self):
+        point = self.random.uniform(0, sum(op.weight for op in self.operations))
+        for op in self.operations:
+            point -= op.weight
+            if point <= 0:
+                return op
+        return self.operations[-1]
+
+    def run(self, duration=None, count=None):
+        """
+        Issues statements for `duration` seconds, until `count` of them
+        were issued or until stop() is called, whichever comes first, and
+        waits for them to complete.
+
+        @return a LoadResult
+        """
+        assert self.operations, "No operation to run"
+        lock = threading.Lock()
+        slots = threading.Semaphore(self.concurrency)
+        histograms = dict((op.name, LatencyHistogram()) for op in self.operations)
+        state = {'operations': 0, 'errors': 0}
+        error_samples = {}
+
+        def record_error(error):
+            with lock:
+                state['errors'] += 1
+                error_samples.setdefault(type(error).__name__, []).append(error)
+                del error_samples[type(error).__name__][10:]
+
+        def on_success(rows, op, params, sent):
+            # the slot is released last, so that the run doesn't return
+            # before the callbacks of the statements in flight completed
+            try:
+                latency = (time.time() - sent) * 1000 * 1000
+                if op.callback is not None:
+                    op.callback(params, rows)
+            except Exception as e:
+                record_error(e)
+            else:
+                with lock:
+                    histograms[op.name].record(latency)
+                    state['operations'] += 1
+            finally:
+                slots.release()
+
+        def on_error(error, op, params, sent):
+            try:
+                record_error(error)
+            finally:
+                slots.release()
+
+        start = time.time()
+        i = 0
+        while ((count is None or i < count) and (duration is None or time.time() - start < duration) and
+               not self._stopped.is_set()):
+            if self.rate:
+                sent = start + i / float(self.rate)
+                time.sleep(max(0, sent - time.time()))
+                slots.acquire()
+            else:
+                slots.acquire()
+                sent = time.time()
+            if self.max_errors is not None and state['errors'] >= self.max_errors:
+                slots.release()
+                break
+            op = self._choose()
+            params = op.parameters(i) if op.parameters is not None else None
+            try:
+                future = self.session.execute_async(op.statement, params)
+            except Exception as e:
+                on_error(e, op, params, sent)
+            else:
+                future.add_callbacks(on_success, on_error, callback_args=(op, params, sent), errback_args=(op, params, sent))
+            i += 1
+
+        # wait for the statements in flight
+        for _ in range(self.concurrency):
+            slots.acquire()
+        return LoadResult(state['operations'], state['errors'], time.time() - start, histograms, error_samples)
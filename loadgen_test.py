@@ -0,0 +1,147 @@
+import threading
+import time
+from unittest import TestCase
+
+from loadgen import LatencyHistogram, LoadGenerator, Zipfian
+
+
+class ImmediateFuture(object):
+    """ A driver ResponseFuture look-alike completing after `delay` seconds, or failing with `error`. """
+
+    def __init__(self, delay, error=None):
+        self.delay = delay
+        self.error = error
+
+    def add_callbacks(self, callback, errback, callback_args=(), errback_args=()):
+        def complete():
+            time.sleep(self.delay)
+            if self.error is None:
+                callback([], *callback_args)
+            else:
+                errback(self.error, *errback_args)
+        threading.Thread(target=complete).start()
+
+
+class RecordingSession(object):
+
+    def __init__(self, delay=0, fail_every=None):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.executed = []
+
+    def execute_async(self, statement, parameters=None):
+        self.executed.append((statement, parameters))
+        if self.fail_every and len(self.executed) % self.fail_every == 0:
+            return ImmediateFuture(self.delay, RuntimeError('failed'))
+        return ImmediateFuture(self.delay)
+
+
+class TestLatencyHistogram(TestCase):
+
+    def precision_test(self):
+        histogram = LatencyHistogram(significant_digits=2)
+        for value in range(1, 100001):
+            histogram.record(value)
+        self.assertEqual(100000, histogram.total)
+        self.assertEqual((1, 100000), (histogram.min, histogram.max))
+        self.assertAlmostEqual(50000.5, histogram.mean())
+        for percentile in (50, 90, 99, 99.9):
+            expected = percentile * 1000
+            self.assertAlmostEqual(expected, histogram.percentile(percentile), delta=expected / 100.0)
+        self.assertEqual(100000, histogram.percentile(100))
+
+    def exact_small_values_test(self):
+        histogram = LatencyHistogram()
+        for value in (3, 3, 7, 100):
+            histogram.record(value)
+        self.assertEqual(3, histogram.percentile(50))
+        self.assertEqual(100, histogram.percentile(100))
+        self.assertEqual(0, LatencyHistogram().percentile(99))
+
+    def merge_test(self):
+        first, second = LatencyHistogram(), LatencyHistogram()
+        first.record(1000, count=99)
+        second.record(10 ** 9)
+        second.record(10 ** 12)
+        merged = LatencyHistogram().merge(first).merge(second)
+        self.assertEqual(101, merged.total)
+        self.assertAlmostEqual(1000, merged.percentile(50), delta=10)
+        # values above the highest trackable value are counted as the highest
+        self.assertEqual(merged.highest, merged.max)
+        self.assertEqual(3600 * 1000.0, merged.summary()['max_ms'])
+
+
+class TestZipfian(TestCase):
+
+    def distribution_test(self):
+        keys = Zipfian(100, exponent=1.0, seed=1)
+        draws = [keys.next() for _ in range(20000)]
+        self.assertEqual(set(range(100)), set(draws))
+        # key 0 is drawn with probability 1 / H(100), about 19%
+        self.assertAlmostEqual(1 / sum(1.0 / k for k in range(1, 101)), keys.probability(0))
+        self.assertAlmostEqual(keys.probability(0), draws.count(0) / 20000.0, delta=0.01)
+        self.assertAlmostEqual(keys.probability(0) / 2, draws.count(1) / 20000.0, delta=0.01)
+        same_seed = Zipfian(100, seed=1)
+        self.assertEqual(draws[:100], [same_seed.next() for _ in range(100)])
+
+    def uniform_test(self):
+        keys = Zipfian(10, exponent=0)
+        self.assertAlmostEqual(0.1, keys.probability(9))
+        draws = [keys.next() for _ in range(10000)]
+        self.assertAlmostEqual(1000, draws.count(9), delta=150)
+
+
+class TestLoadGenerator(TestCase):
+
+    def mixed_operations_test(self):
+        session = RecordingSession()
+        done = []
+        load = LoadGenerator(session, concurrency=10)
+        load.add('write', 'INSERT', lambda i: (i,), weight=3, callback=lambda params, rows: done.append(params))
+        load.add('read', 'SELECT', lambda i: (i,), weight=1)
+        result = load.run(count=400)
+        self.assertEqual((400, 0), (result.operations, result.errors))
+        writes = result.histograms['write'].total
+        self.assertEqual(len(done), writes)
+        self.assertAlmostEqual(300, writes, delta=40)
+        self.assertEqual(range(400), sorted(params[0] for statement, params in session.executed))
+
+    def open_loop_test(self):
+        # statements take 50ms, but with 20 in flight 100 per second can still be sent on time
+        load = LoadGenerator(RecordingSession(delay=0.05), rate=100, concurrency=20)
+        load.add('write', 'INSERT')
+        result = load.run(duration=1)
+        self.assertAlmostEqual(100, result.operations, delta=2)
+        self.assertLess(result.latencies().percentile(50), 100 * 1000)
+
+        # with a single statement in flight, the schedule falls behind and the
+        # wait of the statements that couldn't be sent is part of their latency
+        load = LoadGenerator(RecordingSession(delay=0.05), rate=100, concurrency=1)
+        load.add('write', 'INSERT')
+        result = load.run(count=20)
+        self.assertGreater(result.latencies().max, 500 * 1000)
+
+    def callbacks_test(self):
+        # every callback completed by the time run() returns, and one that
+        # raises counts as an error
+        done = []
+
+        def callback(params, rows):
+            time.sleep(0.01)
+            if params[0] == 7:
+                raise ValueError('rejected')
+            done.append(params[0])
+        load = LoadGenerator(RecordingSession(), concurrency=5)
+        load.add('write', 'INSERT', lambda i: (i,), callback=callback)
+        result = load.run(count=50)
+        self.assertEqual(sorted(done), [i for i in range(50) if i != 7])
+        self.assertEqual((49, 1), (result.operations, result.errors))
+        self.assertEqual(['ValueError'], result.error_samples.keys())
+
+    def max_errors_test(self):
+        load = LoadGenerator(RecordingSession(fail_every=2), concurrency=1, max_errors=5)
+        load.add('write', 'INSERT')
+        result = load.run(count=100)
+        self.assertEqual(5, result.errors)
+        self.assertEqual(['RuntimeError'], result.error_samples.keys())
+        self.assertEqual(5, result.report()['operations'])
@@ -1,10 +1,12 @@
 import os
-import re
 import subprocess
 
 from ccmlib import common
+from compactiontracker import wait_for_quiescence
 from dtest import Tester, debug, require
+from jmxutils import remove_perf_disable_shared_mem
 from tools import since
+from tooloutput import parse_sstablemetadata
 
 
 class TestOfflineTools(Tester):
@@ -23,8 +25,10 @@ class TestOfflineTools(Tester):
         @jira_ticket CASSANDRA-7614
         """
         cluster = self.cluster
-        cluster.populate(3).start()
+        cluster.populate(3)
         node1, node2, node3 = cluster.nodelist()
+        remove_perf_disable_shared_mem(node1)
+        cluster.start()
 
         #test by trying to run on nonexistent keyspace
         cluster.stop(gently=False)
@@ -68,7 +72,7 @@ class TestOfflineTools(Tester):
             node1.stress(['-o', 'insert', '--num-keys=1000000', '--replication-factor=3'])
         else:
             node1.stress(['write', 'n=1M', '-schema', 'replication(factor=3)'])
-        self.wait_for_compactions(node1)
+        wait_for_quiescence([node1])
         cluster.stop()
 
         initial_levels = self.get_levels(node1.run_sstablemetadata(keyspace="keyspace1", column_families=["standard1"]))
@@ -82,19 +86,7 @@ class TestOfflineTools(Tester):
             self.assertEqual(final_levels[x], 0)
 
     def get_levels(self, data):
-        levels = []
-        for sstable in data:
-            (metadata, error, rc) = sstable
-            level = int(re.findall("SSTable Level: [0-9]", metadata)[0][-1])
-            levels.append(level)
-        return levels
-
-    def wait_for_compactions(self, node):
-        pattern = re.compile("pending tasks: 0")
-        while True:
-            output, err = node.nodetool("compactionstats", capture_output=True)
-            if pattern.search(output):
-                break
+        return [parse_sstablemetadata(metadata).fields['sstable_level'] for (metadata, error, rc) in data]
 
     @since('2.1')
     def sstableofflinerelevel_test(self):
@@ -1,3 +1,7 @@
+import hashlib
+import itertools
+import os
+import threading
 import time
 import uuid
 
@@ -6,19 +10,44 @@ from cassandra import InvalidRequest, ReadTimeout
 from cassandra.query import SimpleStatement, dict_factory, named_tuple_factory
 
 from assertions import assert_invalid
+from benchreport import BenchmarkReport
 from datahelp import create_rows, flatten_into_set, parse_data_into_dicts
-from dtest import Tester, run_scenarios
-from tools import require, since
+from dtest import Tester, debug, run_scenarios
+from loadgen import LoadGenerator
+from tools import benchmark, require, since
+
+# the grid of the paging benchmark, over a dataset of BENCHMARK_ROWS rows
+BENCHMARK_ROWS = 200000
+BENCHMARK_FETCH_SIZES = [100, 1000, 5000, 20000]
+BENCHMARK_PARTITION_WIDTHS = [1, 100, 10000]
+BENCHMARK_ROW_FACTORIES = [dict_factory, named_tuple_factory]
+
+
+def benchmark_row(i, width):
+    """
+    Returns the i-th row (pk, ck, value) of the deterministic dataset of the
+    paging benchmark, with `width` rows per partition.
+    """
+    pk, ck = divmod(i, width)
+    return pk, ck, hashlib.md5('{}:{}'.format(pk, ck)).digest() * 4
 
 
 class Page(object):
     data = None
+    count = None
+    digest = None
 
-    def __init__(self):
-        self.data = []
+    def __init__(self, retain_rows=True):
+        self.data = [] if retain_rows else None
+        self.count = 0
+        self.digest = hashlib.md5()
 
     def add_row(self, row):
-        self.data.append(row)
+        if self.data is not None:
+            self.data.append(row)
+        self.count += 1
+        # dict rows are normalized so the digest doesn't depend on dict ordering
+        self.digest.update(repr(sorted(row.items()) if isinstance(row, dict) else tuple(row)))
 
 
 class PageFetcher(object):
@@ -28,6 +57,11 @@ class PageFetcher(object):
 
     The first page is automatically retrieved, so an initial
     call to request_one is actually getting the *second* page!
+
+    Pages are signalled through a condition from the driver's callbacks, so
+    waiting for a page costs only as long as the server takes to deliver it.
+    With retain_rows=False only the row count and digest of each page are
+    kept, which allows very large scans without holding every row.
     """
     pages = None
     error = None
@@ -35,9 +69,14 @@ class PageFetcher(object):
     requested_pages = None
     retrieved_pages = None
     retrieved_empty_pages = None
+    latencies = None
 
-    def __init__(self, future):
+    def __init__(self, future, retain_rows=True):
         self.pages = []
+        self.retain_rows = retain_rows
+        self.condition = threading.Condition()
+        # time each page took to arrive after being requested, in seconds
+        self.latencies = []
 
         # the first page is automagically returned (eventually)
         # so we'll count this as a request, but the retrieved count
@@ -45,6 +84,7 @@ class PageFetcher(object):
         self.requested_pages = 1
         self.retrieved_pages = 0
         self.retrieved_empty_pages = 0
+        self.requested_at = time.time()
 
         self.future = future
         self.future.add_callbacks(
@@ -58,22 +98,34 @@ class PageFetcher(object):
         self.wait(seconds=30)
 
     def handle_page(self, rows):
+        arrived_at = time.time()
         # occasionally get a final blank page that is useless
         if rows == []:
-            self.retrieved_empty_pages += 1
+            with self.condition:
+                self.retrieved_empty_pages += 1
+                self.condition.notify_all()
             return
 
-        page = Page()
-        self.pages.append(page)
-
+        page = Page(retain_rows=self.retain_rows)
         for row in rows:
             page.add_row(row)
 
-        self.retrieved_pages += 1
+        with self.condition:
+            self.pages.append(page)
+            self.latencies.append(arrived_at - self.requested_at)
+            self.retrieved_pages += 1
+            self.condition.notify_all()
 
     def handle_error(self, exc):
-        self.error = exc
-        raise exc
+        with self.condition:
+            self.error = exc
+            self.condition.notify_all()
+
+    def _request_next_page(self):
+        with self.condition:
+            self.requested_pages += 1
+            self.requested_at = time.time()
+        self.future.start_fetching_next_page()
 
     def request_one(self):
         """
@@ -82,8 +134,7 @@ class PageFetcher(object):
         If the future is exhausted, this is a no-op.
         """
         if self.future.has_more_pages:
-            self.future.start_fetching_next_page()
-            self.requested_pages += 1
+            self._request_next_page()
             self.wait()
 
         return self
@@ -95,8 +146,7 @@ class PageFetcher(object):
         If the future is exhausted, this is a no-op.
         """
         while self.future.has_more_pages:
-            self.future.start_fetching_next_page()
-            self.requested_pages += 1
+            self._request_next_page()
             self.wait()
 
         return self
@@ -107,20 +157,27 @@ class PageFetcher(object):
 
         Requests are made by calling request_one and/or request_all.
 
-        Raises RuntimeError if seconds is exceeded.
+        Raises RuntimeError if seconds is exceeded, or as soon as fetching a
+        page fails.
         """
         expiry = time.time() + seconds
 
-        while time.time() < expiry:
-            if self.requested_pages == (self.retrieved_pages + self.retrieved_empty_pages):
-                return self
-            # small wait so we don't need excess cpu to keep checking
-            time.sleep(0.1)
+        with self.condition:
+            while self.requested_pages != (self.retrieved_pages + self.retrieved_empty_pages):
+                if self.error is not None:
+                    raise RuntimeError(
+                        "Requested pages were not delivered, fetching a page failed: %r. " % (self.error,) +
+                        "Requested: %d; retrieved: %d; empty retreived: %d" %
+                        (self.requested_pages, self.retrieved_pages, self.retrieved_empty_pages))
+                remaining = expiry - time.time()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        "Requested pages were not delivered before timeout." +
+                        "Requested: %d; retrieved: %d; empty retreived: %d" %
+                        (self.requested_pages, self.retrieved_pages, self.retrieved_empty_pages))
+                self.condition.wait(remaining)
 
-        raise RuntimeError(
-            "Requested pages were not delivered before timeout." +
-            "Requested: %d; retrieved: %d; empty retreived: %d" %
-            (self.requested_pages, self.retrieved_pages, self.retrieved_empty_pages))
+        return self
 
     def pagecount(self):
         """
@@ -134,10 +191,38 @@ class PageFetcher(object):
         """
         Returns the number of results found at page_num
         """
-        return len(self.pages[page_num - 1].data)
+        return self.pages[page_num - 1].count
 
     def num_results_all(self):
-        return [len(page.data) for page in self.pages]
+        return [page.count for page in self.pages]
+
+    def page_digests(self):
+        """
+        Returns the hex digest of each retrieved page, available whether or not rows are retained.
+        """
+        return [page.digest.hexdigest() for page in self.pages]
+
+    def latency_stats(self):
+        """
+        Returns a dict of per-page latency statistics, in seconds: count, min, mean, p50, p99 and max.
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {'count': 0}
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {'count': len(latencies),
+                'min': latencies[0],
+                'mean': sum(latencies) / len(latencies),
+                'p50': percentile(0.5),
+                'p99': percentile(0.99),
+                'max': latencies[-1]}
+
+    def _check_rows_retained(self):
+        if not self.retain_rows:
+            raise RuntimeError("Rows were not retained; use num_results_all() or page_digests() instead")
 
     def page_data(self, page_num):
         """
@@ -145,6 +230,7 @@ class PageFetcher(object):
 
         The page should have already been requested with request_one and/or request_all.
         """
+        self._check_rows_retained()
         return self.pages[page_num - 1].data
 
     def all_data(self):
@@ -153,6 +239,7 @@ class PageFetcher(object):
 
         The page(s) should have already been requested with request_one and/or request_all.
         """
+        self._check_rows_retained()
         all_pages_combined = []
         for page in self.pages:
             all_pages_combined.extend(page.data[:])
@@ -167,6 +254,12 @@ class PageFetcher(object):
         return self.future.has_more_pages
 
 
+def cpu_seconds():
+    """ Returns the user and system CPU time of this process, the driver's threads included. """
+    times = os.times()
+    return times[0] + times[1]
+
+
 class PageAssertionMixin(object):
     """Can be added to subclasses of unittest.Tester"""
     def assertEqualIgnoreOrder(self, actual, expected):
@@ -297,6 +390,34 @@ class TestPagingSize(BasePagingTester, PageAssertionMixin):
         # make sure expected and actual have same data elements (ignoring order)
         self.assertEqualIgnoreOrder(pf.all_data(), expected_data)
 
+    def test_without_retaining_rows(self):
+        """
+        A PageFetcher that doesn't retain rows reports the same page sizes
+        and page digests as one that does, plus one latency sample per page.
+        """
+        session = self.prepare()
+        self.create_ks(session, 'test_paging_size', 2)
+        session.execute("CREATE TABLE paging_test ( id int PRIMARY KEY, value text )")
+
+        for i in xrange(1, 1001):
+            session.execute(SimpleStatement("INSERT INTO paging_test (id, value) VALUES (%d, 'value%d')" % (i, i), consistency_level=CL.ALL))
+
+        def fetch(retain_rows):
+            future = session.execute_async(
+                SimpleStatement("select * from paging_test", fetch_size=100, consistency_level=CL.ALL)
+            )
+            return PageFetcher(future, retain_rows=retain_rows).request_all()
+
+        retained = fetch(retain_rows=True)
+        counted = fetch(retain_rows=False)
+
+        self.assertEqual(counted.num_results_all(), [100] * 10)
+        self.assertEqual(counted.num_results_all(), retained.num_results_all())
+        self.assertEqual(counted.page_digests(), retained.page_digests())
+        self.assertEqual(counted.latency_stats()['count'], counted.pagecount())
+        with self.assertRaises(RuntimeError):
+            counted.all_data()
+
     @require(9775, broken_in='3.0')
     def test_undefined_page_size_default(self):
         """
@@ -1111,7 +1232,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
 
         # stop a node and make sure we get an error trying to page the rest
         node1.stop()
-        with self.assertRaisesRegexp(RuntimeError, 'Requested pages were not delivered before timeout'):
+        with self.assertRaisesRegexp(RuntimeError, 'Requested pages were not delivered'):
             pf.request_all()
 
         # TODO: can we resume the node and expect to get more results from the result set or is it done?
@@ -1516,3 +1637,67 @@ class TestPagingWithDeletions(BasePagingTester, PageAssertionMixin):
                    node3.grep_log(failure_msg))
 
         self.assertTrue(failure, "Cannot find tombstone failure threshold error in log")
+
+
+@since('2.0')
+class TestPagingBenchmark(BasePagingTester):
+    """
+    Times paging through the dataset of benchmark_row, for every combination
+    of BENCHMARK_FETCH_SIZES, BENCHMARK_PARTITION_WIDTHS, query shape and
+    BENCHMARK_ROW_FACTORIES.
+    """
+
+    @benchmark
+    def paging_benchmark_test(self):
+        """
+        Two query shapes are measured: a clustering range, reading the rows
+        of up to 100 partitions (as many as needed for BENCHMARK_ROWS / 10
+        rows) through an IN on the partition keys and a range on the
+        clustering column,
+        and a token range scanning the whole table. Each query is run once
+        to warm up, then timed. The per-page latencies, the rows per second
+        and the client CPU seconds per 1000 rows are reported to paging.csv
+        and .json in BENCHMARK_DIR.
+        """
+        session = self.prepare()
+        self.create_ks(session, 'paging_bench', 3)
+        report = BenchmarkReport('paging', version=self.cluster.version(), rows=BENCHMARK_ROWS)
+
+        for width in BENCHMARK_PARTITION_WIDTHS:
+            table = 'bench_{}'.format(width)
+            self._write_dataset(session, table, width)
+            partitions = max(1, min(100, BENCHMARK_ROWS // 10 // width))
+            queries = {
+                'clustering_range': ("SELECT * FROM {} WHERE pk IN ({}) AND ck >= 0 AND ck < {}".format(
+                    table, ', '.join(str(pk) for pk in range(partitions)), width), partitions * width),
+                'token_range': ("SELECT * FROM {} WHERE token(pk) >= -9223372036854775808".format(table), BENCHMARK_ROWS)}
+            for (shape, (query, expected)), fetch_size, row_factory in itertools.product(
+                    sorted(queries.items()), BENCHMARK_FETCH_SIZES, BENCHMARK_ROW_FACTORIES):
+                session.row_factory = row_factory
+                self._page(session, query, fetch_size)
+                result = self._page(session, query, fetch_size)
+                self.assertEqual(expected, result.pop('rows_read'))
+                result.update(partition_width=width, query=shape, fetch_size=fetch_size, row_factory=row_factory.__name__)
+                debug(result)
+                report.add(**result)
+
+    def _write_dataset(self, session, table, width):
+        session.execute("CREATE TABLE {} (pk int, ck int, value blob, PRIMARY KEY (pk, ck))".format(table))
+        insert = session.prepare("INSERT INTO {} (pk, ck, value) VALUES (?, ?, ?)".format(table))
+        insert.consistency_level = CL.ALL
+        result = LoadGenerator(session).add('write', insert, lambda i: benchmark_row(i, width)).run(count=BENCHMARK_ROWS)
+        self.assertEqual(0, result.errors, result.error_samples)
+        self.cluster.flush()
+
+    def _page(self, session, query, fetch_size):
+        cpu, start = cpu_seconds(), time.time()
+        future = session.execute_async(SimpleStatement(query, fetch_size=fetch_size, consistency_level=CL.ONE))
+        pages = PageFetcher(future, retain_rows=False).request_all()
+        seconds, cpu = time.time() - start, cpu_seconds() - cpu
+        rows = sum(pages.num_results_all())
+        return {'rows_read': rows,
+                'pages': pages.pagecount(),
+                'seconds': seconds,
+                'rows_per_sec': rows / seconds,
+                'client_cpu_ms_per_1000_rows': cpu * 1000 * 1000 / rows,
+                'page_latency_ms': dict((name, value * 1000) for name, value in pages.latency_stats().items() if name != 'count')}
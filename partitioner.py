@@ -0,0 +1,458 @@
+"""
+In-harness model of Cassandra's partitioners and replica placement.
+
+Computes Murmur3Partitioner and RandomPartitioner tokens for partition keys
+without a round trip to the cluster, and models which endpoints replicate a
+token under SimpleStrategy and NetworkTopologyStrategy for a given ring,
+vnodes included. Tests can use it to direct writes at specific replicas and
+to predict exactly which operations should be available when nodes are down.
+
+Example usage:
+
+    ring = Ring.from_session(session)
+    strategy = NetworkTopologyStrategy({'dc1': 2, 'dc2': 1})
+    token = murmur3_token(serialize_key(42, 'int'))
+    replicas = ring.replicas(strategy, token)
+"""
+import hashlib
+import struct
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+
+from cassandra import ConsistencyLevel
+
+MASK_64 = (1 << 64) - 1
+MURMUR3_MIN = -(1 << 63)
+MURMUR3_MAX = (1 << 63) - 1
+RANDOM_MIN = 0
+RANDOM_MAX = 1 << 127
+
+_C1 = 0x87c37b91114253d5
+_C2 = 0x4cf5ad432745937f
+
+
+def _rotl64(v, n):
+    return ((v << n) | (v >> (64 - n))) & MASK_64
+
+
+def _fmix(k):
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) & MASK_64
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) & MASK_64
+    k ^= k >> 33
+    return k
+
+
+def _signed_byte(b):
+    # Cassandra reads the tail bytes as signed Java bytes, which are then
+    # sign-extended when widened to a long
+    return (b - 256 if b > 127 else b) & MASK_64
+
+
+def _to_signed(v):
+    return v - (1 << 64) if v > MURMUR3_MAX else v
+
+
+def murmur3_token(key):
+    """
+    Returns the Murmur3Partitioner token of `key`, the serialized partition
+    key as a byte string. This replicates Cassandra's variant of
+    MurmurHash3_x64_128, which differs from the reference implementation in
+    how the trailing bytes are read.
+    """
+    data = bytearray(key)
+    length = len(data)
+    if length == 0:
+        return MURMUR3_MIN
+
+    h1 = h2 = 0
+    nblocks = length >> 4
+    for i in xrange(nblocks):
+        k1, k2 = struct.unpack_from('<QQ', buffer(data), i * 16)
+        k1 = (k1 * _C1) & MASK_64
+        k1 = _rotl64(k1, 31)
+        k1 = (k1 * _C2) & MASK_64
+        h1 ^= k1
+        h1 = _rotl64(h1, 27)
+        h1 = (h1 + h2) & MASK_64
+        h1 = (h1 * 5 + 0x52dce729) & MASK_64
+        k2 = (k2 * _C2) & MASK_64
+        k2 = _rotl64(k2, 33)
+        k2 = (k2 * _C1) & MASK_64
+        h2 ^= k2
+        h2 = _rotl64(h2, 31)
+        h2 = (h2 + h1) & MASK_64
+        h2 = (h2 * 5 + 0x38495ab5) & MASK_64
+
+    tail = nblocks * 16
+    remaining = length & 15
+    k1 = k2 = 0
+    for i in xrange(min(remaining, 15) - 1, 7, -1):
+        k2 ^= (_signed_byte(data[tail + i]) << ((i - 8) * 8)) & MASK_64
+    if remaining > 8:
+        k2 = (k2 * _C2) & MASK_64
+        k2 = _rotl64(k2, 33)
+        k2 = (k2 * _C1) & MASK_64
+        h2 ^= k2
+    for i in xrange(min(remaining, 8) - 1, -1, -1):
+        k1 ^= (_signed_byte(data[tail + i]) << (i * 8)) & MASK_64
+    if remaining > 0:
+        k1 = (k1 * _C1) & MASK_64
+        k1 = _rotl64(k1, 31)
+        k1 = (k1 * _C2) & MASK_64
+        h1 ^= k1
+
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & MASK_64
+    h2 = (h2 + h1) & MASK_64
+    h1 = _fmix(h1)
+    h2 = _fmix(h2)
+    h1 = (h1 + h2) & MASK_64
+
+    token = _to_signed(h1)
+    # Long.MIN_VALUE is reserved for the minimum token
+    return MURMUR3_MAX if token == MURMUR3_MIN else token
+
+
+def md5_token(key):
+    """
+    Returns the RandomPartitioner token of `key`: the absolute value of the
+    MD5 digest read as a signed big-endian integer.
+    """
+    value = int(hashlib.md5(bytes(key)).hexdigest(), 16)
+    if value >= 1 << 127:
+        value -= 1 << 128
+    return abs(value)
+
+
+_SERIALIZERS = {
+    'int': lambda v: struct.pack('>i', v),
+    'bigint': lambda v: struct.pack('>q', v),
+    'counter': lambda v: struct.pack('>q', v),
+    'timestamp': lambda v: struct.pack('>q', v),
+    'double': lambda v: struct.pack('>d', v),
+    'float': lambda v: struct.pack('>f', v),
+    'boolean': lambda v: '\x01' if v else '\x00',
+    'text': lambda v: v.encode('utf-8') if isinstance(v, unicode) else v,
+    'varchar': lambda v: v.encode('utf-8') if isinstance(v, unicode) else v,
+    'ascii': lambda v: str(v),
+    'blob': lambda v: str(v),
+    'uuid': lambda v: (v if isinstance(v, uuid.UUID) else uuid.UUID(v)).bytes,
+    'timeuuid': lambda v: (v if isinstance(v, uuid.UUID) else uuid.UUID(v)).bytes,
+}
+
+
+def serialize_key(value, cql_type):
+    """
+    Serializes a partition key the way Cassandra does before hashing it.
+
+    For a single-column partition key, `value` is the column value and
+    `cql_type` its CQL type name, e.g. 'int' or 'text'. For a composite
+    partition key, both are sequences with one entry per component.
+    """
+    if isinstance(cql_type, basestring):
+        return _SERIALIZERS[cql_type](value)
+    components = []
+    for component, component_type in zip(value, cql_type):
+        serialized = _SERIALIZERS[component_type](component)
+        components.append(struct.pack('>H', len(serialized)) + serialized + '\x00')
+    return ''.join(components)
+
+
+PARTITIONERS = {
+    'murmur3': murmur3_token,
+    'random': md5_token,
+}
+
+
+def tokens_for_keys(keys, cql_type='int', partitioner='murmur3'):
+    """
+    Computes the tokens of a batch of partition keys, in order.
+
+    `partitioner` is 'murmur3' or 'random'.
+    """
+    hash_fn = PARTITIONERS[partitioner]
+    return [hash_fn(serialize_key(key, cql_type)) for key in keys]
+
+
+# (lowest token, exclusive upper bound) of each partitioner's token space
+TOKEN_SPACES = {
+    'murmur3': (MURMUR3_MIN, MURMUR3_MAX + 1),
+    'random': (RANDOM_MIN, RANDOM_MAX),
+}
+
+BalanceReport = namedtuple('BalanceReport', ['dc', 'nodes', 'min_ownership', 'max_ownership', 'ratio'])
+
+
+def generate_tokens(dc_node_counts, partitioner='murmur3'):
+    """
+    Returns one list of tokens per datacenter, as tools/bin/token-generator
+    computes them for NetworkTopologyStrategy: the nodes of a datacenter are
+    spaced by the ring range over their number, and datacenter `dc` is
+    shifted by `dc` times the ring range over twice the number of
+    datacenters times the largest datacenter. The shift is under half the
+    smallest spacing, so tokens that would coincide across datacenters are
+    kept apart.
+    """
+    t_min, t_max = TOKEN_SPACES[partitioner]
+    ring_range = t_max - t_min
+    dc_offset = ring_range // (len(dc_node_counts) * max(dc_node_counts) * 2)
+    tokens_by_dc = []
+    for dc, nodes in enumerate(dc_node_counts):
+        arc_size = ring_range // nodes
+        tokens_by_dc.append([t_min + i * arc_size + dc * dc_offset for i in xrange(nodes)])
+    return tokens_by_dc
+
+
+def token_problems(tokens_by_dc, partitioner='murmur3'):
+    """
+    Checks a token assignment in one pass over the sorted tokens of all
+    datacenters. Returns a list of human-readable problems: tokens out of
+    the partitioner's range and duplicated tokens. An empty list means the
+    assignment is valid.
+    """
+    t_min, t_max = TOKEN_SPACES[partitioner]
+    tokens = sorted(t for dc_tokens in tokens_by_dc for t in dc_tokens)
+    problems = []
+    if tokens and tokens[0] < t_min:
+        problems.append('tokens below {}: {}'.format(t_min, [t for t in tokens if t < t_min]))
+    if tokens and tokens[-1] >= t_max:
+        problems.append('tokens above {}: {}'.format(t_max - 1, [t for t in tokens if t >= t_max]))
+    duplicates = sorted(set(a for a, b in zip(tokens, tokens[1:]) if a == b))
+    if duplicates:
+        problems.append('duplicate tokens: {}'.format(duplicates))
+    return problems
+
+
+def ownership(tokens, partitioner='murmur3'):
+    """
+    Returns the fraction of the ring owned by each token of `tokens`, in
+    sorted token order: each token owns the range from the previous token
+    (wrapping around the ring) up to itself.
+    """
+    t_min, t_max = TOKEN_SPACES[partitioner]
+    ring_range = float(t_max - t_min)
+    tokens = sorted(tokens)
+    if len(tokens) == 1:
+        return [1.0]
+    previous = [tokens[-1] - (t_max - t_min)] + tokens[:-1]
+    return [(t - p) / ring_range for t, p in zip(tokens, previous)]
+
+
+def ring_balance(tokens_by_dc, partitioner='murmur3'):
+    """
+    Reports the ring ownership balance of each datacenter, considering only
+    that datacenter's tokens as NetworkTopologyStrategy does. A ratio of
+    largest to smallest ownership of 1.0 is a perfectly balanced ring.
+    """
+    reports = []
+    for dc, tokens in enumerate(tokens_by_dc):
+        owned = ownership(tokens, partitioner)
+        reports.append(BalanceReport(dc, len(tokens), min(owned), max(owned), max(owned) / min(owned)))
+    return reports
+
+
+class SimpleStrategy(object):
+    """
+    Places replicas on the next `replication_factor` distinct endpoints
+    found walking the ring clockwise, regardless of topology.
+    """
+
+    def __init__(self, replication_factor):
+        self.replication_factor = replication_factor
+
+    def total_replication_factor(self):
+        return self.replication_factor
+
+    def dc_replication_factor(self, dc):
+        return self.replication_factor
+
+    def calculate_replicas(self, ring, index):
+        replicas = []
+        for endpoint in ring.walk(index):
+            if endpoint not in replicas:
+                replicas.append(endpoint)
+                if len(replicas) == self.replication_factor:
+                    break
+        return replicas
+
+    def __repr__(self):
+        return 'SimpleStrategy({!r})'.format(self.replication_factor)
+
+
+class NetworkTopologyStrategy(object):
+    """
+    Places `replication_factor` replicas in each datacenter, walking the ring
+    clockwise and spreading replicas across distinct racks first, as
+    NetworkTopologyStrategy does.
+    """
+
+    def __init__(self, dc_replication_factors):
+        self.dc_replication_factors = dict(dc_replication_factors)
+
+    def total_replication_factor(self):
+        return sum(self.dc_replication_factors.values())
+
+    def dc_replication_factor(self, dc):
+        return self.dc_replication_factors.get(dc, 0)
+
+    def calculate_replicas(self, ring, index):
+        rfs = dict((dc, rf) for dc, rf in self.dc_replication_factors.items() if rf > 0)
+        dc_endpoints = dict((dc, set(e for e in ring.endpoints if ring.datacenters[e] == dc)) for dc in rfs)
+        dc_racks = dict((dc, set(ring.racks[e] for e in endpoints)) for dc, endpoints in dc_endpoints.items())
+        dc_replicas = dict((dc, set()) for dc in rfs)
+        seen_racks = dict((dc, set()) for dc in rfs)
+        skipped = dict((dc, []) for dc in rfs)
+        replicas = []
+
+        def sufficient(dc):
+            return len(dc_replicas[dc]) >= min(len(dc_endpoints[dc]), rfs[dc])
+
+        def add(dc, endpoint):
+            if endpoint not in dc_replicas[dc]:
+                dc_replicas[dc].add(endpoint)
+                replicas.append(endpoint)
+
+        for endpoint in ring.walk(index):
+            if all(sufficient(dc) for dc in rfs):
+                break
+            dc = ring.datacenters[endpoint]
+            if dc not in rfs or sufficient(dc):
+                continue
+            # once every rack of the dc holds a replica, racks no longer matter
+            if len(seen_racks[dc]) == len(dc_racks[dc]):
+                add(dc, endpoint)
+                continue
+            rack = ring.racks[endpoint]
+            if rack in seen_racks[dc]:
+                if endpoint not in skipped[dc]:
+                    skipped[dc].append(endpoint)
+                continue
+            add(dc, endpoint)
+            seen_racks[dc].add(rack)
+            if len(seen_racks[dc]) == len(dc_racks[dc]):
+                for skipped_endpoint in skipped[dc]:
+                    if sufficient(dc):
+                        break
+                    add(dc, skipped_endpoint)
+        return replicas
+
+    def __repr__(self):
+        return 'NetworkTopologyStrategy({!r})'.format(sorted(self.dc_replication_factors.items()))
+
+
+class Ring(object):
+    """
+    A token ring: every token with the endpoint that owns it, plus the
+    datacenter and rack of each endpoint. Replica sets are computed once per
+    (strategy, range) and cached, so bulk lookups cost a bisection per token.
+    """
+
+    def __init__(self, tokens_by_endpoint, datacenters=None, racks=None):
+        pairs = sorted((int(token), endpoint)
+                       for endpoint, tokens in tokens_by_endpoint.items()
+                       for token in tokens)
+        self.tokens = [token for token, _ in pairs]
+        self.owners = [endpoint for _, endpoint in pairs]
+        self.endpoints = sorted(tokens_by_endpoint)
+        self.datacenters = datacenters or dict((e, 'datacenter1') for e in self.endpoints)
+        self.racks = racks or dict((e, 'rack1') for e in self.endpoints)
+        self._cache = {}
+
+    @classmethod
+    def from_session(cls, session):
+        """
+        Builds the ring from the system tables, as seen by the node `session`
+        is connected to.
+        """
+        tokens, datacenters, racks = {}, {}, {}
+        local = session.execute('SELECT broadcast_address, tokens, data_center, rack FROM system.local')[0]
+        rows = [(local.broadcast_address, local.tokens, local.data_center, local.rack)]
+        rows += [tuple(row) for row in session.execute('SELECT peer, tokens, data_center, rack FROM system.peers')]
+        for endpoint, endpoint_tokens, dc, rack in rows:
+            tokens[endpoint] = [int(t) for t in endpoint_tokens]
+            datacenters[endpoint] = dc
+            racks[endpoint] = rack
+        return cls(tokens, datacenters, racks)
+
+    @classmethod
+    def from_cluster(cls, cluster):
+        """
+        Builds the ring of a ccm cluster populated without vnodes, from each
+        node's initial token.
+        """
+        nodes = cluster.nodelist()
+        return cls(dict((n.address(), [n.initial_token]) for n in nodes),
+                   dict((n.address(), n.data_center or 'datacenter1') for n in nodes))
+
+    def walk(self, index):
+        """ Yields the owners of the ring's tokens, clockwise from `index`. """
+        count = len(self.tokens)
+        for i in xrange(count):
+            yield self.owners[(index + i) % count]
+
+    def range_index(self, token):
+        """
+        Returns the index of the first ring token greater than or equal to
+        `token`, i.e. the end of the range (previous, index] holding it.
+        """
+        index = bisect_left(self.tokens, token)
+        return 0 if index == len(self.tokens) else index
+
+    def replicas(self, strategy, token):
+        """ Returns the replicas of `token`, primary replica first. """
+        index = self.range_index(token)
+        key = (repr(strategy), index)
+        if key not in self._cache:
+            self._cache[key] = strategy.calculate_replicas(self, index)
+        return self._cache[key]
+
+    def replicas_for_tokens(self, strategy, tokens):
+        """ Bulk version of replicas(), returning one replica list per token. """
+        return [self.replicas(strategy, token) for token in tokens]
+
+    def replicas_for_keys(self, strategy, keys, cql_type='int', partitioner='murmur3'):
+        """
+        Returns an OrderedDict mapping each partition key to its replicas.
+        """
+        tokens = tokens_for_keys(keys, cql_type, partitioner)
+        return OrderedDict(zip(keys, self.replicas_for_tokens(strategy, tokens)))
+
+    def is_available(self, strategy, token, consistency_level, live_endpoints, local_dc=None):
+        """
+        Predicts whether an operation on `token` at `consistency_level` can
+        succeed when only `live_endpoints` are up. Quorums are computed from
+        the configured replication factors, like Cassandra does, so a
+        replication factor larger than the number of nodes is never
+        satisfiable at QUORUM or ALL.
+        """
+        if consistency_level == ConsistencyLevel.ANY:
+            return True
+        replicas = self.replicas(strategy, token)
+        live = [r for r in replicas if r in live_endpoints]
+
+        def live_in(dc):
+            return len([r for r in live if self.datacenters[r] == dc])
+
+        def quorum(rf):
+            return rf // 2 + 1
+
+        if consistency_level in (ConsistencyLevel.LOCAL_QUORUM, ConsistencyLevel.LOCAL_SERIAL):
+            return live_in(local_dc) >= quorum(strategy.dc_replication_factor(local_dc))
+        if consistency_level == ConsistencyLevel.LOCAL_ONE:
+            return live_in(local_dc) >= 1
+        if consistency_level == ConsistencyLevel.EACH_QUORUM:
+            dcs = set(self.datacenters[r] for r in replicas)
+            return all(live_in(dc) >= quorum(strategy.dc_replication_factor(dc)) for dc in dcs)
+        required = {
+            ConsistencyLevel.ONE: 1,
+            ConsistencyLevel.TWO: 2,
+            ConsistencyLevel.THREE: 3,
+            ConsistencyLevel.QUORUM: quorum(strategy.total_replication_factor()),
+            ConsistencyLevel.SERIAL: quorum(strategy.total_replication_factor()),
+            ConsistencyLevel.ALL: strategy.total_replication_factor(),
+        }[consistency_level]
+        return len(live) >= required
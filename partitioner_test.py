@@ -0,0 +1,129 @@
+import uuid
+from unittest import TestCase
+
+from cassandra import ConsistencyLevel, Unavailable
+from cassandra.query import SimpleStatement
+
+from dtest import Tester, debug
+from partitioner import (NetworkTopologyStrategy, Ring, SimpleStrategy,
+                         generate_tokens, token_problems, tokens_for_keys)
+
+
+class TestGenerateTokens(TestCase):
+
+    def generate_tokens_test(self):
+        self.assertEqual([[0, 1 << 126]], generate_tokens([2], 'random'))
+        # the second dc is shifted by 2**64 / (2 * 3 * 2)
+        self.assertEqual([[-(1 << 63), -(1 << 63) + (1 << 64) // 3, -(1 << 63) + 2 * ((1 << 64) // 3)],
+                          [-(1 << 63) + (1 << 64) // 12, (1 << 64) // 12]],
+                         generate_tokens([3, 2]))
+        for dc_nodes in ([3, 2], [3, 5, 5], [12, 5, 7], [50, 100, 250], [2500, 2500, 2500, 2500]):
+            for partitioner in ('murmur3', 'random'):
+                self.assertEqual([], token_problems(generate_tokens(dc_nodes, partitioner), partitioner))
+
+
+class TestPartitionerModel(Tester):
+    """
+    Checks the in-harness partitioner and replica placement model in
+    partitioner.py against what a live cluster computes.
+    """
+
+    def _check_tokens(self, partitioner):
+        session = self.patient_cql_connection(self.cluster.nodelist()[0])
+        self.create_ks(session, 'ks', 1)
+        session.execute("CREATE TABLE ints (k int PRIMARY KEY, v int)")
+        session.execute("CREATE TABLE texts (k text PRIMARY KEY, v int)")
+        session.execute("CREATE TABLE uuids (k uuid PRIMARY KEY, v int)")
+        session.execute("CREATE TABLE composites (k1 int, k2 text, v int, PRIMARY KEY ((k1, k2)))")
+
+        int_keys = range(-500, 500)
+        text_keys = [u'key{}'.format(i) for i in xrange(200)] + [u'\xe9t\xe9', u'x' * 40]
+        uuid_keys = [uuid.uuid4() for _ in xrange(100)]
+        composite_keys = [(i, 'c{}'.format(i)) for i in xrange(100)]
+        for k in int_keys:
+            session.execute("INSERT INTO ints (k, v) VALUES (%s, 0)", [k])
+        for k in text_keys:
+            session.execute("INSERT INTO texts (k, v) VALUES (%s, 0)", [k])
+        for k in uuid_keys:
+            session.execute("INSERT INTO uuids (k, v) VALUES (%s, 0)", [k])
+        for k1, k2 in composite_keys:
+            session.execute("INSERT INTO composites (k1, k2, v) VALUES (%s, %s, 0)", [k1, k2])
+
+        def check(table, keys, cql_type, key_columns='k'):
+            expected = dict(zip(keys, tokens_for_keys(keys, cql_type, partitioner)))
+            rows = session.execute("SELECT token({0}), {0} FROM {1}".format(key_columns, table))
+            self.assertEqual(len(rows), len(keys))
+            for row in rows:
+                key = tuple(row[1:]) if len(row) > 2 else row[1]
+                self.assertEqual(expected[key], row[0], "token mismatch for {!r} in {}".format(key, table))
+
+        check('ints', int_keys, 'int')
+        check('texts', text_keys, 'text')
+        check('uuids', uuid_keys, 'uuid')
+        check('composites', composite_keys, ('int', 'text'), key_columns='k1, k2')
+
+    def murmur3_tokens_test(self):
+        """
+        Tokens computed by partitioner.murmur3_token for int, text, uuid and
+        composite partition keys match the server's token() function.
+        """
+        self.cluster.populate(1).start(wait_for_binary_proto=True)
+        self._check_tokens('murmur3')
+
+    def random_tokens_test(self):
+        """
+        Tokens computed by partitioner.md5_token match the server's token()
+        function under RandomPartitioner.
+        """
+        self.cluster.set_partitioner('org.apache.cassandra.dht.RandomPartitioner')
+        self.cluster.populate(1).start(wait_for_binary_proto=True)
+        self._check_tokens('random')
+
+    def replica_placement_test(self):
+        """
+        Replicas predicted by partitioner.Ring agree with `nodetool
+        getendpoints` for SimpleStrategy and NetworkTopologyStrategy on a
+        two-dc cluster, and availability predictions agree with the cluster
+        once a node is down.
+        """
+        cluster = self.cluster
+        cluster.populate([3, 2]).start(wait_for_binary_proto=True)
+        node1 = cluster.nodelist()[0]
+        session = self.patient_exclusive_cql_connection(node1)
+        ring = Ring.from_session(session)
+
+        strategies = {
+            'simple': SimpleStrategy(3),
+            'nts': NetworkTopologyStrategy({'dc1': 2, 'dc2': 1}),
+        }
+        session.execute("CREATE KEYSPACE simple WITH replication = {'class': 'SimpleStrategy', 'replication_factor': 3}")
+        session.execute("CREATE KEYSPACE nts WITH replication = {'class': 'NetworkTopologyStrategy', 'dc1': 2, 'dc2': 1}")
+        for ks in strategies:
+            session.execute("CREATE TABLE {}.t (k int PRIMARY KEY, v int)".format(ks))
+
+        keys = range(10)
+        for ks, strategy in strategies.items():
+            predicted = ring.replicas_for_keys(strategy, keys)
+            for key in keys:
+                out, err = node1.nodetool('getendpoints {} t {}'.format(ks, key), capture_output=True)
+                actual = set(line.strip() for line in out.splitlines() if line.strip())
+                debug("{} key {}: predicted {}, actual {}".format(ks, key, predicted[key], actual))
+                self.assertEqual(set(predicted[key]), actual)
+
+        # stop the primary dc1 replica of key 0, then compare predictions
+        # with what a live dc1 coordinator actually does
+        token = tokens_for_keys([0])[0]
+        down = [r for r in ring.replicas(strategies['nts'], token) if ring.datacenters[r] == 'dc1'][0]
+        [down_node] = [n for n in cluster.nodelist() if n.address() == down]
+        [coordinator] = [n for n in cluster.nodelist()[:2] if n is not down_node][:1]
+        down_node.stop(wait_other_notice=True)
+        session = self.patient_exclusive_cql_connection(coordinator)
+        live = set(ring.endpoints) - set([down])
+        for cl in (ConsistencyLevel.ONE, ConsistencyLevel.LOCAL_QUORUM, ConsistencyLevel.EACH_QUORUM, ConsistencyLevel.ALL):
+            predicted = ring.is_available(strategies['nts'], token, cl, live, local_dc='dc1')
+            try:
+                session.execute(SimpleStatement("INSERT INTO nts.t (k, v) VALUES (0, 1)", consistency_level=cl))
+                succeeded = True
+            except Unavailable:
+                succeeded = False
+            self.assertEqual(predicted, succeeded, "availability at {} mispredicted".format(cl))
@@ -0,0 +1,119 @@
+"""
+A local store of performance results, so that runs of a test can be compared
+with the previous runs of the same test, on the same Cassandra version and
+configuration.
+
+Results are kept in a JSON file, as a list of samples per key. A sample is a
+dict of metric name -> number, plus the time it was recorded.
+
+median() and mann_whitney_less() compare a new sample with the recorded
+ones without being thrown off by a single noisy run; see
+assertions.assert_no_regression.
+
+Example usage:
+
+    store = BaselineStore('logs/perf_baselines.json')
+    key = baseline_key('compaction_test.TestCompaction.data_size_test', '2.1.9', 'write n=100000')
+    store.record(key, {'op_rate': 11289, 'latency_p99_ms': 29.0})
+    store.values(key, 'op_rate')
+"""
+import json
+import math
+import os
+import tempfile
+import time
+
+
+def baseline_key(test, version, config=None):
+    """
+    Returns the store key of a result of `test` on Cassandra `version` with
+    `config`, a string or a dict of options.
+    """
+    if isinstance(config, dict):
+        config = json.dumps(config, sort_keys=True)
+    return '{} {} {}'.format(test, version, config or '')
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def mann_whitney_less(sample, baseline):
+    """
+    Returns the p-value of the one-sided Mann-Whitney U test that values of
+    `sample` tend to be smaller than those of `baseline`. It uses the normal
+    approximation with tie and continuity corrections, which is reasonable
+    from about 5 values on each side.
+    """
+    n1, n2 = len(sample), len(baseline)
+    n = n1 + n2
+    values = sorted([(v, 0) for v in sample] + [(v, 1) for v in baseline])
+    ranks = [0.0] * n
+    ties = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u = sum(rank for rank, (_, side) in zip(ranks, values) if side == 0) - n1 * (n1 + 1) / 2.0
+    variance = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+    if variance == 0:
+        return 1.0
+    z = (u + 0.5 - n1 * n2 / 2.0) / math.sqrt(variance)
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+class BaselineStore(object):
+    """
+    The samples recorded in the JSON file at `path`, keeping the last
+    `max_samples` of each key.
+    """
+
+    def __init__(self, path, max_samples=50):
+        self.path = path
+        self.max_samples = max_samples
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def samples(self, key):
+        """ Returns the samples recorded under `key`, oldest first. """
+        return self.load().get(key, [])
+
+    def values(self, key, metric):
+        """ Returns the values of `metric` recorded under `key`, oldest first. """
+        return [sample[metric] for sample in self.samples(key) if sample.get(metric) is not None]
+
+    def record(self, key, metrics):
+        """
+        Records a sample of `metrics`, a dict or a namedtuple of numbers,
+        under `key`. Values that are not numbers are left out.
+        """
+        if hasattr(metrics, '_asdict'):
+            metrics = metrics._asdict()
+        sample = dict((name, value) for name, value in metrics.items()
+                      if isinstance(value, (int, long, float)) and value == value)
+        sample['recorded_at'] = time.time()
+
+        data = self.load()
+        data[key] = (data.get(key, []) + [sample])[-self.max_samples:]
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # replace the file atomically, so a concurrent reader never sees it half written
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+        return sample
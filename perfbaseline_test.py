@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from assertions import assert_no_regression
+from perfbaseline import BaselineStore, baseline_key, mann_whitney_less, median
+from tooloutput import StressSummary
+
+
+class TestPerfBaseline(TestCase):
+
+    def median_test(self):
+        self.assertEqual(3, median([5, 1, 3]))
+        self.assertEqual(2.5, median([4, 1, 3, 2]))
+
+    def mann_whitney_test(self):
+        # every trial below the whole baseline
+        self.assertLess(mann_whitney_less([1, 2, 3, 4, 5], [6, 7, 8, 9, 10]), 0.01)
+        self.assertGreater(mann_whitney_less([6, 7, 8, 9, 10], [1, 2, 3, 4, 5]), 0.99)
+        # interleaved values, and all values equal, are no evidence of a change
+        self.assertGreater(mann_whitney_less([1, 3, 5, 7, 9], [2, 4, 6, 8, 10]), 0.05)
+        self.assertEqual(1.0, mann_whitney_less([5] * 5, [5] * 5))
+
+    def store_test(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = BaselineStore(os.path.join(directory, 'baselines', 'perf.json'), max_samples=3)
+            key = baseline_key('stress_tool_test.TestStress.write_test', '2.1.9', {'n': 1000, 'threads': 50})
+            self.assertEqual(key, baseline_key('stress_tool_test.TestStress.write_test', '2.1.9', {'threads': 50, 'n': 1000}))
+            self.assertEqual([], store.samples(key))
+
+            for rate in (100, 200, 300, 400):
+                store.record(key, {'op_rate': rate, 'latency_mean_ms': float('nan'), 'name': 'write'})
+            self.assertEqual([200, 300, 400], store.values(key, 'op_rate'))
+            self.assertEqual([], store.values(key, 'latency_mean_ms'))
+
+            summary = StressSummary(*([None] * len(StressSummary._fields)))._replace(op_rate=500)
+            store.record(key, summary)
+            self.assertEqual([300, 400, 500], BaselineStore(store.path).values(key, 'op_rate'))
+        finally:
+            shutil.rmtree(directory)
+
+
+class FakeStore(object):
+
+    def __init__(self, baseline):
+        self.baseline = baseline
+        self.recorded = []
+
+    def values(self, key, field):
+        return list(self.baseline)
+
+    def record(self, key, sample):
+        self.recorded.append((key, sample))
+
+
+class TestAssertNoRegression(TestCase):
+
+    def _assert(self, store, trials, **kwargs):
+        values = iter(trials)
+        return assert_no_regression(lambda: next(values), 'key', trials=len(trials), store=store, **kwargs)
+
+    def pass_test(self):
+        store = FakeStore([100, 101, 99, 100, 102])
+        self.assertEqual([98, 99, 100, 101, 97], self._assert(store, [98, 99, 100, 101, 97]))
+        self.assertEqual([('key', {'value': v}) for v in (98, 99, 100, 101, 97)], store.recorded)
+
+    def fail_test(self):
+        store = FakeStore([100, 101, 99, 100, 102])
+        with self.assertRaises(AssertionError):
+            self._assert(store, [50, 51, 49, 52, 48])
+        self.assertEqual([], store.recorded)
+        # latencies regress upwards
+        with self.assertRaises(AssertionError):
+            self._assert(store, [150, 151, 149, 152, 148], higher_is_better=False)
+        self.assertEqual([], store.recorded)
+
+    def too_few_baseline_test(self):
+        store = FakeStore([100, 101])
+        self.assertEqual([10, 11], self._assert(store, [10, 11], field='op_rate'))
+        self.assertEqual([('key', {'op_rate': 10}), ('key', {'op_rate': 11})], store.recorded)
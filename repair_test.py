@@ -1,42 +1,56 @@
+import itertools
+import os
 import time
 from collections import namedtuple
 
 from cassandra import ConsistencyLevel
 from cassandra.query import SimpleStatement
 
+from benchreport import BenchmarkReport
 from dtest import Tester, debug
-from tools import insert_c1c2, no_vnodes, query_c1c2, require, since
+from jmxnodetool import flush_nodes
+from jmxutils import JolokiaAgent, make_mbean, remove_perf_disable_shared_mem
+from loadgen import LoadGenerator
+from replica_digest import assert_replicas_consistent, compare_replicas, replica_session
+from tools import benchmark, grep_log_since, insert_c1c2, log_time, no_vnodes, query_c1c2, require, since
+
+# the grid of the repair benchmark: rows written to every replica, fraction of
+# them then written while a replica is down, and kind of repair
+BENCHMARK_ROWS = [100000, 1000000]
+BENCHMARK_DIVERGENCE = [0.01, 0.1]
+BENCHMARK_REPAIRS = ['sequential', 'parallel', 'incremental']
+BENCHMARK_VALUE_SIZE = 256
+TOTAL_OUTGOING_BYTES = make_mbean('metrics', type='Streaming', name='TotalOutgoingBytes')
 
 
 class TestRepair(Tester):
 
-    def check_rows_on_node(self, node_to_check, rows, found=None, missings=None, restart=True):
+    def check_rows_on_node(self, node_to_check, rows, found=None, missings=None):
+        """
+        Checks the rows of ks.cf held by `node_to_check`, which must replicate
+        all of them, with every node still up: see replica_digest for the
+        configuration this needs.
+        """
         if found is None:
             found = []
         if missings is None:
             missings = []
-        stopped_nodes = []
-
-        for node in self.cluster.nodes.values():
-            if node.is_running() and node is not node_to_check:
-                stopped_nodes.append(node)
-                node.stop(wait_other_notice=True)
 
-        session = self.patient_cql_connection(node_to_check, 'ks')
-        result = session.execute("SELECT * FROM cf LIMIT %d" % (rows * 2))
-        self.assertEqual(len(result), rows, len(result))
+        session = replica_session(self, node_to_check, 'ks', 'cf')
+        try:
+            session.set_keyspace('ks')
+            result = session.execute(SimpleStatement("SELECT * FROM cf LIMIT %d" % (rows * 2), consistency_level=ConsistencyLevel.ONE))
+            self.assertEqual(len(result), rows, len(result))
 
-        for k in found:
-            query_c1c2(session, k, ConsistencyLevel.ONE)
+            for k in found:
+                query_c1c2(session, k, ConsistencyLevel.ONE)
 
-        for k in missings:
-            query = SimpleStatement("SELECT c1, c2 FROM cf WHERE key='k%d'" % k, consistency_level=ConsistencyLevel.ONE)
-            res = session.execute(query)
-            self.assertEqual(len(filter(lambda x: len(x) != 0, res)), 0, res)
-
-        if restart:
-            for node in stopped_nodes:
-                node.start(wait_other_notice=True)
+            for k in missings:
+                query = SimpleStatement("SELECT c1, c2 FROM cf WHERE key='k%d'" % k, consistency_level=ConsistencyLevel.ONE)
+                res = session.execute(query)
+                self.assertEqual(len(filter(lambda x: len(x) != 0, res)), 0, res)
+        finally:
+            session.cluster.shutdown()
 
     def simple_sequential_repair_test(self, ):
         self._simple_repair(sequential=True)
@@ -83,10 +97,12 @@ class TestRepair(Tester):
             cluster.set_partitioner('org.apache.cassandra.dht.ByteOrderedPartitioner')
 
         # Disable hinted handoff and set batch commit log so this doesn't
-        # interfer with the test (this must be after the populate)
-        cluster.set_configuration_options(values={'hinted_handoff_enabled': False}, batch_commitlog=True)
+        # interfer with the test (this must be after the populate). A single
+        # datacenter with PropertyFileSnitch and no dynamic snitch lets
+        # check_rows_on_node read each replica.
+        cluster.set_configuration_options(values={'hinted_handoff_enabled': False, 'dynamic_snitch': False}, batch_commitlog=True)
         debug("Starting cluster..")
-        cluster.populate(3).start()
+        cluster.populate([3]).start()
         node1, node2, node3 = cluster.nodelist()
 
         session = self.patient_cql_connection(node1)
@@ -141,7 +157,133 @@ class TestRepair(Tester):
             valid.remove((m.group(2), m.group(1)))
 
         # Check node3 now has the key
-        self.check_rows_on_node(node3, 2001, found=[1000], restart=False)
+        self.check_rows_on_node(node3, 2001, found=[1000])
+
+    def replica_digest_mismatch_test(self):
+        """
+        Checks that compare_replicas reports the keys a replica missed while
+        it was down with hinted handoff disabled, and none after a repair.
+        """
+        cluster = self.cluster
+        cluster.set_configuration_options(values={'hinted_handoff_enabled': False, 'dynamic_snitch': False})
+        cluster.populate([3]).start(wait_for_binary_proto=True)
+        node1, node2, node3 = cluster.nodelist()
+
+        session = self.patient_cql_connection(node1)
+        self.create_ks(session, 'ks', 3)
+        self.create_cf(session, 'cf', read_repair=0.0, columns={'c1': 'text', 'c2': 'text'})
+        for i in xrange(0, 100):
+            insert_c1c2(session, i, ConsistencyLevel.ALL)
+        self.assertEqual([], compare_replicas(self, 'ks', 'cf'))
+
+        node3.stop(wait_other_notice=True)
+        for i in xrange(100, 105):
+            insert_c1c2(session, i, ConsistencyLevel.TWO)
+        node3.start(wait_other_notice=True, wait_for_binary_proto=True)
+
+        mismatches = compare_replicas(self, 'ks', 'cf')
+        self.assertNotEqual([], mismatches)
+        differing = {}
+        for mismatch in mismatches:
+            differing.update(mismatch.differing_keys)
+        self.assertEqual(set(('k%d' % i,) for i in xrange(100, 105)), set(differing))
+        for addresses in differing.values():
+            self.assertEqual(set([node3.address()]), addresses)
+
+        node1.repair(self._repair_options(ks='ks'))
+        assert_replicas_consistent(self, 'ks', 'cf')
+
+    @benchmark
+    @since('2.1')
+    def repair_benchmark_test(self):
+        """
+        Measures repair on 3 nodes with RF=3, for every combination of
+        BENCHMARK_ROWS, BENCHMARK_DIVERGENCE and BENCHMARK_REPAIRS. The
+        divergence is controlled: node3 is stopped while the given fraction
+        of new rows is written, with hinted handoff disabled. For each
+        repair, the following are reported to repair.csv and .json in
+        BENCHMARK_DIR:
+        - its wall time, and the time from the start of each repair session
+          to the last merkle tree received, summed over sessions
+        - the ranges found out of sync, from the coordinator log
+        - the bytes streamed, and the overstreaming ratio of those bytes to
+          the on-disk size of the rows node3 missed
+        """
+        cluster = self.cluster
+        cluster.set_configuration_options(values={'hinted_handoff_enabled': False})
+        cluster.populate(3)
+        for node in cluster.nodelist():
+            remove_perf_disable_shared_mem(node)
+        cluster.start(wait_for_binary_proto=True)
+        session = self.patient_cql_connection(cluster.nodelist()[0])
+        self.create_ks(session, 'ks', 3)
+
+        report = BenchmarkReport('repair', version=cluster.version())
+        for rows, divergence, repair in itertools.product(BENCHMARK_ROWS, BENCHMARK_DIVERGENCE, BENCHMARK_REPAIRS):
+            result = self._repair_benchmark(session, rows, int(rows * divergence), repair)
+            result.update(rows=rows, divergent_rows=int(rows * divergence), repair=repair)
+            debug(result)
+            report.add(**result)
+
+    def _repair_benchmark(self, session, rows, divergent, repair):
+        node1, node2, node3 = self.cluster.nodelist()
+        table = 'bench_{}_{}_{}'.format(repair, rows, divergent)
+        session.execute("CREATE TABLE {} (k int PRIMARY KEY, v blob) WITH read_repair_chance = 0 AND dclocal_read_repair_chance = 0".format(table))
+        value = os.urandom(BENCHMARK_VALUE_SIZE)
+
+        def write(count, offset, consistency_level):
+            insert = session.prepare("INSERT INTO {} (k, v) VALUES (?, ?)".format(table))
+            insert.consistency_level = consistency_level
+            writes = LoadGenerator(session, concurrency=100)
+            writes.add('write', insert, lambda i: (offset + i, value))
+            result = writes.run(count=count)
+            self.assertEqual(0, result.errors, result.error_samples)
+
+        write(rows, 0, ConsistencyLevel.ALL)
+        flush_nodes(self.cluster.nodelist())
+        with JolokiaAgent(node1) as jmx:
+            disk_bytes = jmx.read_attribute(make_mbean('metrics', type='ColumnFamily', keyspace='ks', scope=table, name='LiveDiskSpaceUsed'), 'Count')
+        node3.stop(wait_other_notice=True)
+        write(divergent, rows, ConsistencyLevel.TWO)
+        node3.start(wait_other_notice=True, wait_for_binary_proto=True)
+        flush_nodes(self.cluster.nodelist())
+
+        if repair == 'incremental':
+            options = [] if self.cluster.version() >= '2.2' else ['-par', '-inc']
+            options += ['ks', table]
+        else:
+            options = self._repair_options(ks='ks', cf=[table], sequential=repair == 'sequential')
+        mark = node1.mark_log()
+        streamed = -self._total_outgoing_bytes()
+        start = time.time()
+        node1.nodetool('repair ' + ' '.join(options))
+        seconds = time.time() - start
+        streamed += self._total_outgoing_bytes()
+
+        sessions = {}
+        for line, match in grep_log_since(node1, r'\[repair #([0-9a-f-]+)\] new session', mark):
+            sessions[match.group(1)] = [log_time(line), None]
+        for line, match in grep_log_since(node1, r'\[repair #([0-9a-f-]+)\] Received merkle tree', mark):
+            sessions[match.group(1)][1] = log_time(line)
+        out_of_sync = grep_log_since(node1, r'/([0-9.]+) and /([0-9.]+) have ([0-9]+) range\(s\) out of sync', mark)
+        divergent_bytes = divergent * float(disk_bytes) / rows
+        session.execute("DROP TABLE {}".format(table))
+
+        return {'repair_seconds': seconds,
+                'validation_seconds': sum((last - first).total_seconds() for first, last in sessions.values() if last),
+                'sessions': len(sessions),
+                'ranges_out_of_sync': sum(int(match.group(3)) for line, match in out_of_sync),
+                'streamed_bytes': streamed,
+                'divergent_bytes': divergent_bytes,
+                'overstreaming_ratio': streamed / divergent_bytes if divergent_bytes else None}
+
+    def _total_outgoing_bytes(self):
+        """ Returns the bytes streamed out by every node since it started. """
+        total = 0
+        for node in self.cluster.nodelist():
+            with JolokiaAgent(node) as jmx:
+                total += jmx.read_attribute(TOTAL_OUTGOING_BYTES, 'Count')
+        return total
 
     def _empty_vs_gcable_no_repair(self, sequential):
         """
@@ -246,8 +388,9 @@ class TestRepair(Tester):
         self.assertIn(m.group(1), valid, "Unrelated node found in local repair: " + m.group(1))
         valid.remove(m.group(1))
         self.assertIn(m.group(2), valid, "Unrelated node found in local repair: " + m.group(2))
-        # Check node2 now has the key
-        self.check_rows_on_node(node2, 2001, found=[1000], restart=False)
+        # Check all replicas converged, then that node2 now has the key
+        assert_replicas_consistent(self, 'ks', 'cf')
+        self.check_rows_on_node(node2, 2001, found=[1000])
 
     def dc_repair_test(self):
         cluster = self._setup_multi_dc()
@@ -270,8 +413,9 @@ class TestRepair(Tester):
             self.assertIn((m.group(1), m.group(2)), valid, str((m.group(1), m.group(2))))
             valid.remove((m.group(1), m.group(2)))
             valid.remove((m.group(2), m.group(1)))
-        # Check node2 now has the key
-        self.check_rows_on_node(node2, 2001, found=[1000], restart=False)
+        # Check all replicas converged, then that node2 now has the key
+        assert_replicas_consistent(self, 'ks', 'cf')
+        self.check_rows_on_node(node2, 2001, found=[1000])
 
     def _setup_multi_dc(self):
         """
@@ -282,7 +426,7 @@ class TestRepair(Tester):
 
         # Disable hinted handoff and set batch commit log so this doesn't
         # interfer with the test (this must be after the populate)
-        cluster.set_configuration_options(values={'hinted_handoff_enabled': False}, batch_commitlog=True)
+        cluster.set_configuration_options(values={'hinted_handoff_enabled': False, 'dynamic_snitch': False}, batch_commitlog=True)
         debug("Starting cluster..")
         # populate 2 nodes in dc1, and one node each in dc2 and dc3
         cluster.populate([2, 1, 1]).start()
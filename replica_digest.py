@@ -0,0 +1,223 @@
+"""
+Per-replica table digests, computed with every node still up.
+
+Each replica is queried through an exclusive connection at CL.ONE, one token
+range at a time, restricted to the ranges it replicates. Rows are folded into
+an order-independent digest per range, so two replicas holding the same data
+produce the same digests regardless of sstable layout or paging.
+
+Example usage:
+
+    mismatches = compare_replicas(self, 'ks', 'cf')
+    self.assertEqual([], mismatches)
+
+Reads at CL.ONE are only answered by the coordinator when the snitch orders
+the local node first. This is the case for PropertyFileSnitch and
+GossipingPropertyFileSnitch (ccm configures PropertyFileSnitch when
+populating with a list of nodes per datacenter, e.g. populate([3])), as long
+as the dynamic snitch doesn't reorder replicas by latency. The helpers here
+refuse to run on a cluster not configured with one of those snitches and
+dynamic_snitch: false, and check with a traced read that each replica
+answers on its own:
+
+    cluster.set_configuration_options(values={'dynamic_snitch': False})
+    cluster.populate([3]).start()
+"""
+import hashlib
+from collections import defaultdict, namedtuple
+
+from cassandra import ConsistencyLevel
+from cassandra.metadata import protect_name
+from cassandra.query import SimpleStatement
+
+from dtest import debug
+
+# digests are summed modulo 2**64 so that row order does not matter
+DIGEST_MODULUS = 1 << 64
+
+# A token range whose replicas disagree. `start` and `end` bound the range as
+# (start, end]; one of them is None for the two halves of the range wrapping
+# around the ring. `digests` maps each replica's address to its (row count,
+# digest) pair. `differing_keys` maps each partition key that is missing or
+# different somewhere to the addresses that disagree with the majority.
+RangeMismatch = namedtuple('RangeMismatch', ['start', 'end', 'digests', 'differing_keys'])
+
+
+def _row_digest(row):
+    return int(hashlib.md5(repr(tuple(row))).hexdigest()[:16], 16)
+
+
+def _table_columns(session, keyspace, table):
+    table_meta = session.cluster.metadata.keyspaces[keyspace].tables[table]
+    partition_key = [protect_name(c.name) for c in table_meta.partition_key]
+    columns = [protect_name(name) for name in table_meta.columns.keys()]
+    return partition_key, columns
+
+
+def token_ranges(session, keyspace):
+    """
+    Returns the list of (start, end, replica addresses) covering the ring for
+    `keyspace`, as seen by `session`'s cluster metadata. Each range is
+    (start, end]; the range wrapping around the ring is split into a range
+    with no end and a range with no start so that it can be queried.
+    """
+    token_map = session.cluster.metadata.token_map
+    ring = token_map.ring
+    ranges = []
+    wrap_replicas = set(host.address for host in token_map.get_replicas(keyspace, ring[0]))
+    ranges.append((None, ring[0].value, wrap_replicas))
+    for previous, token in zip(ring, ring[1:]):
+        replicas = set(host.address for host in token_map.get_replicas(keyspace, token))
+        ranges.append((previous.value, token.value, replicas))
+    ranges.append((ring[-1].value, None, wrap_replicas))
+    return ranges
+
+
+def _range_query(keyspace, table, partition_key, columns, start, end):
+    token_fn = 'token({})'.format(', '.join(partition_key))
+    query = 'SELECT {}, {} FROM {}.{}'.format(token_fn, ', '.join(columns), protect_name(keyspace), protect_name(table))
+    bounds = []
+    if start is not None:
+        bounds.append('{} > {}'.format(token_fn, start))
+    if end is not None:
+        bounds.append('{} <= {}'.format(token_fn, end))
+    return query + ' WHERE ' + ' AND '.join(bounds)
+
+
+def replica_session(tester, node, keyspace, table):
+    """
+    Returns an exclusive session to `node` whose reads at CL.ONE of the
+    ranges it replicates are answered by `node` itself, after checking the
+    cluster's snitch configuration and tracing a read of `keyspace`.`table`.
+    """
+    options = tester.cluster._config_options
+    snitch = options.get('endpoint_snitch', 'SimpleSnitch')
+    assert snitch.endswith('PropertyFileSnitch') and options.get('dynamic_snitch') is False, \
+        "Replica reads need PropertyFileSnitch or GossipingPropertyFileSnitch and dynamic_snitch: false, not {} with dynamic_snitch: {}".format(
+            snitch, options.get('dynamic_snitch', True))
+
+    session = tester.patient_exclusive_cql_connection(node)
+    if not session.cluster.metadata.partitioner.endswith(('Murmur3Partitioner', 'RandomPartitioner')):
+        # token bounds of other partitioners can't be written as integers
+        return session
+    partition_key = _table_columns(session, keyspace, table)[0]
+    for start, end, replicas in token_ranges(session, keyspace):
+        if node.address() in replicas:
+            statement = SimpleStatement(_range_query(keyspace, table, partition_key, partition_key, start, end) + ' LIMIT 1',
+                                        consistency_level=ConsistencyLevel.ONE)
+            session.execute(statement, trace=True)
+            sources = set(str(event.source) for event in statement.trace.events)
+            if sources != set([node.address()]):
+                session.cluster.shutdown()
+                raise AssertionError("A read through {} was answered by {}".format(node.address(), sorted(sources)))
+            break
+    return session
+
+
+def _scan_range(session, query, key_width, fetch_size, per_key=False):
+    """
+    Reads one token range and returns (row count, digest), or a dict of
+    partition key -> digest if `per_key` is set.
+    """
+    statement = SimpleStatement(query, consistency_level=ConsistencyLevel.ONE, fetch_size=fetch_size)
+    count, digest = 0, 0
+    keys = defaultdict(int)
+    for row in session.execute(statement):
+        # column 0 is the token, followed by the partition key columns
+        row_digest = _row_digest(row[1:])
+        if per_key:
+            key = tuple(row[1:1 + key_width])
+            keys[key] = (keys[key] + row_digest) % DIGEST_MODULUS
+        count += 1
+        digest = (digest + row_digest) % DIGEST_MODULUS
+    if per_key:
+        return keys
+    return count, digest
+
+
+def replica_digests(tester, node, keyspace, table, fetch_size=1000):
+    """
+    @param tester the Tester, used to open an exclusive connection to `node`
+    @param node the replica to read from
+    @param keyspace the keyspace of the table
+    @param table the table to digest
+    @param fetch_size the page size used to read each range
+    @return a dict of (start, end) -> (row count, digest) for every range `node` replicates
+    """
+    session = replica_session(tester, node, keyspace, table)
+    try:
+        partition_key, columns = _table_columns(session, keyspace, table)
+        digests = {}
+        for start, end, replicas in token_ranges(session, keyspace):
+            if node.address() not in replicas:
+                continue
+            query = _range_query(keyspace, table, partition_key, columns, start, end)
+            digests[(start, end)] = _scan_range(session, query, len(partition_key), fetch_size)
+        return digests
+    finally:
+        session.cluster.shutdown()
+
+
+def _differing_keys(tester, nodes, keyspace, table, start, end, fetch_size):
+    by_replica = {}
+    for node in nodes:
+        session = replica_session(tester, node, keyspace, table)
+        try:
+            partition_key, columns = _table_columns(session, keyspace, table)
+            query = _range_query(keyspace, table, partition_key, columns, start, end)
+            by_replica[node.address()] = _scan_range(session, query, len(partition_key), fetch_size, per_key=True)
+        finally:
+            session.cluster.shutdown()
+
+    all_keys = set()
+    for keys in by_replica.values():
+        all_keys.update(keys)
+
+    differing = {}
+    for key in all_keys:
+        versions = defaultdict(set)
+        for address, keys in by_replica.items():
+            versions[keys.get(key)].add(address)
+        if len(versions) > 1:
+            majority = max(versions.values(), key=len)
+            differing[key] = set(by_replica) - majority
+    return differing
+
+
+def compare_replicas(tester, keyspace, table, nodes=None, fetch_size=1000):
+    """
+    Compares the per-range digests of `table` across every replica in
+    `nodes` (by default, every running node of the cluster).
+
+    @return a list of RangeMismatch, one per token range on which at least
+    two replicas disagree. The list is empty when all replicas converged.
+    """
+    if nodes is None:
+        nodes = [node for node in tester.cluster.nodelist() if node.is_running()]
+
+    by_range = defaultdict(dict)
+    for node in nodes:
+        for token_range, digest in replica_digests(tester, node, keyspace, table, fetch_size).items():
+            by_range[token_range][node.address()] = digest
+
+    nodes_by_address = dict((node.address(), node) for node in nodes)
+    mismatches = []
+    for (start, end), digests in sorted(by_range.items()):
+        if len(set(digests.values())) <= 1:
+            continue
+        replicas = [nodes_by_address[address] for address in digests]
+        differing = _differing_keys(tester, replicas, keyspace, table, start, end, fetch_size)
+        debug("replicas disagree on range ({}, {}]: {}".format(start, end, digests))
+        mismatches.append(RangeMismatch(start, end, digests, differing))
+    return mismatches
+
+
+def assert_replicas_consistent(tester, keyspace, table, nodes=None):
+    """
+    Asserts that every replica of `table` holds the same data, reporting each
+    disagreeing range and the partition keys that differ.
+    """
+    mismatches = compare_replicas(tester, keyspace, table, nodes)
+    assert not mismatches, "Replicas of {}.{} disagree on {} range(s): {}".format(
+        keyspace, table, len(mismatches),
+        '; '.join('({}, {}] keys {}'.format(m.start, m.end, sorted(m.differing_keys.items())) for m in mismatches))
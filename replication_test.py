@@ -1,4 +1,5 @@
 from dtest import Tester, debug, PRINT_DEBUG
+from partitioner import tokens_for_keys
 from tools import no_vnodes
 import re, time
 from collections import defaultdict
@@ -11,30 +12,8 @@ TRACE_RESPOND_MESSAGE = re.compile('Message received from /([0-9]+\.[0-9]+\.[0-9
 TRACE_COMMIT_LOG = re.compile('Appending to commitlog')
 TRACE_FORWARD_WRITE = re.compile('Enqueuing forwarded write to /([0-9]+\.[0-9]+\.[0-9]+\.[0-9]+)')
 
-# Some pre-computed murmur 3 hashes; there are no good python murmur3
-# hashing libraries :(
-murmur3_hashes = {
-    5: -7509452495886106294,
-    10: -6715243485458697746,
-    16: -5477287129830487822,
-    13: -5034495173465742853,
-    11: -4156302194539278891,
-    1: -4069959284402364209,
-    19: -3974532302236993209,
-    8: -3799847372828181882,
-    2: -3248873570005575792,
-    4: -2729420104000364805,
-    18: -2695747960476065067,
-    15: -1191135763843456182,
-    20:  1388667306199997068,
-    7:  1634052884888577606,
-    6:  2705480034054113608,
-    9:  3728482343045213994,
-    14:  4279681877540623768,
-    17:  5467144456125416399,
-    12:  8582886034424406875,
-    3:  9010454139840013625
-}
+# murmur3 tokens of the int keys used by these tests
+murmur3_hashes = dict(zip(range(1, 21), tokens_for_keys(range(1, 21), 'int')))
 
 
 @no_vnodes()
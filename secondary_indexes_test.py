@@ -1,15 +1,53 @@
+import itertools
 import random
 import re
 import time
 import uuid
 
+from benchreport import BenchmarkReport
 from dtest import Tester, debug
-from tools import since
+from loadgen import LoadGenerator, Zipfian
+from perfbaseline import median
+from tools import benchmark, new_node, since
 from assertions import assert_invalid, assert_one
-from cassandra import InvalidRequest
+from cassandra import ConsistencyLevel, InvalidRequest
 from cassandra.query import BatchStatement, SimpleStatement
 from cassandra.protocol import ConfigurationException
 
+# the grid of the index benchmark, where cardinalities above the number of
+# rows are skipped
+BENCHMARK_NODE_COUNTS = [1, 3, 5]
+BENCHMARK_ROWS = [10000, 200000]
+BENCHMARK_CARDINALITIES = [10, 1000, 100000]
+BENCHMARK_QUERIES = 500
+BENCHMARK_TRACED_QUERIES = 10
+
+# the query of each kind of index of the benchmark table, by the indexed value
+BENCHMARK_INDEX_QUERIES = {
+    'regular': "SELECT k FROM {} WHERE v = ?",
+    'list': "SELECT k FROM {} WHERE l CONTAINS ?",
+    'set': "SELECT k FROM {} WHERE s CONTAINS ?",
+    'map_values': "SELECT k FROM {} WHERE m CONTAINS ?",
+    'map_keys': "SELECT k FROM {} WHERE mk CONTAINS KEY ?",
+}
+
+
+def index_trace_stats(trace):
+    """
+    Returns the ranges contacted and the rows scanned by an index query,
+    from the events of its trace. The rows scanned are those of the index
+    before 3.0, and the live rows read from 3.0.
+    """
+    ranges, scanned = 0, 0
+    for event in trace.events:
+        match = re.match(r"Submitting range requests on ([0-9]+) ranges", event.description)
+        if match:
+            ranges += int(match.group(1))
+        match = re.match(r"(?:Scanned|Read) ([0-9]+) (?:live )?rows", event.description)
+        if match:
+            scanned += int(match.group(1))
+    return ranges, scanned
+
 
 class TestSecondaryIndexes(Tester):
 
@@ -608,6 +646,92 @@ class TestSecondaryIndexesOnCollections(Tester):
             self.assertTrue(log_entry['unshared_uuid2'] in db_uuids.values())
 
 
+class TestSecondaryIndexesBenchmark(Tester):
+
+    @benchmark
+    @since('2.1')
+    def index_benchmark_test(self):
+        """
+        Measures index queries on regular and collection columns, for every
+        combination of BENCHMARK_NODE_COUNTS, BENCHMARK_ROWS and
+        BENCHMARK_CARDINALITIES, with RF=1 as in test_low_cardinality_indexes.
+        Every kind of index in BENCHMARK_INDEX_QUERIES is queried
+        BENCHMARK_QUERIES times for values drawn uniformly, for latency
+        percentiles, then BENCHMARK_TRACED_QUERIES times with tracing, for
+        the median ranges contacted and rows scanned. The results are
+        reported to secondary_index.csv and .json in BENCHMARK_DIR.
+
+        The cluster grows by bootstrapping nodes between node counts; the
+        keyspace of the previous node count is dropped first.
+        """
+        cluster = self.cluster
+        cluster.populate(BENCHMARK_NODE_COUNTS[0]).start(wait_for_binary_proto=True)
+        report = BenchmarkReport('secondary_index', version=cluster.version())
+
+        for nodes in BENCHMARK_NODE_COUNTS:
+            while len(cluster.nodelist()) < nodes:
+                new_node(cluster).start(wait_for_binary_proto=True)
+            session = self.patient_cql_connection(cluster.nodelist()[0])
+            session.max_trace_wait = 120
+            keyspace = 'ks_{}'.format(nodes)
+            self.create_ks(session, keyspace, 1)
+
+            for rows, cardinality in itertools.product(BENCHMARK_ROWS, BENCHMARK_CARDINALITIES):
+                if cardinality > rows:
+                    continue
+                table = self._create_index_table(session, rows, cardinality)
+                for kind, query in sorted(BENCHMARK_INDEX_QUERIES.items()):
+                    result = self._query_index(session, query.format(table), rows, cardinality)
+                    result.update(nodes=nodes, rows=rows, cardinality=cardinality, index=kind)
+                    debug(result)
+                    report.add(**result)
+            session.execute("DROP KEYSPACE {}".format(keyspace))
+            session.cluster.shutdown()
+
+    def _create_index_table(self, session, rows, cardinality):
+        """
+        Creates and fills a table of `rows` rows, where row k has the indexed
+        value k % `cardinality` in every indexed column.
+        """
+        table = 'bench_{}_{}'.format(rows, cardinality)
+        session.execute("CREATE TABLE {} (k int PRIMARY KEY, v int, l list<int>, s set<int>, m map<int, int>, mk map<int, int>)".format(table))
+        for column in ('v', 'l', 's', 'm', 'keys(mk)'):
+            session.execute("CREATE INDEX ON {} ({})".format(table, column))
+
+        def row(k):
+            value = k % cardinality
+            return k, value, [value], set([value]), {k: value}, {value: k}
+        insert = session.prepare("INSERT INTO {} (k, v, l, s, m, mk) VALUES (?, ?, ?, ?, ?, ?)".format(table))
+        result = LoadGenerator(session).add('write', insert, row).run(count=rows)
+        self.assertEqual(0, result.errors, result.error_samples)
+        self.cluster.flush()
+        return table
+
+    def _query_index(self, session, query, rows, cardinality):
+        select = session.prepare(query)
+        select.consistency_level = ConsistencyLevel.ONE
+        # unpaged, so that the latency and the trace cover every matching
+        # row, not only the first page of a low-cardinality value
+        select.fetch_size = None
+        values = Zipfian(cardinality, exponent=0)
+        result = LoadGenerator(session, concurrency=4).add('query', select, lambda i: (values.next(),)).run(count=BENCHMARK_QUERIES)
+        self.assertEqual(0, result.errors, result.error_samples)
+
+        ranges, scanned = [], []
+        for _ in range(BENCHMARK_TRACED_QUERIES):
+            value = values.next()
+            bound = select.bind((value,))
+            matched = len(list(session.execute(bound, trace=True)))
+            self.assertEqual(rows // cardinality + (1 if value < rows % cardinality else 0), matched)
+            query_ranges, query_scanned = index_trace_stats(bound.trace)
+            ranges.append(query_ranges)
+            scanned.append(query_scanned)
+        return {'latency': result.latencies().summary(),
+                'queries_per_sec': result.throughput(),
+                'ranges_contacted': median(ranges),
+                'rows_scanned': median(scanned)}
+
+
 class TestUpgradeSecondaryIndexes(Tester):
 
     @since('2.1', max_version='2.1.x')
@@ -29,9 +29,9 @@ class TestSSTableSplit(Tester):
 
         debug("Run stress to insert data")
         if version < "2.1":
-            node.stress( ['-o', 'insert'] )
+            self.stress(node, ['-o', 'insert'])
         else:
-            node.stress( ['write', 'n=1000000', '-rate', 'threads=50'] )
+            self.stress(node, ['write', 'n=1000000', '-rate', 'threads=50'])
 
         self._do_compaction(node)
         self._do_split(node, version)
@@ -40,9 +40,9 @@ class TestSSTableSplit(Tester):
 
         debug("Run stress to ensure data is readable")
         if version < "2.1":
-            node.stress( ['-o', 'read'] )
+            self.stress(node, ['-o', 'read'])
         else:
-            node.stress( ['read', 'n=1000000', '-rate', 'threads=25'] )
+            self.stress(node, ['read', 'n=1000000', '-rate', 'threads=25'])
 
     def _do_compaction(self, node):
         debug("Compact sstables.")
@@ -97,8 +97,8 @@ class TestSSTableSplit(Tester):
         node = cluster.nodelist()[0]
 
         debug("Run stress to insert data")
-        node.stress(['write', 'n=2000000', '-rate', 'threads=50',
-                     '-schema', 'compaction(strategy=LeveledCompactionStrategy, sstable_size_in_mb=10)'])
+        self.stress(node, ['write', 'n=2000000', '-rate', 'threads=50',
+                           '-schema', 'compaction(strategy=LeveledCompactionStrategy, sstable_size_in_mb=10)'])
         self._do_compaction(node)
         node.stop()
         with tempfile.TemporaryFile(mode='w+') as tmpfile:
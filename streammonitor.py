@@ -0,0 +1,161 @@
+"""
+Measures streaming throughput by sampling the StreamManager of nodes over JMX
+while they bootstrap, rebuild, decommission or repair.
+
+The streams in progress on every node are polled from a background thread;
+a stream plan is timed from the first to the last sample it was seen in, and
+its bytes are taken from the progress of each file. Tables are identified
+from the file names.
+
+Example usage:
+
+    monitor = StreamMonitor(cluster.nodelist()).start()
+    node3.start(wait_for_binary_proto=True)
+    for plan in monitor.stop():
+        debug("{} streamed {} bytes at {} MB/s".format(plan.description, plan.bytes, plan.mb_per_sec))
+
+As with any use of jmxutils, remove_perf_disable_shared_mem must be called
+on the nodes before they are started. Nodes that aren't running when a
+sample is taken are skipped, so a node can join or leave during the sampling.
+"""
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from jmxutils import JolokiaAgent, make_mbean
+
+STREAM_MANAGER = make_mbean('net', 'StreamManager')
+
+# The streaming of a stream plan, seen from the nodes sending the files (or
+# from the receiving ones, when no sender was sampled). `seconds` is the time
+# the plan was seen in progress, within the sampling interval. `by_session`
+# maps each (sender, receiver) pair of addresses to a StreamSession, and
+# `by_table` maps each 'keyspace.table' to the bytes streamed.
+StreamPlan = namedtuple('StreamPlan', ['plan_id', 'description', 'bytes', 'seconds', 'mb_per_sec',
+                                       'by_session', 'by_table'])
+
+# The bytes streamed between two nodes, and the seconds during which they
+# were seen making progress.
+StreamSession = namedtuple('StreamSession', ['bytes', 'seconds', 'mb_per_sec'])
+
+# <data dir>/<keyspace>/<table>-<id>/<sstable>, or <table> without an id before 2.1
+_SSTABLE_PATH = re.compile(r'([^/]+)/([^/-]+)(?:-[0-9a-f]{32})?/[^/]+$')
+
+
+def _table_of(file_name):
+    match = _SSTABLE_PATH.search(file_name.replace(os.sep, '/'))
+    return '{}.{}'.format(*match.groups()) if match else file_name
+
+
+def _mb_per_sec(streamed, seconds):
+    return streamed / (1024.0 * 1024) / seconds if seconds else None
+
+
+class StreamMonitor(object):
+    """
+    Samples the streams in progress on `nodes` every `interval` seconds,
+    until stop() returns the StreamPlans seen.
+    """
+
+    def __init__(self, nodes, interval=0.5):
+        self.nodes = nodes
+        self.interval = interval
+        self.agents = {}
+        # plan id -> [description, first seen, last seen]
+        self.plans = {}
+        # (plan id, direction, sampling node, peer, file name) -> [current bytes, total bytes]
+        self.files = {}
+        # (plan id, direction, sampling node, peer) -> [first, last] time progress was seen
+        self.progress = {}
+        # node name -> last error sampling it; the node is sampled again
+        # with a new agent next time
+        self.failures = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                self.sample_once()
+                self._stopped.wait(self.interval)
+        except Exception as e:
+            self._error = e
+        finally:
+            for agent in self.agents.values():
+                agent.close()
+
+    def _agent(self, node):
+        if node.name not in self.agents:
+            agent = JolokiaAgent(node)
+            agent.attach()
+            self.agents[node.name] = agent
+        return self.agents[node.name]
+
+    def sample_once(self):
+        now = time.time()
+        for node in self.nodes:
+            if not node.is_running():
+                continue
+            try:
+                streams = self._agent(node).read_attribute(STREAM_MANAGER, 'CurrentStreams') or []
+            except Exception as e:
+                # a node still starting up, or already stopping
+                self.failures[node.name] = e
+                self.agents.pop(node.name, None)
+                continue
+            for stream in streams:
+                plan = self.plans.setdefault(stream['planId'], [stream['description'], now, now])
+                plan[2] = now
+                for session in stream.get('sessions') or []:
+                    for direction in ('sendingFiles', 'receivingFiles'):
+                        for progress in session.get(direction) or []:
+                            key = (stream['planId'], direction, node.name, progress['peer'], progress['fileName'])
+                            seen = self.files.setdefault(key, [0, progress['totalBytes']])
+                            if progress['currentBytes'] > seen[0]:
+                                seen[0] = progress['currentBytes']
+                                self.progress.setdefault(key[:4], [now, now])[1] = now
+
+    def stop(self):
+        """
+        Stops sampling and returns the StreamPlans seen, in the order they
+        started.
+        """
+        self._stopped.set()
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.results()
+
+    def results(self):
+        results = []
+        for plan_id, (description, first, last) in sorted(self.plans.items(), key=lambda item: item[1][1]):
+            files = [(key, seen) for key, seen in self.files.items() if key[0] == plan_id]
+            sent = [(key, seen) for key, seen in files if key[1] == 'sendingFiles']
+            by_session, by_table = {}, {}
+            for (_, direction, node, peer, file_name), (current, total) in sent or files:
+                if not current:
+                    continue
+                pair = (self._address(node), peer) if direction == 'sendingFiles' else (peer, self._address(node))
+                session_first, session_last = self.progress[(plan_id, direction, node, peer)]
+                streamed, seen_first, seen_last = by_session.get(pair, (0, session_first, session_last))
+                by_session[pair] = (streamed + current, min(seen_first, session_first), max(seen_last, session_last))
+                by_table[_table_of(file_name)] = by_table.get(_table_of(file_name), 0) + current
+            for pair, (streamed, session_first, session_last) in by_session.items():
+                by_session[pair] = StreamSession(streamed, session_last - session_first, _mb_per_sec(streamed, session_last - session_first))
+            streamed = sum(session.bytes for session in by_session.values())
+            results.append(StreamPlan(plan_id, description, streamed, last - first,
+                                      _mb_per_sec(streamed, last - first), by_session, by_table))
+        return results
+
+    def _address(self, name):
+        [node] = [node for node in self.nodes if node.name == name]
+        return node.network_interfaces['storage'][0]
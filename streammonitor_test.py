@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+from streammonitor import StreamMonitor, _table_of
+
+DATA = '/var/lib/cassandra/data'
+
+
+class FakeNode(object):
+
+    def __init__(self, name, address):
+        self.name = name
+        self.network_interfaces = {'storage': (address, 7000)}
+        self.running = True
+
+    def is_running(self):
+        return self.running
+
+
+class FakeAgent(object):
+    """ Returns the next of `samples` as the CurrentStreams, or raises it. """
+
+    def __init__(self, samples):
+        self.samples = list(samples)
+
+    def read_attribute(self, mbean, attribute):
+        assert attribute == 'CurrentStreams', attribute
+        sample = self.samples.pop(0)
+        if isinstance(sample, Exception):
+            raise sample
+        return sample
+
+    def close(self):
+        pass
+
+
+def stream(plan_id, description, direction, peer, progress):
+    return {'planId': plan_id, 'description': description,
+            'sessions': [{direction: [{'peer': peer, 'fileName': file_name, 'currentBytes': current, 'totalBytes': total}
+                                      for file_name, current, total in progress]}]}
+
+
+class TestStreamMonitor(TestCase):
+
+    def table_of_test(self):
+        self.assertEqual('ks.cf', _table_of(DATA + '/ks/cf-0123456789abcdef0123456789abcdef/ks-cf-ka-1-Data.db'))
+        self.assertEqual('ks.cf', _table_of(DATA + '/ks/cf/ks-cf-jb-1-Data.db'))
+        self.assertEqual('system.peers', _table_of(DATA + '/system/peers-37f71aca7dc2383ba70672528af04d4f/la-1-big-Data.db'))
+        self.assertEqual('Data.db', _table_of('Data.db'))
+
+    def sample_test(self):
+        node1, node2, node3 = FakeNode('node1', '127.0.0.1'), FakeNode('node2', '127.0.0.2'), FakeNode('node3', '127.0.0.3')
+        new_file = DATA + '/ks/cf-0123456789abcdef0123456789abcdef/ks-cf-ka-1-Data.db'
+        old_file = DATA + '/ks/cf2/ks-cf2-jb-1-Data.db'
+        monitor = StreamMonitor([node1, node2, node3])
+        monitor.agents = {
+            # node1 sends two files of the bootstrap to node3
+            'node1': FakeAgent([
+                [stream('p1', 'Bootstrap', 'sendingFiles', '127.0.0.3', [(new_file, 100, 300), (old_file, 0, 50)])],
+                [stream('p1', 'Bootstrap', 'sendingFiles', '127.0.0.3', [(new_file, 300, 300), (old_file, 50, 50)])],
+            ]),
+            'node2': FakeAgent([IOError('connection refused')]),
+            # node3 receives them, and receives a rebuild from an unsampled node
+            'node3': FakeAgent([
+                [stream('p1', 'Bootstrap', 'receivingFiles', '127.0.0.1', [(new_file, 100, 300)])],
+                [stream('p1', 'Bootstrap', 'receivingFiles', '127.0.0.1', [(new_file, 200, 300)]),
+                 stream('p2', 'Rebuild', 'receivingFiles', '127.0.0.4', [(old_file, 10, 20)])],
+            ]),
+        }
+
+        monitor.sample_once()
+        self.assertEqual(['node2'], list(monitor.failures))
+        self.assertNotIn('node2', monitor.agents)
+        # a failed node is sampled again, unless it stopped running
+        node2.running = False
+        monitor.sample_once()
+
+        bootstrap, rebuild = monitor.results()
+        self.assertEqual(('p1', 'Bootstrap', 350), bootstrap[:3])
+        # the senders' progress is used over the receivers'
+        self.assertEqual([('127.0.0.1', '127.0.0.3')], list(bootstrap.by_session))
+        self.assertEqual(350, bootstrap.by_session[('127.0.0.1', '127.0.0.3')].bytes)
+        self.assertEqual({'ks.cf': 300, 'ks.cf2': 50}, bootstrap.by_table)
+
+        self.assertEqual(('p2', 'Rebuild', 10), rebuild[:3])
+        self.assertEqual([('127.0.0.4', '127.0.0.3')], list(rebuild.by_session))
+        self.assertEqual({'ks.cf2': 10}, rebuild.by_table)
+        self.assertEqual(0, rebuild.seconds)
+        self.assertEqual(None, rebuild.mb_per_sec)
@@ -40,8 +40,8 @@ class TestStressSparsenessRatio(Tester):
         """
         self.cluster.populate(1).start(wait_for_binary_proto=True)
         node = self.cluster.nodelist()[0]
-        node.stress(['write', 'n=1000', '-rate', 'threads=50', '-col', 'n=FIXED(50)',
-                     '-insert', 'row-population-ratio={ratio_spec}'.format(ratio_spec=ratio_spec)])
+        self.stress(node, ['write', 'n=1000', '-rate', 'threads=50', '-col', 'n=FIXED(50)',
+                           '-insert', 'row-population-ratio={ratio_spec}'.format(ratio_spec=ratio_spec)])
         session = self.patient_cql_connection(node)
         written = rows_to_list(session.execute('SELECT * FROM keyspace1.standard1;'))
 
@@ -6,8 +6,8 @@ import time
 
 from ccmlib import common
 from dtest import Tester, debug
+from partitioner import generate_tokens, ring_balance, token_problems
 from tools import rows_to_list
-from cassandra.util import sortedset
 
 class TokenGenerator(Tester):
     """
@@ -133,26 +133,22 @@ class TokenGenerator(Tester):
     ]
 
     def _multi_dc_tokens(self, random=None):
-        t_min = 0
-        t_max = 1<<127
-        if random is None or not random:
-            t_min = -1<<63
-            t_max = 1<<63
+        partitioner = 'random' if random else 'murmur3'
         for dc_nodes in self.dc_nodes_combinations:
-            all_tokens = sortedset()
-            node_count = 0
             generated_tokens = self.call_token_generator(self.cluster.get_install_dir(), random, dc_nodes)
             self.assertEqual(dc_nodes.__len__(), generated_tokens.__len__())
-            for n in range(0, dc_nodes.__len__()):
-                nodes = dc_nodes[n]
-                node_count += nodes
-                tokens = generated_tokens[n]
+            for nodes, tokens in zip(dc_nodes, generated_tokens):
                 self.assertEqual(nodes, tokens.__len__())
-                for tok in tokens:
-                    self.assertTrue(t_min <= tok < t_max, "Generated token %r out of Murmur3Partitioner range %r..%r" % (tok, t_min, t_max-1))
-                    self.assertTrue(not all_tokens.__contains__(tok), "Duplicate token %r for nodes-counts %r" % (tok, dc_nodes))
-                    all_tokens.add(tok)
-            self.assertEqual(all_tokens.__len__(), node_count, "Number of tokens %r and number of nodes %r does not match for %r" % (all_tokens.__len__(), node_count, dc_nodes))
+
+            problems = token_problems(generated_tokens, partitioner)
+            self.assertEqual([], problems, "Invalid tokens for nodes-counts %r: %r" % (dc_nodes, problems))
+
+            self.assertEqual(generate_tokens(dc_nodes, partitioner), generated_tokens,
+                             "token-generator and partitioner.generate_tokens disagree for nodes-counts %r" % (dc_nodes,))
+
+            for report in ring_balance(generated_tokens, partitioner):
+                debug("DC #%d of %r: ownership %.6f..%.6f, ratio %.9f" % (report.dc + 1, dc_nodes, report.min_ownership, report.max_ownership, report.ratio))
+                self.assertLess(report.ratio, 1.0001, "Unbalanced ring for DC #%d of %r: %r" % (report.dc + 1, dc_nodes, report))
 
     def multi_dc_tokens_default_test(self):
         self._multi_dc_tokens()
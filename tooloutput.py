@@ -0,0 +1,414 @@
+"""
+Parsers for the text output of nodetool, sstablemetadata and cassandra-stress,
+returning typed records instead of making each test split and grep the output.
+
+Example usage:
+
+    out, err = node.nodetool('gcstats', capture_output=True)
+    direct_bytes = parse_gcstats(out).direct_memory_bytes
+
+    out, err = node.nodetool('cfstats ks.cf', capture_output=True)
+    live_bytes = parse_tablestats(out)[('ks', 'cf')].stats['space_used_live']
+
+The formats changed across Cassandra versions: columns were added, renamed
+and reordered, and some fields gained units. Column headers are mapped to
+record fields by name rather than position, and field names are normalized
+(e.g. 'Space used (live), bytes' in 2.0 and 'Space used (live)' in 2.1 are
+both 'space_used_live'). Sizes are returned in bytes, percentages as
+fractions and latencies in milliseconds; values nodetool prints as 'NaN',
+'n/a' or '?' are returned as nan or None.
+
+The mapping of each header line and field name seen is cached for the rest
+of the run, since the format only varies with the version under test, so
+parsing repeatedly in a polling loop costs little more than splitting lines.
+"""
+import re
+from collections import namedtuple
+
+GcStats = namedtuple('GcStats', ['interval_ms', 'max_ms', 'total_ms', 'stdev_ms', 'reclaimed_bytes',
+                                 'collections', 'direct_memory_bytes'])
+
+# One table of `nodetool cfstats`/`tablestats`; `stats` maps normalized field
+# names to values. Keyspace-wide fields are in a record whose table is None.
+TableStats = namedtuple('TableStats', ['keyspace', 'table', 'stats'])
+
+CompactionTask = namedtuple('CompactionTask', ['id', 'compaction_type', 'keyspace', 'table',
+                                               'completed', 'total', 'unit', 'progress'])
+CompactionStats = namedtuple('CompactionStats', ['pending', 'pending_by_table', 'tasks', 'remaining_time'])
+
+MessagePool = namedtuple('MessagePool', ['name', 'active', 'pending', 'completed', 'dropped'])
+NetStats = namedtuple('NetStats', ['mode', 'streams', 'read_repair', 'pools'])
+
+ThreadPool = namedtuple('ThreadPool', ['name', 'active', 'pending', 'completed', 'blocked', 'all_time_blocked'])
+TpStats = namedtuple('TpStats', ['pools', 'dropped'])
+
+# One line of `nodetool status`. `status` is 'U' or 'D' and `state` is one of
+# 'N', 'L', 'J' or 'M', as in nodetool's two-letter code. `load` is in bytes
+# and `owns` is a fraction, or None where nodetool prints '?'.
+EndpointStatus = namedtuple('EndpointStatus', ['address', 'datacenter', 'rack', 'status', 'state',
+                                               'load', 'tokens', 'owns', 'host_id'])
+
+RingEntry = namedtuple('RingEntry', ['datacenter', 'address', 'rack', 'status', 'state', 'load', 'owns', 'token'])
+
+# The output of sstablemetadata for one sstable: `fields` maps normalized
+# field names to values, `tombstone_drop_times` maps drop times to counts and
+# `histogram` holds the (count, partition size, cell count) rows.
+SSTableMetadata = namedtuple('SSTableMetadata', ['path', 'fields', 'tombstone_drop_times', 'histogram'])
+
+# The summary of a cassandra-stress run. Rates are per second, latencies in
+# milliseconds and times in seconds; fields the stress version doesn't report
+# are None.
+StressSummary = namedtuple('StressSummary', ['op_rate', 'partition_rate', 'row_rate',
+                                             'latency_mean_ms', 'latency_median_ms', 'latency_p95_ms',
+                                             'latency_p99_ms', 'latency_p999_ms', 'latency_max_ms',
+                                             'total_partitions', 'total_errors',
+                                             'gc_count', 'gc_mb', 'gc_time_sec', 'total_time_sec'])
+
+# field names renamed between versions, by normalized old name
+FIELD_ALIASES = {
+    'number_of_keys_estimate': 'number_of_partitions_estimate',
+    'compacted_row_minimum_size': 'compacted_partition_minimum_bytes',
+    'compacted_row_maximum_size': 'compacted_partition_maximum_bytes',
+    'compacted_row_mean_size': 'compacted_partition_mean_bytes',
+    'column_family': 'table',
+    'max_gc_elapsed_ms': 'max_ms',
+    'total_gc_elapsed_ms': 'total_ms',
+    'stdev_gc_elapsed_ms': 'stdev_ms',
+    'gc_reclaimed_mb': 'reclaimed_bytes',
+    'pool_name': 'name',
+    'message_type': 'name',
+}
+
+# StressSummary fields by normalized label of the stress results, or column
+# of the legacy stress output
+STRESS_FIELDS = {
+    'op_rate': 'op_rate',
+    'partition_rate': 'partition_rate',
+    'row_rate': 'row_rate',
+    'latency_mean': 'latency_mean_ms',
+    'avg_latency': 'latency_mean_ms',
+    'latency_median': 'latency_median_ms',
+    'latency': 'latency_median_ms',
+    'latency_95th_percentile': 'latency_p95_ms',
+    '95th': 'latency_p95_ms',
+    'latency_99th_percentile': 'latency_p99_ms',
+    '99th': 'latency_p99_ms',
+    'latency_99_9th_percentile': 'latency_p999_ms',
+    '99_9th': 'latency_p999_ms',
+    'latency_max': 'latency_max_ms',
+    'total_partitions': 'total_partitions',
+    'total_errors': 'total_errors',
+    'total_gc_count': 'gc_count',
+    'total_gc_mb': 'gc_mb',
+    'total_gc_time_s': 'gc_time_sec',
+    'total_gc_time': 'gc_time_sec',
+    'total_operation_time': 'total_time_sec',
+}
+
+SIZE_UNITS = {
+    'bytes': 1, 'b': 1,
+    'kb': 1024, 'kib': 1024,
+    'mb': 1024 ** 2, 'mib': 1024 ** 2,
+    'gb': 1024 ** 3, 'gib': 1024 ** 3,
+    'tb': 1024 ** 4, 'tib': 1024 ** 4,
+}
+
+_NUMBER = re.compile(r'^-?\d+(\.\d+)?([eE][-+]?\d+)?$')
+_WITH_UNIT = re.compile(r'^(-?\d+(?:\.\d+)?|NaN)\s*([A-Za-z]+)\.?$')
+_STATUS_LINE = re.compile(r'^([UD])([NLJM])\s+(\S+)\s+(\?|\S+ \S+)\s+(\d+)\s+(\?|\S+%)\s+(\S+)\s+(.*)$')
+
+# normalized field name and header layout caches, see the module docstring
+_fields = {}
+_layouts = {}
+
+
+def field_name(name):
+    """ Returns the normalized field name for a label such as 'Space used (live), bytes'. """
+    try:
+        return _fields[name]
+    except KeyError:
+        normalized = re.sub(r',\s*bytes$', '', name.strip().lower())
+        normalized = re.sub(r'[^a-z0-9]+', '_', normalized).strip('_')
+        _fields[name] = FIELD_ALIASES.get(normalized, normalized)
+        return _fields[name]
+
+
+def header_fields(header):
+    """
+    Returns the normalized field names of the columns of a header line.
+    Columns are separated by at least two spaces, or follow a closing
+    parenthesis, as in gcstats where fixed-width labels run together.
+    """
+    try:
+        return _layouts[header]
+    except KeyError:
+        labels = re.split(r'\s{2,}', header.replace(')', ')  ').strip())
+        _layouts[header] = [field_name(label) for label in labels]
+        return _layouts[header]
+
+
+def parse_size(text):
+    """ Returns a size such as '47.66 KB', '1.2 GiB' or '1234' in bytes, or None for '?'. """
+    text = text.strip()
+    if text in ('?', 'n/a', ''):
+        return None
+    match = _WITH_UNIT.match(text)
+    if match:
+        return float(match.group(1)) * SIZE_UNITS[match.group(2).lower()]
+    return float(text)
+
+
+def parse_value(text):
+    """
+    Returns the typed value of a field: an int or float for numbers, bytes
+    for sizes, milliseconds for latencies, a fraction for percentages, None
+    for 'n/a' and '?', and the stripped text for anything else.
+    """
+    text = text.strip()
+    if text in ('n/a', '?', ''):
+        return None
+    if text == 'NaN':
+        return float('nan')
+    if _NUMBER.match(text):
+        return float(text) if '.' in text or 'e' in text.lower() else int(text)
+    if text.endswith('%') and _NUMBER.match(text[:-1]):
+        return float(text[:-1]) / 100
+    match = _WITH_UNIT.match(text)
+    if match:
+        unit = match.group(2).lower()
+        if unit == 'ms':
+            return float(match.group(1))
+        if unit in SIZE_UNITS:
+            return float(match.group(1)) * SIZE_UNITS[unit]
+    return text
+
+
+def _table_rows(lines, header):
+    """
+    Yields a dict of field name -> value for each row under `header`, until
+    a blank line. The first column is a name that may contain spaces, so
+    rows are split from the right.
+    """
+    fields = header_fields(header)
+    for line in lines:
+        if not line.strip():
+            break
+        parts = line.split()
+        split = len(parts) - len(fields) + 1
+        yield dict(zip(fields, [' '.join(parts[:split])] + [parse_value(v) for v in parts[split:]]))
+
+
+def _record(record_type, values):
+    return record_type(**dict((field, values.get(field)) for field in record_type._fields))
+
+
+def parse_gcstats(output):
+    """ Parses `nodetool gcstats` into GcStats. """
+    lines = [line for line in output.splitlines() if line.strip()]
+    fields = header_fields(lines[0])
+    return _record(GcStats, dict(zip(fields, [parse_value(v) for v in lines[1].split()])))
+
+
+def parse_tablestats(output):
+    """
+    Parses `nodetool cfstats` or `nodetool tablestats` into a dict of
+    (keyspace, table) -> TableStats.
+    """
+    tables = {}
+    current = None
+    for line in output.splitlines():
+        label, separator, value = line.strip().partition(':')
+        if not separator:
+            continue
+        name = field_name(label)
+        if name == 'keyspace':
+            current = tables[(value.strip(), None)] = TableStats(value.strip(), None, {})
+        elif name in ('table', 'table_index') and current is not None:
+            current = tables[(current.keyspace, value.strip())] = TableStats(current.keyspace, value.strip(), {})
+        elif current is not None:
+            current.stats[name] = parse_value(value)
+    return tables
+
+
+def parse_compactionstats(output):
+    """ Parses `nodetool compactionstats` into CompactionStats. """
+    pending, pending_by_table, tasks, remaining = None, {}, [], None
+    lines = iter(output.splitlines())
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('pending tasks:'):
+            pending = int(stripped.split(':')[1])
+        elif stripped.startswith('- ') and ':' in stripped:
+            table, count = stripped[2:].rsplit(':', 1)
+            pending_by_table[tuple(table.strip().split('.', 1))] = int(count)
+        elif stripped.startswith('Active compaction remaining time'):
+            remaining = stripped.split(':', 1)[1].strip()
+        elif 'compaction type' in stripped:
+            fields = header_fields(line)
+            for row in lines:
+                parts = row.split()
+                if not parts or row.strip().startswith('Active compaction remaining time'):
+                    if parts:
+                        remaining = row.split(':', 1)[1].strip()
+                    break
+                # every column but the compaction type is a single word
+                right = len(fields) - fields.index('compaction_type') - 1
+                left = parts[:len(parts) - right]
+                values = dict(zip(fields[-right:], parts[-right:]))
+                if fields[0] == 'id':
+                    values['id'] = left.pop(0)
+                values['compaction_type'] = ' '.join(left)
+                for field in ('completed', 'total', 'progress'):
+                    values[field] = parse_value(values[field])
+                tasks.append(_record(CompactionTask, values))
+    return CompactionStats(pending, pending_by_table, tasks, remaining)
+
+
+def parse_netstats(output):
+    """ Parses `nodetool netstats` into NetStats. """
+    mode, streams, read_repair, pools = None, [], {}, {}
+    section = 'streams'
+    lines = iter(output.splitlines())
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith('Mode:'):
+            mode = stripped.split(':', 1)[1].strip()
+        elif stripped.startswith('Read Repair Statistics'):
+            section = 'read_repair'
+        elif stripped.startswith('Pool Name'):
+            for row in _table_rows(lines, line):
+                pools[row['name']] = _record(MessagePool, row)
+        elif section == 'read_repair' and ':' in stripped:
+            label, value = stripped.split(':', 1)
+            read_repair[field_name(label)] = parse_value(value)
+        elif section == 'streams' and stripped:
+            streams.append(stripped)
+    return NetStats(mode, streams, read_repair, pools)
+
+
+def parse_tpstats(output):
+    """ Parses `nodetool tpstats` into TpStats. """
+    pools, dropped = {}, {}
+    lines = iter(output.splitlines())
+    for line in lines:
+        if line.startswith('Pool Name'):
+            for row in _table_rows(lines, line):
+                pools[row['name']] = _record(ThreadPool, row)
+        elif line.startswith('Message type'):
+            for row in _table_rows(lines, line):
+                dropped[row['name']] = row['dropped']
+    return TpStats(pools, dropped)
+
+
+def parse_status(output):
+    """ Parses `nodetool status` into a list of EndpointStatus, in output order. """
+    result = []
+    datacenter = None
+    for line in output.splitlines():
+        if line.startswith('Datacenter:'):
+            datacenter = line.split(':', 1)[1].strip()
+            continue
+        match = _STATUS_LINE.match(line.strip())
+        if match:
+            status, state, address, load, tokens, owns, host_id, rack = match.groups()
+            result.append(EndpointStatus(address=address, datacenter=datacenter, rack=rack.strip(),
+                                         status=status, state=state, load=parse_size(load),
+                                         tokens=int(tokens), owns=parse_value(owns), host_id=host_id))
+    return result
+
+
+def parse_ring(output):
+    """ Parses `nodetool ring` into a list of RingEntry, in output order. """
+    result = []
+    datacenter = None
+    for line in output.splitlines():
+        if line.startswith('Datacenter:'):
+            datacenter = line.split(':', 1)[1].strip()
+            continue
+        parts = line.split()
+        if len(parts) < 7 or parts[2] not in ('Up', 'Down', '?'):
+            continue
+        address, rack, status, state = parts[:4]
+        result.append(RingEntry(datacenter, address, rack, status, state,
+                                parse_size(' '.join(parts[4:-2])), parse_value(parts[-2]), parts[-1]))
+    return result
+
+
+def parse_sstablemetadata(output):
+    """ Parses the output of sstablemetadata for one sstable into SSTableMetadata. """
+    path, fields, drop_times, histogram = None, {}, {}, []
+    section = None
+    for line in output.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        label, separator, value = stripped.partition(':')
+        if section == 'tombstone_drop_times' and separator and _NUMBER.match(label.strip()):
+            drop_times[int(label)] = int(value)
+        elif section == 'histogram' and all(_NUMBER.match(part) for part in stripped.split()):
+            histogram.append(tuple(int(part) for part in stripped.split()))
+        elif stripped.startswith('Count') and not separator:
+            section = 'histogram'
+        elif separator:
+            name = field_name(label)
+            if name == 'sstable':
+                path = value.strip()
+            elif name == 'estimated_tombstone_drop_times' and not value.strip():
+                section = 'tombstone_drop_times'
+            else:
+                section = None
+                fields[name] = parse_value(value)
+    return SSTableMetadata(path, fields, drop_times, histogram)
+
+
+def _stress_value(text):
+    # '11289 [WRITE:11289]', '4.4 ms [WRITE: 4.4 ms]', '11,289 op/s' or '00:01:05'
+    text = text.split('[')[0].strip().replace(',', '')
+    if re.match(r'^\d+:\d\d:\d\d$', text):
+        hours, minutes, seconds = text.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    value = text.split()[0] if text else ''
+    return parse_value(value) if _NUMBER.match(value) or value == 'NaN' else None
+
+
+def parse_stress(output):
+    """
+    Parses the output of cassandra-stress into StressSummary, from the
+    'Results:' section of the stress tool of 2.1 and later, or from the
+    per-interval lines of the legacy stress tool (`-o insert`), which are
+    summed up as the overall rate and the operation-weighted mean latencies.
+    Returns None if the output holds neither.
+    """
+    lines = output.splitlines()
+    if 'Results:' in (line.strip() for line in lines):
+        values = {}
+        for line in lines[[line.strip() for line in lines].index('Results:') + 1:]:
+            label, separator, value = line.partition(':')
+            name = STRESS_FIELDS.get(field_name(label))
+            if separator and name is not None:
+                values[name] = _stress_value(value)
+        return _record(StressSummary, values)
+
+    header, rows = None, []
+    for line in lines:
+        if line.startswith('total,interval_op_rate'):
+            header = [field_name(column) for column in line.split(',')]
+        elif header is not None and re.match(r'^\d+(,[-\d.]+)+$', line.strip()):
+            rows.append(dict(zip(header, [float(v) for v in line.strip().split(',')])))
+    if not rows:
+        return None
+    total, elapsed = rows[-1]['total'], rows[-1]['elapsed_time']
+    values = {'op_rate': total / elapsed if elapsed else None,
+              'partition_rate': total / elapsed if elapsed else None,
+              'total_partitions': int(total),
+              'total_time_sec': elapsed}
+    previous = 0
+    weights = []
+    for row in rows:
+        weights.append(row['total'] - previous)
+        previous = row['total']
+    for column in header:
+        name = STRESS_FIELDS.get(column)
+        if name is not None and name.startswith('latency') and sum(weights):
+            values[name] = sum(row[column] * weight for row, weight in zip(rows, weights)) / sum(weights)
+    return _record(StressSummary, values)
@@ -0,0 +1,323 @@
+import math
+from unittest import TestCase
+
+from tooloutput import (parse_compactionstats, parse_gcstats, parse_netstats,
+                        parse_ring, parse_sstablemetadata, parse_status,
+                        parse_stress, parse_tablestats, parse_tpstats)
+
+GCSTATS_21 = """\
+       Interval (ms) Max GC Elapsed (ms)Total GC Elapsed (ms)Stdev GC Elapsed (ms)   GC Reclaimed (MB)         Collections
+               48915                  29                  94                   6            91750344                   6
+
+"""
+
+GCSTATS_30 = """\
+       Interval (ms) Max GC Elapsed (ms)Total GC Elapsed (ms)Stdev GC Elapsed (ms)   GC Reclaimed (MB)         Collections      Direct Memory Bytes
+                 913                 NaN                   0                 NaN                   0                   0                  1048576
+
+"""
+
+CFSTATS_20 = """\
+Keyspace: ks
+\tRead Count: 0
+\tRead Latency: NaN ms.
+\tWrite Count: 100
+\tWrite Latency: 0.023 ms.
+\tPending Tasks: 0
+\t\tColumn Family: cf
+\t\tSSTable count: 2
+\t\tSpace used (live), bytes: 10240
+\t\tSpace used (total), bytes: 10240
+\t\tNumber of keys (estimate): 256
+\t\tCompacted row minimum size: 30
+\t\tCompacted row maximum size: 42
+\t\tCompacted row mean size: 42
+----------------
+"""
+
+TABLESTATS_30 = """\
+Total number of tables: 31
+----------------
+Keyspace : ks
+\tRead Count: 10
+\tRead Latency: 0.5 ms.
+\tWrite Count: 100
+\tWrite Latency: 0.023 ms.
+\tPending Flushes: 0
+\t\tTable: cf
+\t\tSSTable count: 2
+\t\tSpace used (live): 10240
+\t\tSpace used (total): 10240
+\t\tSSTable Compression Ratio: 0.0
+\t\tNumber of partitions (estimate): 256
+\t\tLocal read latency: NaN ms
+\t\tCompacted partition minimum bytes: 30
+\t\tCompacted partition maximum bytes: 42
+\t\tPercent repaired: 0.0
+\t\tTable (index): cf.cf_v_idx
+\t\tSSTable count: 1
+\t\tSpace used (live): 512
+----------------
+"""
+
+COMPACTIONSTATS_21 = """\
+pending tasks: 3
+   compaction type   keyspace       table   completed       total    unit   progress
+        Compaction         ks          cf     1048576     4194304   bytes     25.00%
+        Validation         ks       other         512        1024   bytes     50.00%
+Active compaction remaining time :   0h00m03s
+"""
+
+COMPACTIONSTATS_30 = """\
+pending tasks: 2
+- ks.cf: 2
+
+                                     id                    compaction type   keyspace   table   completed     total    unit   progress
+   8a1c6a40-5b4e-11e5-9ef1-b7a3a2f3e2a1   Anticompaction after repair         ks      cf      100          400   bytes     25.00%
+Active compaction remaining time :        n/a
+"""
+
+NETSTATS_21 = """\
+Mode: NORMAL
+Not sending any streams.
+Read Repair Statistics:
+Attempted: 4
+Mismatch (Blocking): 1
+Mismatch (Background): 0
+Pool Name                    Active   Pending      Completed
+Commands                        n/a         0             27
+Responses                       n/a         0             42
+"""
+
+NETSTATS_30 = """\
+Mode: JOINING
+Bootstrap 5ea4a5e0-5b4f-11e5-9ef1-b7a3a2f3e2a1
+    /127.0.0.1
+        Receiving 3 files, 3145728 bytes total. Already received 1 files, 1048576 bytes total
+Read Repair Statistics:
+Attempted: 0
+Mismatch (Blocking): 0
+Mismatch (Background): 0
+Pool Name                    Active   Pending      Completed   Dropped
+Large messages                  n/a         0              0         0
+Small messages                  n/a         2            125         1
+Gossip messages                 n/a         0             48         0
+"""
+
+TPSTATS_21 = """\
+Pool Name                    Active   Pending      Completed   Blocked  All time blocked
+CounterMutationStage              0         0              0         0                 0
+ReadStage                         1         3             10         0                 0
+MutationStage                     0         0            100         0                 0
+MemtableFlushWriter               0         0              2         0                 0
+
+Message type           Dropped
+READ                         0
+MUTATION                     7
+"""
+
+STATUS_21 = """\
+Datacenter: dc1
+===============
+Status=Up/Down
+|/ State=Normal/Leaving/Joining/Moving
+--  Address    Load       Tokens  Owns (effective)  Host ID                               Rack
+UN  127.0.0.1  47.66 KB   256     66.7%             3e2e7c4b-49d2-4a5c-a8b3-ee2d3d2b7c0a  rack1
+DN  127.0.0.2  1.5 MB     256     33.3%             9a4a2c8f-1f43-4e54-8e5a-2b3e1d5e4c7b  rack1
+Datacenter: dc2
+===============
+Status=Up/Down
+|/ State=Normal/Leaving/Joining/Moving
+--  Address    Load       Tokens  Owns    Host ID                               Rack
+UJ  127.0.0.3  ?          1       ?       0c4a9d44-1b52-4bb1-9c8e-36e2e4a8f1d3  r2
+"""
+
+RING_21 = """\
+
+Datacenter: datacenter1
+==========
+Address    Rack        Status State   Load            Owns                Token
+                                                                          3074457345618258602
+127.0.0.1  rack1       Up     Normal  47.66 KB        33.33%              -9223372036854775808
+127.0.0.2  rack1       Down   Normal  1.5 MB          33.33%              -3074457345618258603
+127.0.0.3  rack1       Up     Leaving ?               ?                   3074457345618258602
+"""
+
+SSTABLEMETADATA_21 = """\
+SSTable: /tmp/dtest/test/node1/data/ks/cf-1/ks-cf-ka-1
+Partitioner: org.apache.cassandra.dht.Murmur3Partitioner
+Bloom Filter FP chance: 0.010000
+Minimum timestamp: 1442230186282000
+Maximum timestamp: 1442230186284000
+SSTable max local deletion time: 2147483647
+Compression ratio: -1.0
+Estimated droppable tombstones: 0.0
+SSTable Level: 2
+Repaired at: 0
+ReplayPosition(segmentId=1442230183432, position=298)
+Estimated tombstone drop times:
+1442230300:         5
+2147483647:         2
+Count               Row Size        Cell Count
+1                          0                 0
+2                          0                 3
+"""
+
+STRESS_21 = """\
+type,      total ops,    op/s,    pk/s,   row/s,    mean,     med,     .95,     .99,    .999,     max,   time,   stderr, errors,  gc: #,  max ms,  sum ms,  sdv ms,      mb
+total,         50000,   11289,   11289,   11289,     4.4,     2.4,    13.4,    29.0,    64.0,   207.2,    4.4,  0.00000,      0,      0,       0,       0,       0,       0
+END
+
+Results:
+op rate                   : 11289 [WRITE:11289]
+partition rate            : 11289 [WRITE:11289]
+row rate                  : 11289 [WRITE:11289]
+latency mean              : 4.4 [WRITE:4.4]
+latency median            : 2.4 [WRITE:2.4]
+latency 95th percentile   : 13.4 [WRITE:13.4]
+latency 99th percentile   : 29.0 [WRITE:29.0]
+latency 99.9th percentile : 64.0 [WRITE:64.0]
+latency max               : 207.2 [WRITE:207.2]
+Total partitions          : 50000 [WRITE:50000]
+Total errors              : 0 [WRITE:0]
+total gc count            : 2
+total gc mb               : 512
+total gc time (s)         : 0
+avg gc time(ms)           : 35
+stdev gc time(ms)         : 5
+Total operation time      : 00:01:05
+"""
+
+STRESS_3X = """\
+Results:
+Op rate                   :   11,289 op/s  [WRITE: 11,289 op/s]
+Partition rate            :   11,289 pk/s  [WRITE: 11,289 pk/s]
+Row rate                  :   11,289 row/s [WRITE: 11,289 row/s]
+Latency mean              :    4.4 ms [WRITE: 4.4 ms]
+Latency median            :    2.4 ms [WRITE: 2.4 ms]
+Latency 95th percentile   :   13.4 ms [WRITE: 13.4 ms]
+Latency 99th percentile   :   29.0 ms [WRITE: 29.0 ms]
+Latency 99.9th percentile :   64.0 ms [WRITE: 64.0 ms]
+Latency max               :  207.2 ms [WRITE: 207.2 ms]
+Total partitions          :     50,000 [WRITE: 50,000]
+Total errors              :          0 [WRITE: 0]
+Total GC count            : 2
+Total GC time             :    0.1 seconds
+Avg GC time               :   35.0 ms
+Total operation time      : 00:01:05
+"""
+
+STRESS_LEGACY = """\
+Created keyspaces. Sleeping 1s for propagation.
+total,interval_op_rate,interval_key_rate,latency,95th,99.9th,elapsed_time
+10000,1000,1000,2.0,10.0,40.0,10
+40000,3000,3000,4.0,20.0,60.0,20
+END
+"""
+
+
+class TestToolOutputParsers(TestCase):
+    """
+    Checks the tooloutput parsers against captured output of several
+    Cassandra versions.
+    """
+
+    def gcstats_test(self):
+        stats = parse_gcstats(GCSTATS_21)
+        self.assertEqual((48915, 29, 94, 6, 91750344, 6, None), tuple(stats))
+        stats = parse_gcstats(GCSTATS_30)
+        self.assertTrue(math.isnan(stats.max_ms))
+        self.assertEqual(1048576, stats.direct_memory_bytes)
+
+    def tablestats_test(self):
+        for output in (CFSTATS_20, TABLESTATS_30):
+            tables = parse_tablestats(output)
+            cf = tables[('ks', 'cf')].stats
+            self.assertEqual(2, cf['sstable_count'])
+            self.assertEqual(10240, cf['space_used_live'])
+            self.assertEqual(256, cf['number_of_partitions_estimate'])
+            self.assertEqual(42, cf['compacted_partition_maximum_bytes'])
+            self.assertEqual(100, tables[('ks', None)].stats['write_count'])
+            self.assertEqual(0.023, tables[('ks', None)].stats['write_latency'])
+        tables = parse_tablestats(TABLESTATS_30)
+        self.assertTrue(math.isnan(tables[('ks', 'cf')].stats['local_read_latency']))
+        self.assertEqual(512, tables[('ks', 'cf.cf_v_idx')].stats['space_used_live'])
+
+    def compactionstats_test(self):
+        stats = parse_compactionstats(COMPACTIONSTATS_21)
+        self.assertEqual(3, stats.pending)
+        self.assertEqual(['Compaction', 'Validation'], [t.compaction_type for t in stats.tasks])
+        self.assertEqual(('ks', 'cf', 1048576, 4194304, 'bytes', 0.25), tuple(stats.tasks[0])[2:])
+        self.assertEqual('0h00m03s', stats.remaining_time)
+
+        stats = parse_compactionstats(COMPACTIONSTATS_30)
+        self.assertEqual({('ks', 'cf'): 2}, stats.pending_by_table)
+        [task] = stats.tasks
+        self.assertEqual('8a1c6a40-5b4e-11e5-9ef1-b7a3a2f3e2a1', task.id)
+        self.assertEqual('Anticompaction after repair', task.compaction_type)
+        self.assertEqual(('ks', 'cf', 100, 400), (task.keyspace, task.table, task.completed, task.total))
+        self.assertEqual('n/a', stats.remaining_time)
+
+        self.assertEqual((0, {}, [], None), tuple(parse_compactionstats("pending tasks: 0\n")))
+
+    def netstats_test(self):
+        stats = parse_netstats(NETSTATS_21)
+        self.assertEqual('NORMAL', stats.mode)
+        self.assertEqual({'attempted': 4, 'mismatch_blocking': 1, 'mismatch_background': 0}, stats.read_repair)
+        self.assertEqual(('Responses', None, 0, 42, None), tuple(stats.pools['Responses']))
+
+        stats = parse_netstats(NETSTATS_30)
+        self.assertEqual('JOINING', stats.mode)
+        self.assertEqual(3, len(stats.streams))
+        self.assertEqual(('Small messages', None, 2, 125, 1), tuple(stats.pools['Small messages']))
+
+    def tpstats_test(self):
+        stats = parse_tpstats(TPSTATS_21)
+        self.assertEqual(4, len(stats.pools))
+        self.assertEqual(('ReadStage', 1, 3, 10, 0, 0), tuple(stats.pools['ReadStage']))
+        self.assertEqual({'READ': 0, 'MUTATION': 7}, stats.dropped)
+
+    def status_test(self):
+        statuses = parse_status(STATUS_21)
+        self.assertEqual(['127.0.0.1', '127.0.0.2', '127.0.0.3'], [s.address for s in statuses])
+        first, second, joining = statuses
+        self.assertEqual(('dc1', 'rack1', 'U', 'N', 47.66 * 1024, 256, 0.667),
+                         (first.datacenter, first.rack, first.status, first.state, first.load, first.tokens, first.owns))
+        self.assertEqual(('D', 1.5 * 1024 * 1024), (second.status, second.load))
+        self.assertEqual(('dc2', 'r2', 'J', None, None), (joining.datacenter, joining.rack, joining.state, joining.load, joining.owns))
+
+    def ring_test(self):
+        ring = parse_ring(RING_21)
+        self.assertEqual(3, len(ring))
+        self.assertEqual(('datacenter1', '127.0.0.1', 'rack1', 'Up', 'Normal', 47.66 * 1024, 0.3333, '-9223372036854775808'),
+                         tuple(ring[0]))
+        self.assertEqual(('Leaving', None, None), (ring[2].state, ring[2].load, ring[2].owns))
+
+    def sstablemetadata_test(self):
+        metadata = parse_sstablemetadata(SSTABLEMETADATA_21)
+        self.assertEqual('/tmp/dtest/test/node1/data/ks/cf-1/ks-cf-ka-1', metadata.path)
+        self.assertEqual(2, metadata.fields['sstable_level'])
+        self.assertEqual(0, metadata.fields['repaired_at'])
+        self.assertEqual(0.01, metadata.fields['bloom_filter_fp_chance'])
+        self.assertEqual({1442230300: 5, 2147483647: 2}, metadata.tombstone_drop_times)
+        self.assertEqual([(1, 0, 0), (2, 0, 3)], metadata.histogram)
+
+    def stress_test(self):
+        for output in (STRESS_21, STRESS_3X):
+            summary = parse_stress(output)
+            self.assertEqual((11289, 11289, 11289), (summary.op_rate, summary.partition_rate, summary.row_rate))
+            self.assertEqual((4.4, 2.4, 13.4, 29.0, 64.0, 207.2),
+                             (summary.latency_mean_ms, summary.latency_median_ms, summary.latency_p95_ms,
+                              summary.latency_p99_ms, summary.latency_p999_ms, summary.latency_max_ms))
+            self.assertEqual((50000, 0, 2, 65), (summary.total_partitions, summary.total_errors,
+                                                 summary.gc_count, summary.total_time_sec))
+        self.assertEqual(512, parse_stress(STRESS_21).gc_mb)
+        self.assertEqual(0.1, parse_stress(STRESS_3X).gc_time_sec)
+
+        summary = parse_stress(STRESS_LEGACY)
+        self.assertEqual((2000, 40000, 20), (summary.op_rate, summary.total_partitions, summary.total_time_sec))
+        # interval latencies weighted by the 10000 and 30000 operations of each interval
+        self.assertEqual((3.5, 17.5, 55.0), (summary.latency_median_ms, summary.latency_p95_ms, summary.latency_p999_ms))
+        self.assertEqual(None, summary.latency_p99_ms)
+
+        self.assertEqual(None, parse_stress("Connection refused\n"))
@@ -5,6 +5,7 @@ import subprocess
 import sys
 import time
 import unittest
+from datetime import datetime
 from distutils.version import LooseVersion
 from threading import Thread
 
@@ -13,7 +14,7 @@ from cassandra.query import SimpleStatement
 from nose.plugins.attrib import attr
 
 from ccmlib.node import Node
-from dtest import CASSANDRA_DIR, DISABLE_VNODES, IGNORE_REQUIRE, debug
+from dtest import CASSANDRA_DIR, DISABLE_VNODES, IGNORE_REQUIRE, RUN_BENCHMARKS, debug
 
 
 def rows_to_list(rows):
@@ -158,6 +159,30 @@ def range_putget(cluster, session, cl=ConsistencyLevel.QUORUM):
         _validate_row(cluster, res)
 
 
+_LOG_TIME = re.compile(r'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3})')
+
+
+def log_time(line):
+    """ Returns the time of a line of the Cassandra log as a datetime. """
+    return datetime.strptime(_LOG_TIME.search(line).group(1), '%Y-%m-%d %H:%M:%S,%f')
+
+
+def grep_log_since(node, expr, mark):
+    """
+    Returns the (line, match) of each line of the node log matching the
+    regular expression `expr` after `mark`, a position from node.mark_log().
+    """
+    pattern = re.compile(expr)
+    matches = []
+    with open(node.logfilename()) as f:
+        f.seek(mark)
+        for line in f:
+            match = pattern.search(line)
+            if match:
+                matches.append((line, match))
+    return matches
+
+
 def replace_in_file(filepath, search_replacements):
     """In-place file search and replace.
 
@@ -285,6 +310,20 @@ def require(require_pattern, broken_in=None):
             return tag_and_skip
 
 
+def benchmark(decorated):
+    """Tags the decorated test or class with the nose attribute 'benchmark',
+    and skips it unless the environment variable RUN_BENCHMARKS is set to
+    'yes' or 'true'. Benchmarks are long, and their numbers only mean
+    something on a quiet machine, so they are run on their own:
+
+        RUN_BENCHMARKS=true nosetests -a benchmark
+
+    Their reports are written to BENCHMARK_DIR, see benchreport.
+    """
+    decorated = attr('benchmark')(decorated)
+    return unittest.skipUnless(RUN_BENCHMARKS, 'benchmarks only run with RUN_BENCHMARKS=true')(decorated)
+
+
 def cassandra_git_branch():
     '''Get the name of the git branch at CASSANDRA_DIR.
     '''
@@ -327,3 +366,30 @@ class KillOnBootstrap(Thread):
     def run(self):
         self.node.watch_log_for("JOINING: Starting to bootstrap")
         self.node.stop(gently=False)
+
+
+class InBackground(Thread):
+    """
+    Calls `func` with `args` in a daemon thread, started right away.
+    result() waits for the call and returns its value, or raises its error.
+    """
+    def __init__(self, func, *args):
+        Thread.__init__(self)
+        self.daemon = True
+        self.func = func
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
@@ -10,8 +10,10 @@ import uuid
 from collections import defaultdict
 from distutils.version import LooseVersion
 from dtest import Tester, debug, DEFAULT_DIR
+from expected_state import TableModel
+from loadgen import LoadGenerator
 from tools import new_node
-from cassandra import ConsistencyLevel, WriteTimeout
+from cassandra import ConsistencyLevel
 from cassandra.query import SimpleStatement
 
 
@@ -194,7 +196,7 @@ class TestUpgradeThroughVersions(Tester):
 
     def upgrade_scenario(self, populate=True, create_schema=True, mixed_version=False, after_upgrade_call=()):
         # Record the rows we write as we go:
-        self.row_values = set()
+        self.row_values = TableModel()
         cluster = self.cluster
 
         if populate:
@@ -334,16 +336,17 @@ class TestUpgradeThroughVersions(Tester):
     def _write_values(self, num=100):
         session = self.patient_cql_connection(self.node2, protocol_version=1)
         session.execute("use upgrade")
-        for i in xrange(num):
-            x = len(self.row_values) + 1
+        first = self.row_values.live_count() + 1
+        written = range(first, first + num)
+        for x in written:
             session.execute("UPDATE cf SET v='%d' WHERE k=%d" % (x, x))
-            self.row_values.add(x)
+        self.row_values.write(written, values=written)
 
     def _check_values(self, consistency_level=ConsistencyLevel.ALL):
         for node in self.cluster.nodelist():
             session = self.patient_cql_connection(node, protocol_version=1)
             session.execute("use upgrade")
-            for x in self.row_values:
+            for x, _, _ in self.row_values.live_cells():
                 query = SimpleStatement("SELECT k,v FROM cf WHERE k=%d" % x, consistency_level=consistency_level)
                 result = session.execute(query)
                 k,v = result[0]
@@ -355,56 +358,54 @@ class TestUpgradeThroughVersions(Tester):
         session = self.patient_cql_connection(self.node2, protocol_version=1)
         session.execute("use upgrade;")
 
-        update_counter_query = ("UPDATE countertable SET c = c + 1 WHERE k1='{key1}' and k2={key2}")
+        update_counter_query = SimpleStatement("UPDATE countertable SET c = c + 1 WHERE k1=%s and k2=%s",
+                                               consistency_level=ConsistencyLevel.ALL)
 
-        self.expected_counts = {}
-        for i in range(10):
-            self.expected_counts[uuid.uuid4()] = defaultdict(int)
+        # counters are modeled as 10 partitions of 10 cells, indexed by k1's
+        # position in counter_keys and by k2
+        self.counter_keys = [uuid.uuid4() for i in range(10)]
+        self.expected_counts = TableModel(partitions=10, clusterings=11)
+        key_indexes = dict((str(key), index) for index, key in enumerate(self.counter_keys))
 
-        fail_count = 0
+        def increment(i):
+            return (str(random.choice(self.counter_keys)), random.randint(1, 10))
 
-        for i in range(opcount):
-            key1 = random.choice(self.expected_counts.keys())
-            key2 = random.randint(1, 10)
-            try:
-                query = SimpleStatement(update_counter_query.format(key1=key1, key2=key2), consistency_level=ConsistencyLevel.ALL)
-                session.execute(query)
-            except WriteTimeout:
-                fail_count += 1
-            else:
-                self.expected_counts[key1][key2] += 1
-            if fail_count > 100:
-                break
+        def incremented(params, rows):
+            key1, key2 = params
+            self.expected_counts.increment([key_indexes[key1]], [key2])
+
+        load = LoadGenerator(session, concurrency=50, max_errors=101)
+        load.add('increment', update_counter_query, increment, callback=incremented)
+        result = load.run(count=opcount)
+        debug(result.report())
 
-        assert fail_count < 100, "Too many counter increment failures"
+        assert set(result.error_samples) <= set(['WriteTimeout']), "Unexpected counter increment failures: {}".format(result.error_samples)
+        assert result.errors < 100, "Too many counter increment failures"
 
     def _check_counters(self):
         debug("Checking counter values...")
         session = self.patient_cql_connection(self.node2, protocol_version=1)
         session.execute("use upgrade;")
 
-        for key1 in self.expected_counts.keys():
-            for key2 in self.expected_counts[key1].keys():
-                expected_value = self.expected_counts[key1][key2]
-
-                query = SimpleStatement("SELECT c from countertable where k1='{key1}' and k2={key2};".format(key1=key1, key2=key2),
-                    consistency_level=ConsistencyLevel.ONE)
-                results = session.execute(query)
+        rows = []
+        for key1_index, key2, _ in self.expected_counts.live_cells():
+            key1 = self.counter_keys[key1_index]
 
-                if results is not None:
-                    actual_value = results[0][0]
-                else:
-                    # counter wasn't found
-                    actual_value = None
+            query = SimpleStatement("SELECT c from countertable where k1='{key1}' and k2={key2};".format(key1=key1, key2=key2),
+                                    consistency_level=ConsistencyLevel.ONE)
+            results = session.execute(query)
+            # a counter that wasn't found reads as None
+            rows.append((key1_index, key2, results[0][0] if results else None))
 
-                assert actual_value == expected_value, "Counter not at expected value. Got %s, expected %s" % (actual_value, expected_value)
+        mismatches = self.expected_counts.verify(rows)
+        assert not mismatches, "Counters not at expected values: %s" % (mismatches,)
 
     def _check_select_count(self, consistency_level=ConsistencyLevel.ALL):
         debug("Checking SELECT COUNT(*)")
         session = self.patient_cql_connection(self.node2, protocol_version=1)
         session.execute("use upgrade;")
 
-        expected_num_rows = len(self.row_values)
+        expected_num_rows = self.row_values.live_count()
 
         countquery = SimpleStatement("SELECT COUNT(*) FROM cf;", consistency_level=consistency_level)
         result = session.execute(countquery)